@@ -18,7 +18,7 @@ __email__ = "developer@example.com"
 from .config import config
 from .data_provider import BinanceDataProvider, DataStorage, get_bitcoin_data
 from .strategy import MACDStrategy
-from .backtest import BacktestRunner, run_simple_backtest, optimize_macd_strategy
+from .backtest import BacktestRunner, run_simple_backtest, optimize_macd_strategy, compare_strategies, compare_strategies_batch
 from .alpaca_trader import AlpacaTrader, TradingBot
 
 # 导出的公共接口
@@ -38,6 +38,8 @@ __all__ = [
     'BacktestRunner',
     'run_simple_backtest',
     'optimize_macd_strategy',
+    'compare_strategies',
+    'compare_strategies_batch',
     
     # 交易
     'AlpacaTrader',
@@ -4,80 +4,762 @@ Alpaca Trading Module
 """
 
 import alpaca_trade_api as tradeapi
-from datetime import datetime, timedelta
+from alpaca_trade_api.rest import APIError
+from datetime import datetime
 import pandas as pd
 from typing import Optional, Dict, List
+import asyncio
+import json
+import re
+import threading
 import time
 import sys
+from collections import deque
 from pathlib import Path
 
+import numpy as np
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp为可选依赖，仅AsyncAlpacaTrader需要
+    aiohttp = None
+
+try:
+    import websockets
+except ImportError:  # websockets为可选依赖，仅TradeUpdateStream需要
+    websockets = None
+
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from simple_trading_system.config import config
+from simple_trading_system.strategy import StreamingMACD
 
 
-class AlpacaTrader:
-    """Alpaca交易客户端"""
+def _field(obj, name: str):
+    """读取REST实体对象的属性或JSON字典的键"""
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _account_dict(account) -> Dict:
+    """账户信息转换为字典"""
+    return {
+        'account_id': _field(account, 'id'),
+        'status': _field(account, 'status'),
+        'equity': float(_field(account, 'equity')),
+        'buying_power': float(_field(account, 'buying_power')),
+        'cash': float(_field(account, 'cash')),
+        'portfolio_value': float(_field(account, 'portfolio_value')),
+        'day_trade_count': _field(account, 'daytrade_count'),
+        'pattern_day_trader': _field(account, 'pattern_day_trader')
+    }
+
+
+def _position_dict(position) -> Dict:
+    """持仓信息转换为字典"""
+    return {
+        'symbol': _field(position, 'symbol'),
+        'qty': float(_field(position, 'qty')),
+        'market_value': float(_field(position, 'market_value')),
+        'cost_basis': float(_field(position, 'cost_basis')),
+        'unrealized_pl': float(_field(position, 'unrealized_pl')),
+        'unrealized_plpc': float(_field(position, 'unrealized_plpc')),
+        'current_price': float(_field(position, 'current_price')),
+        'avg_entry_price': float(_field(position, 'avg_entry_price'))
+    }
+
+
+def _order_dict(order, detail: bool = False) -> Dict:
+    """
+    订单信息转换为字典
+    
+    Args:
+        order: REST订单实体或JSON字典
+        detail: 是否包含成交时间、限价和止损价（订单列表使用）
+    """
+    result = {
+        'order_id': _field(order, 'id'),
+        'symbol': _field(order, 'symbol'),
+        'qty': float(_field(order, 'qty') or 0),
+        'side': _field(order, 'side'),
+        'order_type': _field(order, 'order_type'),
+        'status': _field(order, 'status'),
+        'submitted_at': _field(order, 'submitted_at'),
+        'filled_qty': float(_field(order, 'filled_qty') or 0),
+        'filled_avg_price': float(_field(order, 'filled_avg_price') or 0)
+    }
+    if detail:
+        result.update({
+            'filled_at': _field(order, 'filled_at'),
+            'limit_price': float(_field(order, 'limit_price') or 0),
+            'stop_price': float(_field(order, 'stop_price') or 0)
+        })
+    return result
+
+
+def _order_params(symbol: str, qty: Optional[float], side: str, order_type: str, time_in_force: str,
+                  limit_price: Optional[float], stop_price: Optional[float],
+                  notional: Optional[float]) -> Dict:
+    """构建下单参数"""
+    order_params = {
+        'symbol': symbol,
+        'side': side,
+        'type': order_type,
+        'time_in_force': time_in_force
+    }
+    
+    if notional is not None:
+        order_params['notional'] = notional
+    else:
+        order_params['qty'] = qty
+    
+    if limit_price:
+        order_params['limit_price'] = limit_price
+    
+    if stop_price:
+        order_params['stop_price'] = stop_price
+    
+    return order_params
+
+
+# K线周期对应的秒数
+TIMEFRAME_SECONDS = {
+    '1Min': 60,
+    '5Min': 300,
+    '15Min': 900,
+    '1Hour': 3600,
+    '1Day': 86400
+}
+
+# 不再变化的订单状态
+TERMINAL_ORDER_STATUSES = frozenset({'filled', 'canceled', 'expired', 'rejected', 'replaced'})
+
+
+def _api_root(base_url: str) -> str:
+    """去掉交易API地址末尾的版本号（客户端会自行拼接/v2）"""
+    base_url = base_url.rstrip('/')
+    if base_url.endswith('/v2'):
+        base_url = base_url[:-3]
+    return base_url
+
+
+class _Flight:
+    """一次进行中的快照请求"""
     
     def __init__(self):
-        """初始化Alpaca交易客户端"""
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SnapshotCache:
+    """
+    带TTL的快照缓存（线程安全）
+    
+    每个键的快照在TTL内直接返回内存中的值；过期或失效后同一时刻只有一个线程发起请求，
+    其他并发读取者等待并复用这次请求的结果。请求进行中被invalidate时，结果不会写入缓存，
+    之后的读取者会发起新的请求，保证不会读到失效前的数据。
+    """
+    
+    def __init__(self, ttls: Dict[str, float], clock=time.monotonic):
+        """
+        初始化缓存
+        
+        Args:
+            ttls: 每个键的有效期（秒），0为不缓存
+            clock: 单调时钟
+        """
+        self.ttls = dict(ttls)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._values = {}
+        self._inflight = {}
+        self._generation = {}
+        self.stats = {'hits': 0, 'fetches': 0, 'shared': 0}
+    
+    def get(self, key: str, fetch, max_age: Optional[float] = None):
+        """
+        读取快照，过期时调用fetch获取
+        
+        Args:
+            key: 快照名称
+            fetch: 无参数的获取函数
+            max_age: 本次读取可接受的最大缓存时间（秒），默认为该键的TTL，0为强制刷新
+            
+        Returns:
+            快照（调用方不应修改）
+        """
+        max_age = self.ttls.get(key, 0) if max_age is None else max_age
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and self.clock() - cached[0] < max_age:
+                self.stats['hits'] += 1
+                return cached[1]
+            
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation.get(key, 0)
+                self.stats['fetches'] += 1
+            else:
+                self.stats['shared'] += 1
+        
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        
+        try:
+            flight.value = fetch()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None and self._generation.get(key, 0) == generation:
+                    self._values[key] = (self.clock(), flight.value)
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.event.set()
+        return flight.value
+    
+    def invalidate(self, *keys: str):
+        """
+        使快照失效，不指定键时全部失效
+        
+        Args:
+            keys: 快照名称
+        """
+        with self._lock:
+            for key in keys or list(self.ttls):
+                self._values.pop(key, None)
+                self._inflight.pop(key, None)
+                self._generation[key] = self._generation.get(key, 0) + 1
+
+
+class TradeUpdateStream:
+    """
+    Alpaca交易更新(trade_updates)推送消费者
+    
+    在后台线程的事件循环中保持WebSocket连接，按推送事件维护内存中的订单簿(orders)
+    和持仓账本(positions)，成交在收到推送时即反映到账本中，无需再轮询REST接口。
+    
+    断线后按指数退避重连；每次连接订阅成功后先通过REST对账（持仓、挂单、
+    最后一个事件之后提交的已完成订单，以及账本中已不再挂单的订单），再处理推送。
+    成交事件携带的持仓数量是绝对值，按execution_id去重，因此对账前后重复收到的
+    事件不会重复计入。
+    """
+    
+    def __init__(self,
+                 trader: 'AlpacaTrader',
+                 url: Optional[str] = None,
+                 reconnect_delay: float = 1.0,
+                 max_reconnect_delay: float = 30.0):
+        """
+        初始化推送消费者
+        
+        Args:
+            trader: 用于认证和对账的AlpacaTrader
+            url: WebSocket地址，默认由交易API地址推导（wss://.../stream）
+            reconnect_delay: 首次重连等待（秒）
+            max_reconnect_delay: 最大重连等待（秒）
+        """
+        if websockets is None:
+            raise ImportError("使用TradeUpdateStream需要安装websockets: pip install websockets")
+        
+        self.trader = trader
+        self.url = url or re.sub(r'^http', 'ws', trader.base_url) + '/stream'
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        
+        self.orders: Dict[str, Dict] = {}
+        self.positions: Dict[str, float] = {}
+        self.last_event_time = None
+        self.listeners = []
+        self.stats = {'connections': 0, 'events': 0, 'duplicates': 0, 'reconciles': 0}
+        
+        self._seen = set()
+        self._seen_order = deque(maxlen=10000)
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._loop = None
+        self._ws = None
+    
+    @property
+    def synced(self) -> bool:
+        """连接正常且已完成对账，账本可直接使用"""
+        return self._synced.is_set()
+    
+    def start(self, timeout: float = 10.0) -> bool:
+        """
+        在后台线程中启动推送消费
+        
+        Args:
+            timeout: 等待首次对账完成的时间（秒）
+            
+        Returns:
+            是否已完成首次对账
+        """
+        self._stopping = False
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()),
+                                        name='trade-updates', daemon=True)
+        self._thread.start()
+        return self._synced.wait(timeout)
+    
+    def stop(self, timeout: float = 5.0):
+        """停止推送消费并关闭连接"""
+        self._stopping = True
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    async def _close(self):
+        if self._ws is not None:
+            await self._ws.close()
+    
+    async def _run(self):
+        """连接、订阅、对账、消费，断线后重连"""
+        self._loop = asyncio.get_running_loop()
+        failures = 0
+        
+        while not self._stopping:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self._ws = ws
+                    if self._stopping:
+                        break
+                    self.stats['connections'] += 1
+                    await self._subscribe(ws)
+                    await self._loop.run_in_executor(None, self._reconcile)
+                    self._synced.set()
+                    failures = 0
+                    
+                    async for message in ws:
+                        self._handle(message)
+                    if not self._stopping:
+                        print("交易推送连接被关闭")
+            except PermissionError as e:
+                print(f"交易推送认证失败: {e}")
+                break
+            except Exception as e:
+                if not self._stopping:
+                    print(f"交易推送连接断开: {e}")
+            finally:
+                self._synced.clear()
+                self._ws = None
+            
+            if self._stopping:
+                break
+            delay = min(self.reconnect_delay * 2 ** failures, self.max_reconnect_delay)
+            failures += 1
+            print(f"{delay:.1f}秒后重连交易推送")
+            await asyncio.sleep(delay)
+    
+    async def _subscribe(self, ws):
+        """认证并订阅trade_updates"""
+        await ws.send(json.dumps({
+            'action': 'authenticate',
+            'data': {'key_id': self.trader.api_key, 'secret_key': self.trader.secret_key}
+        }))
+        reply = json.loads(await ws.recv())
+        if reply.get('data', {}).get('status') != 'authorized':
+            raise PermissionError(reply.get('data', {}).get('error', reply))
+        
+        await ws.send(json.dumps({'action': 'listen', 'data': {'streams': ['trade_updates']}}))
+        reply = json.loads(await ws.recv())
+        if 'trade_updates' not in reply.get('data', {}).get('streams', []):
+            raise ConnectionError(f"订阅trade_updates失败: {reply}")
+    
+    def _reconcile(self):
+        """
+        用REST快照重建账本，补上断线期间的变化
+        
+        未完成订单以REST挂单列表为准。已完成订单列表按提交时间过滤，查不到
+        更早提交、在断线期间成交或撤销的挂单，因此账本中原先未完成、现在已不在
+        挂单列表中的订单按id查询最终状态。
+        """
+        positions = self.trader.get_positions(max_age=0)
+        open_orders = self.trader.get_open_orders(max_age=0)
+        closed = self.trader.get_orders(status='closed', limit=500, after=self.last_event_time)
+        
+        known = {order['order_id'] for order in open_orders + closed}
+        with self._lock:
+            stale = [order_id for order_id, order in self.orders.items()
+                     if order['status'] not in TERMINAL_ORDER_STATUSES and order_id not in known]
+        resolved, missing = [], []
+        for order_id in stale:
+            try:
+                resolved.append(self.trader.get_order(order_id))
+            except Exception:
+                missing.append(order_id)
+        
+        with self._lock:
+            self.positions = {position['symbol']: position['qty'] for position in positions}
+            for order in closed + resolved + open_orders:
+                self.orders[order['order_id']] = order
+            # 查询不到的订单不再视为挂单
+            for order_id in missing:
+                self.orders.pop(order_id, None)
+        
+        for order in resolved:
+            self.trader._on_trade_update(order, order['filled_qty'] > 0)
+        
+        self.stats['reconciles'] += 1
+        print(f"交易推送已对账: {len(self.positions)} 个持仓, {len(open_orders)} 个挂单")
+    
+    def _handle(self, message):
+        """处理一条推送消息"""
+        if isinstance(message, bytes):
+            message = message.decode()
+        message = json.loads(message)
+        if message.get('stream') == 'trade_updates':
+            self._apply(message['data'])
+    
+    def _apply(self, update: Dict):
+        """把一个交易更新事件应用到订单簿和持仓账本"""
+        event = update.get('event')
+        order = _order_dict(update['order'], detail=True)
+        execution_id = update.get('execution_id')
+        
+        with self._lock:
+            if execution_id:
+                if execution_id in self._seen:
+                    self.stats['duplicates'] += 1
+                    return
+                if len(self._seen_order) == self._seen_order.maxlen:
+                    self._seen.discard(self._seen_order[0])
+                self._seen_order.append(execution_id)
+                self._seen.add(execution_id)
+            
+            self.orders[order['order_id']] = order
+            filled = event in ('fill', 'partial_fill')
+            if filled:
+                symbol = order['symbol']
+                if update.get('position_qty') is not None:
+                    self.positions[symbol] = float(update['position_qty'])
+                else:
+                    qty = float(update.get('qty') or 0)
+                    self.positions[symbol] = self.positions.get(symbol, 0.0) + (qty if order['side'] == 'buy' else -qty)
+            self.last_event_time = update.get('timestamp') or self.last_event_time
+            self.stats['events'] += 1
+        
+        self.trader._on_trade_update(order, filled)
+        if filled:
+            # 成交改变可用资金，在后台刷新账户快照，下一个信号直接读内存
+            self._loop.run_in_executor(None, self._refresh_account)
+        
+        for listener in self.listeners:
+            listener(event, order, update)
+    
+    def _refresh_account(self):
+        try:
+            self.trader.get_account_info(max_age=0)
+        except Exception:
+            pass
+    
+    def position_qty(self, symbol: str) -> float:
+        """账本中的持仓数量"""
+        with self._lock:
+            return self.positions.get(symbol, 0.0)
+    
+    def open_orders(self) -> List[Dict]:
+        """订单簿中的未完成订单"""
+        with self._lock:
+            return [order for order in self.orders.values() if order['status'] not in TERMINAL_ORDER_STATUSES]
+
+
+class BarRingBuffer:
+    """
+    定长K线环形缓冲区
+    
+    每根K线同时写入位置 i 和 i + capacity（镜像存储），最近任意n根K线在内存中总是连续的，
+    view()直接在缓冲区切片上构造DataFrame，不复制数据。
+    """
+    
+    COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+    
+    def __init__(self, capacity: int):
+        """
+        初始化缓冲区
+        
+        Args:
+            capacity: 最多保留的K线数量
+        """
+        self.capacity = capacity
+        self.values = np.empty((2 * capacity, len(self.COLUMNS)))
+        self.times = np.empty(2 * capacity, dtype='datetime64[ns]')
+        self.size = 0
+        self.end = 0  # 下一根K线的写入位置
+        self.window = 0  # 最近一次完整下载的K线数量
+        self.lock = threading.Lock()
+        self.stats = {'full_fetches': 0, 'incremental_fetches': 0, 'bars_fetched': 0, 'last_fetch_bars': 0}
+    
+    @property
+    def last_time(self) -> Optional[pd.Timestamp]:
+        """最后一根K线的时间"""
+        if not self.size:
+            return None
+        return pd.Timestamp(self.times[self.end - 1 + self.capacity], tz='UTC')
+    
+    def clear(self):
+        """清空缓冲区"""
+        self.size = 0
+        self.end = 0
+    
+    def append(self, bars: pd.DataFrame) -> int:
+        """
+        追加K线
+        
+        与最后一根K线时间相同的数据覆盖最后一根（刷新尚未收盘的K线），更早的数据被忽略。
+        
+        Args:
+            bars: 按时间升序的K线DataFrame
+            
+        Returns:
+            追加的K线数量
+        """
+        index = bars.index if bars.index.tz is not None else bars.index.tz_localize('UTC')
+        if self.size:
+            last_time = self.last_time
+            current = index == last_time
+            if current.any():
+                row = bars[self.COLUMNS].to_numpy(dtype=np.float64)[current][-1]
+                position = (self.end - 1) % self.capacity
+                self.values[position] = row
+                self.values[position + self.capacity] = row
+            keep = index > last_time
+            bars, index = bars[keep], index[keep]
+        
+        values = bars[self.COLUMNS].to_numpy(dtype=np.float64)[-self.capacity:]
+        times = index.tz_convert('UTC').tz_localize(None).values[-self.capacity:]
+        n = len(values)
+        if n:
+            positions = (self.end + np.arange(n)) % self.capacity
+            self.values[positions] = values
+            self.values[positions + self.capacity] = values
+            self.times[positions] = times
+            self.times[positions + self.capacity] = times
+            self.end = (self.end + n) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+        return len(bars)
+    
+    def view(self, n: int) -> pd.DataFrame:
+        """
+        最近n根K线的DataFrame（缓冲区视图，之后的追加可能覆盖其内容，需要保留时请copy()）
+        
+        Args:
+            n: K线数量
+        """
+        n = min(n, self.size)
+        stop = self.end + self.capacity
+        return pd.DataFrame(self.values[stop - n:stop],
+                            index=pd.DatetimeIndex(self.times[stop - n:stop]).tz_localize('UTC'),
+                            columns=self.COLUMNS, copy=False)
+
+
+def _standard_bars(bars: pd.DataFrame) -> pd.DataFrame:
+    """按列名重命名以匹配标准格式（多标的请求返回的symbol列会被丢弃）"""
+    bars = bars.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'})
+    return bars[['Open', 'High', 'Low', 'Close', 'Volume']]
+
+
+def _empty_bars() -> pd.DataFrame:
+    """没有K线时返回的空DataFrame"""
+    return pd.DataFrame(columns=BarRingBuffer.COLUMNS, index=pd.DatetimeIndex([], tz='UTC'), dtype=float)
+
+
+def closed_bars(bars: pd.DataFrame, timeframe: str, now=None) -> pd.DataFrame:
+    """
+    去掉尚未收盘的K线
+    
+    行情接口返回的最后一根K线可能仍在形成中（开盘时间加一个周期晚于当前时间），
+    其OHLC之后还会变化，不能用于预热指标。
+    
+    Args:
+        bars: 以开盘时间为索引的K线
+        timeframe: '1Min', '5Min', '15Min', '1Hour', '1Day'
+        now: 当前时间，默认为当前UTC时间
+        
+    Returns:
+        只包含已收盘K线的DataFrame
+    """
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+    if bars.index.tz is None:
+        now = now.tz_convert('UTC').tz_localize(None) if now.tzinfo is not None else now
+    elif now.tzinfo is None:
+        now = now.tz_localize('UTC')
+    close_times = bars.index + pd.Timedelta(seconds=TIMEFRAME_SECONDS.get(timeframe, 86400))
+    return bars[close_times <= now]
+
+
+def _buy_qty(buying_power: float, price: Optional[float]) -> int:
+    """计算买入数量（使用可用资金的90%）"""
+    available_cash = buying_power * 0.9
+    
+    if price:
+        return int(available_cash / price)
+    # 使用市价单，数量基于可用资金
+    return int(available_cash / 100)  # 假设股价约100美元
+
+
+class AlpacaTrader:
+    """
+    Alpaca交易客户端
+    
+    账户、持仓和挂单通过SnapshotCache按TTL缓存：提交或取消订单时全部失效；
+    有未完成订单时，读取账户或持仓前先刷新挂单快照，发现订单离开挂单列表（成交或取消）
+    即使账户和持仓失效。
+    """
+    
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 secret_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 account_ttl: Optional[float] = None,
+                 positions_ttl: Optional[float] = None,
+                 orders_ttl: Optional[float] = None,
+                 bar_buffer_size: int = 1000):
+        """
+        初始化Alpaca交易客户端
+        
+        Args:
+            api_key: API密钥，默认读取配置
+            secret_key: API私钥，默认读取配置
+            base_url: 交易API地址，默认读取配置
+            account_ttl: 账户快照有效期（秒），默认读取配置
+            positions_ttl: 持仓快照有效期（秒），默认读取配置
+            orders_ttl: 挂单快照有效期（秒），默认读取配置
+            bar_buffer_size: 每个(标的, 周期)缓存的K线数量
+        """
+        self.snapshots = SnapshotCache({
+            'account': config.ALPACA_ACCOUNT_TTL if account_ttl is None else account_ttl,
+            'positions': config.ALPACA_POSITIONS_TTL if positions_ttl is None else positions_ttl,
+            'orders': config.ALPACA_ORDERS_TTL if orders_ttl is None else orders_ttl
+        })
+        # 已提交但尚未确认完成的订单ID
+        self._pending_orders = set()
+        self._pending_lock = threading.Lock()
+        
+        # 交易推送，由start_trade_stream启动
+        self.stream = None
+        
+        # 每个(标的, 周期)的K线环形缓冲区
+        self.bar_buffer_size = bar_buffer_size
+        self.bar_buffers: Dict[tuple, BarRingBuffer] = {}
+        self._bar_buffers_lock = threading.Lock()
+        
+        self.api_key = api_key or config.ALPACA_API_KEY
+        self.secret_key = secret_key or config.ALPACA_SECRET_KEY
+        self.base_url = _api_root(base_url or config.ALPACA_BASE_URL)
+        
         try:
             self.api = tradeapi.REST(
-                config.ALPACA_API_KEY,
-                config.ALPACA_SECRET_KEY,
-                config.ALPACA_BASE_URL,
+                self.api_key,
+                self.secret_key,
+                self.base_url,
                 api_version='v2'
             )
             
-            # 验证连接
-            account = self.api.get_account()
+            # 验证连接（同时写入账户快照）
+            account = self.get_account_info(max_age=0)
             print(f"Alpaca账户连接成功")
-            print(f"账户状态: {account.status}")
-            print(f"可用资金: ${float(account.buying_power):,.2f}")
+            print(f"账户状态: {account['status']}")
+            print(f"可用资金: ${account['buying_power']:,.2f}")
             
         except Exception as e:
             print(f"Alpaca API初始化失败: {e}")
             raise
     
-    def get_account_info(self) -> Dict:
-        """获取账户信息"""
+    def _streaming(self) -> bool:
+        """交易推送是否可用（已连接并完成对账）"""
+        return self.stream is not None and self.stream.synced
+    
+    def _check_pending_orders(self):
+        """有未完成订单且没有交易推送时刷新挂单快照，以便发现成交"""
+        if self._pending_orders and not self._streaming():
+            self.get_open_orders()
+    
+    def _on_trade_update(self, order: Dict, filled: bool):
+        """交易推送事件：更新未完成订单集合并使相关快照失效"""
+        if order['status'] in TERMINAL_ORDER_STATUSES:
+            with self._pending_lock:
+                self._pending_orders.discard(order['order_id'])
+        keys = ('orders', 'account', 'positions') if filled else ('orders',)
+        self.snapshots.invalidate(*keys)
+    
+    def start_trade_stream(self, url: Optional[str] = None, timeout: float = 10.0) -> TradeUpdateStream:
+        """
+        启动交易推送，之后持仓和挂单查询直接读取推送维护的账本
+        
+        Args:
+            url: WebSocket地址，默认由交易API地址推导
+            timeout: 等待首次对账完成的时间（秒）
+            
+        Returns:
+            TradeUpdateStream实例
+        """
+        if self.stream is None:
+            self.stream = TradeUpdateStream(self, url)
+            if not self.stream.start(timeout):
+                print("交易推送尚未就绪，暂时使用REST查询")
+        return self.stream
+    
+    def stop_trade_stream(self):
+        """停止交易推送"""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+    
+    def get_position_qty(self, symbol: str) -> float:
+        """
+        获取单个标的的持仓数量，交易推送可用时直接读取账本
+        
+        Args:
+            symbol: 交易标的
+        """
+        if self._streaming():
+            return self.stream.position_qty(symbol)
+        for position in self.get_positions():
+            if position['symbol'] == symbol:
+                return position['qty']
+        return 0.0
+    
+    def get_account_info(self, max_age: Optional[float] = None) -> Dict:
+        """
+        获取账户信息
+        
+        Args:
+            max_age: 可接受的最大缓存时间（秒），默认为账户快照TTL，0为强制刷新
+        """
         try:
-            account = self.api.get_account()
-            return {
-                'account_id': account.id,
-                'status': account.status,
-                'equity': float(account.equity),
-                'buying_power': float(account.buying_power),
-                'cash': float(account.cash),
-                'portfolio_value': float(account.portfolio_value),
-                'day_trade_count': account.daytrade_count,
-                'pattern_day_trader': account.pattern_day_trader
-            }
+            self._check_pending_orders()
+            return self.snapshots.get('account', lambda: _account_dict(self.api.get_account()), max_age)
         except Exception as e:
             print(f"获取账户信息失败: {e}")
             raise
     
-    def get_positions(self) -> List[Dict]:
-        """获取当前持仓"""
+    def get_positions(self, max_age: Optional[float] = None) -> List[Dict]:
+        """
+        获取当前持仓
+        
+        Args:
+            max_age: 可接受的最大缓存时间（秒），默认为持仓快照TTL，0为强制刷新
+        """
         try:
-            positions = self.api.list_positions()
-            result = []
-            
-            for position in positions:
-                result.append({
-                    'symbol': position.symbol,
-                    'qty': float(position.qty),
-                    'market_value': float(position.market_value),
-                    'cost_basis': float(position.cost_basis),
-                    'unrealized_pl': float(position.unrealized_pl),
-                    'unrealized_plpc': float(position.unrealized_plpc),
-                    'current_price': float(position.current_price),
-                    'avg_entry_price': float(position.avg_entry_price)
-                })
-            
-            return result
+            self._check_pending_orders()
+            return self.snapshots.get(
+                'positions',
+                lambda: [_position_dict(position) for position in self.api.list_positions()],
+                max_age
+            )
             
         except Exception as e:
             print(f"获取持仓信息失败: {e}")
@@ -90,54 +772,43 @@ class AlpacaTrader:
                    order_type: str = 'market',
                    time_in_force: str = 'gtc',
                    limit_price: Optional[float] = None,
-                   stop_price: Optional[float] = None) -> Dict:
+                   stop_price: Optional[float] = None,
+                   notional: Optional[float] = None) -> Dict:
         """
         下单
         
         Args:
             symbol: 股票代码
-            qty: 数量
+            qty: 数量，按金额下单时为None
             side: 'buy' 或 'sell'
             order_type: 'market', 'limit', 'stop', 'stop_limit'
             time_in_force: 'day', 'gtc', 'ioc', 'fok'
             limit_price: 限价单价格
             stop_price: 止损单价格
+            notional: 下单金额（仅市价单，与qty二选一）
             
         Returns:
             订单信息字典
         """
         try:
             # 构建订单参数
-            order_params = {
-                'symbol': symbol,
-                'qty': qty,
-                'side': side,
-                'type': order_type,
-                'time_in_force': time_in_force
-            }
-            
-            if limit_price:
-                order_params['limit_price'] = limit_price
-            
-            if stop_price:
-                order_params['stop_price'] = stop_price
+            order_params = _order_params(symbol, qty, side, order_type, time_in_force,
+                                         limit_price, stop_price, notional)
             
             # 提交订单
-            order = self.api.submit_order(**order_params)
+            try:
+                order = self.api.submit_order(**order_params)
+            finally:
+                self.snapshots.invalidate()
             
-            print(f"订单提交成功: {side.upper()} {qty} {symbol} @ {order_type}")
+            if _field(order, 'status') not in TERMINAL_ORDER_STATUSES:
+                with self._pending_lock:
+                    self._pending_orders.add(_field(order, 'id'))
             
-            return {
-                'order_id': order.id,
-                'symbol': order.symbol,
-                'qty': float(order.qty),
-                'side': order.side,
-                'order_type': order.order_type,
-                'status': order.status,
-                'submitted_at': order.submitted_at,
-                'filled_qty': float(order.filled_qty or 0),
-                'filled_avg_price': float(order.filled_avg_price or 0)
-            }
+            amount = f"${notional}" if notional is not None else qty
+            print(f"订单提交成功: {side.upper()} {amount} {symbol} @ {order_type}")
+            
+            return _order_dict(order)
             
         except Exception as e:
             print(f"下单失败: {e}")
@@ -151,6 +822,10 @@ class AlpacaTrader:
         """市价卖出"""
         return self.place_order(symbol, qty, 'sell', 'market')
     
+    def buy_notional(self, symbol: str, notional: float) -> Dict:
+        """按金额市价买入（支持碎股的标的）"""
+        return self.place_order(symbol, None, 'buy', 'market', notional=round(notional, 2))
+    
     def buy_limit(self, symbol: str, qty: float, limit_price: float) -> Dict:
         """限价买入"""
         return self.place_order(symbol, qty, 'buy', 'limit', limit_price=limit_price)
@@ -159,43 +834,81 @@ class AlpacaTrader:
         """限价卖出"""
         return self.place_order(symbol, qty, 'sell', 'limit', limit_price=limit_price)
     
-    def get_orders(self, status: str = 'all', limit: int = 50) -> List[Dict]:
+    def get_orders(self, status: str = 'all', limit: int = 50, after: Optional[str] = None) -> List[Dict]:
         """
         获取订单列表
         
         Args:
             status: 'open', 'closed', 'all'
             limit: 返回订单数量限制
+            after: 只返回该时间之后的订单
             
         Returns:
             订单列表
         """
         try:
-            orders = self.api.list_orders(status=status, limit=limit)
-            result = []
-            
-            for order in orders:
-                result.append({
-                    'order_id': order.id,
-                    'symbol': order.symbol,
-                    'qty': float(order.qty),
-                    'side': order.side,
-                    'order_type': order.order_type,
-                    'status': order.status,
-                    'submitted_at': order.submitted_at,
-                    'filled_at': order.filled_at,
-                    'filled_qty': float(order.filled_qty or 0),
-                    'filled_avg_price': float(order.filled_avg_price or 0),
-                    'limit_price': float(order.limit_price or 0),
-                    'stop_price': float(order.stop_price or 0)
-                })
-            
-            return result
+            orders = self.api.list_orders(status=status, limit=limit, after=after)
+            return [_order_dict(order, detail=True) for order in orders]
             
         except Exception as e:
             print(f"获取订单列表失败: {e}")
             raise
     
+    def get_order(self, order_id: str) -> Dict:
+        """
+        按id获取单个订单
+        
+        Args:
+            order_id: 订单ID
+            
+        Returns:
+            订单信息
+        """
+        try:
+            return _order_dict(self.api.get_order(order_id), detail=True)
+            
+        except Exception as e:
+            print(f"获取订单失败: {e}")
+            raise
+    
+    def get_open_orders(self, max_age: Optional[float] = None) -> List[Dict]:
+        """
+        获取未完成订单（带缓存）
+        
+        刷新时，之前提交但已不在挂单列表中的订单视为已完成，账户和持仓快照随之失效。
+        交易推送可用时直接返回订单簿中的未完成订单。
+        
+        Args:
+            max_age: 可接受的最大缓存时间（秒），默认为挂单快照TTL，0为强制刷新
+            
+        Returns:
+            订单列表
+        """
+        def fetch():
+            orders = [_order_dict(order, detail=True) for order in self.api.list_orders(status='open')]
+            open_ids = {order['order_id'] for order in orders}
+            with self._pending_lock:
+                done = self._pending_orders - open_ids
+                self._pending_orders -= done
+            if done:
+                self.snapshots.invalidate('account', 'positions')
+            return orders
+        
+        if self._streaming() and max_age != 0:
+            return self.stream.open_orders()
+        
+        try:
+            return self.snapshots.get('orders', fetch, max_age)
+        except Exception as e:
+            print(f"获取挂单失败: {e}")
+            raise
+    
+    def refresh_snapshots(self):
+        """强制刷新账户、持仓和挂单快照（例如在K线收盘前预热）"""
+        self.get_open_orders(max_age=0)
+        self.get_account_info(max_age=0)
+        self.get_positions(max_age=0)
+    
     def cancel_order(self, order_id: str) -> bool:
         """取消订单"""
         try:
@@ -205,6 +918,8 @@ class AlpacaTrader:
         except Exception as e:
             print(f"取消订单失败: {e}")
             return False
+        finally:
+            self.snapshots.invalidate()
     
     def cancel_all_orders(self) -> bool:
         """取消所有未成交订单"""
@@ -215,6 +930,8 @@ class AlpacaTrader:
         except Exception as e:
             print(f"取消所有订单失败: {e}")
             return False
+        finally:
+            self.snapshots.invalidate()
     
     def get_portfolio_history(self, period: str = '1M') -> Dict:
         """
@@ -246,6 +963,11 @@ class AlpacaTrader:
         """
         获取市场数据
         
+        每个(标的, 周期)的K线保存在环形缓冲区中：首次调用或limit超过上次完整下载的数量时下载完整窗口，
+        之后从缓存中最后一根K线开始请求：这根K线可能在上次请求时尚未收盘，用返回的最新值覆盖，
+        再追加之后的新K线。返回的DataFrame是缓冲区的视图，之后的更新可能覆盖其内容，
+        需要长期保留时请copy()。
+        
         Args:
             symbol: 股票代码
             timeframe: '1Min', '5Min', '15Min', '1Hour', '1Day'
@@ -255,66 +977,443 @@ class AlpacaTrader:
             价格数据DataFrame
         """
         try:
-            # 计算开始时间
-            end_time = datetime.now()
-            if timeframe == '1Min':
-                start_time = end_time - timedelta(minutes=limit)
-            elif timeframe == '5Min':
-                start_time = end_time - timedelta(minutes=limit * 5)
-            elif timeframe == '15Min':
-                start_time = end_time - timedelta(minutes=limit * 15)
-            elif timeframe == '1Hour':
-                start_time = end_time - timedelta(hours=limit)
-            else:  # 1Day
-                start_time = end_time - timedelta(days=limit)
-            
-            # 获取数据
+            key = (symbol, timeframe)
+            with self._bar_buffers_lock:
+                buffer = self.bar_buffers.get(key)
+                if buffer is None or buffer.capacity < limit:
+                    buffer = self.bar_buffers[key] = BarRingBuffer(max(limit, self.bar_buffer_size))
+            
+            with buffer.lock:
+                if limit > buffer.window or not buffer.size:
+                    bars = self._get_bar_window(symbol, timeframe, limit)
+                    buffer.clear()
+                    buffer.window = limit
+                    buffer.stats['full_fetches'] += 1
+                else:
+                    bars = self.get_bars_after(symbol, timeframe, buffer.last_time, inclusive=True)
+                    buffer.stats['incremental_fetches'] += 1
+                
+                buffer.stats['bars_fetched'] += len(bars)
+                buffer.stats['last_fetch_bars'] = buffer.append(bars)
+                return buffer.view(limit)
+            
+        except Exception as e:
+            print(f"获取市场数据失败: {e}")
+            raise
+    
+    def _get_bar_window(self, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
+        """下载最近limit个周期的K线"""
+        end_time = pd.Timestamp.now(tz='UTC')
+        start_time = end_time - pd.Timedelta(seconds=TIMEFRAME_SECONDS.get(timeframe, 86400) * limit)
+        
+        bars = self.api.get_bars(
+            symbol,
+            timeframe,
+            start=start_time.isoformat(),
+            end=end_time.isoformat(),
+            limit=limit
+        ).df
+        
+        if bars.empty:
+            return _empty_bars()
+        return _standard_bars(bars)
+    
+    def get_bars_after(self, symbol: str, timeframe: str, after, inclusive: bool = False) -> pd.DataFrame:
+        """
+        只获取after之后开盘的K线（实盘调度每次只请求新收盘的K线）
+        
+        Args:
+            symbol: 股票代码
+            timeframe: '1Min', '5Min', '15Min', '1Hour', '1Day'
+            after: 已处理的最后一根K线时间
+            inclusive: 为True时同时返回开盘时间等于after的K线（用于刷新尚未收盘的K线）
+            
+        Returns:
+            价格数据DataFrame，可能为空
+        """
+        try:
+            after = pd.Timestamp(after)
+            if after.tzinfo is None:
+                after = after.tz_localize('UTC')
+            start = after if inclusive else after + pd.Timedelta(seconds=1)
+            
             bars = self.api.get_bars(
                 symbol,
                 timeframe,
-                start=start_time.isoformat(),
-                end=end_time.isoformat(),
-                limit=limit
+                start=start.isoformat()
             ).df
             
-            # 重命名列以匹配标准格式
-            bars.columns = ['Open', 'High', 'Low', 'Close', 'Volume', 'TradeCount', 'VWAP']
-            bars = bars[['Open', 'High', 'Low', 'Close', 'Volume']]
+            if bars.empty:
+                return _empty_bars()
+            bars = _standard_bars(bars)
+            return bars[bars.index >= after] if inclusive else bars[bars.index > after]
+            
+        except Exception as e:
+            print(f"获取新K线失败: {e}")
+            raise
+    
+    def get_bars_after_multi(self, afters: Dict[str, object], timeframe: str) -> Dict[str, pd.DataFrame]:
+        """
+        用一次请求获取多个标的在各自after之后开盘的K线
+        
+        请求从所有标的中最早的after开始，返回后按标的拆分并各自过滤，
+        K线数量较多时由alpaca_trade_api自动翻页。落后很多的标的会让整个请求从更早的时间开始，
+        调用方应把它们与其他标的分开请求（见PortfolioBot）。
+        
+        Args:
+            afters: {标的: 已处理的最后一根K线时间}
+            timeframe: '1Min', '5Min', '15Min', '1Hour', '1Day'
             
-            return bars
+        Returns:
+            {标的: 价格数据DataFrame}，没有新K线的标的为空DataFrame
+        """
+        try:
+            afters = {symbol: pd.Timestamp(after) for symbol, after in afters.items()}
+            afters = {symbol: after if after.tzinfo is not None else after.tz_localize('UTC')
+                      for symbol, after in afters.items()}
+            start = min(afters.values()) + pd.Timedelta(seconds=1)
+            
+            bars = self.api.get_bars(list(afters), timeframe, start=start.isoformat()).df
+            
+            result = {symbol: _empty_bars() for symbol in afters}
+            if bars.empty:
+                return result
+            for symbol, group in bars.groupby('symbol', sort=False):
+                if symbol in afters:
+                    group = _standard_bars(group)
+                    result[symbol] = group[group.index > afters[symbol]]
+            return result
             
         except Exception as e:
-            print(f"获取市场数据失败: {e}")
+            print(f"批量获取新K线失败: {e}")
             raise
 
 
-class TradingBot:
-    """自动交易机器人"""
+class AsyncAlpacaTrader:
+    """
+    基于asyncio的Alpaca交易客户端
+    
+    所有请求复用同一个aiohttp会话（保持长连接的连接池），互不依赖的查询可以并发执行，
+    返回的字典结构与AlpacaTrader相同。需要在协程中使用：
+    
+        async with AsyncAlpacaTrader() as trader:
+            account, positions = await trader.get_snapshot()
+    """
     
-    def __init__(self, symbol: str = "AAPL"):
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 secret_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 max_connections: int = 10,
+                 timeout: float = 10.0):
         """
-        初始化交易机器人
+        初始化异步交易客户端（连接在connect()时建立）
+        
+        Args:
+            api_key: API密钥，默认读取配置
+            secret_key: API私钥，默认读取配置
+            base_url: 交易API地址，默认读取配置
+            max_connections: 连接池最大连接数
+            timeout: 单次请求超时（秒）
+        """
+        if aiohttp is None:
+            raise ImportError("使用AsyncAlpacaTrader需要安装aiohttp: pip install aiohttp")
+        
+        self.base_url = _api_root(base_url or config.ALPACA_BASE_URL) + '/v2'
+        self.headers = {
+            'APCA-API-KEY-ID': api_key or config.ALPACA_API_KEY or '',
+            'APCA-API-SECRET-KEY': secret_key or config.ALPACA_SECRET_KEY or ''
+        }
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session = None
+    
+    async def connect(self):
+        """建立连接池并验证账户"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        
+        try:
+            account = await self.get_account_info()
+            print(f"Alpaca账户连接成功（异步）")
+            print(f"账户状态: {account['status']}")
+            print(f"可用资金: ${account['buying_power']:,.2f}")
+        except Exception as e:
+            print(f"Alpaca API初始化失败: {e}")
+            await self.close()
+            raise
+    
+    async def close(self):
+        """关闭连接池"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    async def __aenter__(self):
+        await self.connect()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def _request(self, method: str, path: str, params: Optional[Dict] = None,
+                       payload: Optional[Dict] = None):
+        """发送请求并解析JSON，错误响应抛出与同步客户端相同的APIError"""
+        if self.session is None:
+            raise RuntimeError("请先调用connect()或使用async with")
+        
+        async with self.session.request(method, self.base_url + path, params=params, json=payload) as response:
+            text = await response.text()
+            try:
+                body = json.loads(text) if text else None
+            except ValueError:
+                body = None
+            
+            if response.status >= 400:
+                message = body.get('message', text) if isinstance(body, dict) else text
+                code = body.get('code', response.status) if isinstance(body, dict) else response.status
+                raise APIError({'code': code, 'message': message or response.reason})
+            return body
+    
+    async def get_account_info(self) -> Dict:
+        """获取账户信息"""
+        try:
+            return _account_dict(await self._request('GET', '/account'))
+        except Exception as e:
+            print(f"获取账户信息失败: {e}")
+            raise
+    
+    async def get_positions(self) -> List[Dict]:
+        """获取当前持仓"""
+        try:
+            return [_position_dict(position) for position in await self._request('GET', '/positions')]
+        except Exception as e:
+            print(f"获取持仓信息失败: {e}")
+            raise
+    
+    async def get_snapshot(self) -> tuple:
+        """
+        并发获取账户信息和持仓，耗时为两次请求中较慢的一次
+        
+        Returns:
+            (账户信息字典, 持仓列表)
+        """
+        account, positions = await asyncio.gather(self.get_account_info(), self.get_positions())
+        return account, positions
+    
+    async def place_order(self,
+                          symbol: str,
+                          qty: float,
+                          side: str,
+                          order_type: str = 'market',
+                          time_in_force: str = 'gtc',
+                          limit_price: Optional[float] = None,
+                          stop_price: Optional[float] = None,
+                          notional: Optional[float] = None) -> Dict:
+        """下单，参数与AlpacaTrader.place_order相同"""
+        try:
+            order_params = _order_params(symbol, qty, side, order_type, time_in_force,
+                                         limit_price, stop_price, notional)
+            order = await self._request('POST', '/orders', payload=order_params)
+            
+            amount = f"${notional}" if notional is not None else qty
+            print(f"订单提交成功: {side.upper()} {amount} {symbol} @ {order_type}")
+            
+            return _order_dict(order)
+            
+        except Exception as e:
+            print(f"下单失败: {e}")
+            raise
+    
+    async def buy_market(self, symbol: str, qty: float) -> Dict:
+        """市价买入"""
+        return await self.place_order(symbol, qty, 'buy', 'market')
+    
+    async def sell_market(self, symbol: str, qty: float) -> Dict:
+        """市价卖出"""
+        return await self.place_order(symbol, qty, 'sell', 'market')
+    
+    async def buy_notional(self, symbol: str, notional: float) -> Dict:
+        """按金额市价买入（支持碎股的标的）"""
+        return await self.place_order(symbol, None, 'buy', 'market', notional=round(notional, 2))
+    
+    async def get_orders(self, status: str = 'all', limit: int = 50) -> List[Dict]:
+        """获取订单列表"""
+        try:
+            orders = await self._request('GET', '/orders', params={'status': status, 'limit': limit})
+            return [_order_dict(order, detail=True) for order in orders]
+        except Exception as e:
+            print(f"获取订单列表失败: {e}")
+            raise
+    
+    async def cancel_order(self, order_id: str) -> bool:
+        """取消订单"""
+        try:
+            await self._request('DELETE', f'/orders/{order_id}')
+            print(f"订单 {order_id} 已取消")
+            return True
+        except Exception as e:
+            print(f"取消订单失败: {e}")
+            return False
+    
+    async def cancel_all_orders(self) -> bool:
+        """取消所有未成交订单"""
+        try:
+            await self._request('DELETE', '/orders')
+            print("所有未成交订单已取消")
+            return True
+        except Exception as e:
+            print(f"取消所有订单失败: {e}")
+            return False
+
+
+class _BotBookkeeping:
+    """
+    交易机器人共用的持仓判断和交易记录
+    
+    子类负责行情驱动和下单调用（同步或异步），这里只保存状态并决定
+    信号对应的交易方向。
+    """
+    
+    def __init__(self, trader, symbol: str):
+        """
+        初始化交易状态
         
         Args:
+            trader: 交易客户端
             symbol: 交易标的
         """
-        self.trader = AlpacaTrader()
+        self.trader = trader
         self.symbol = symbol
         self.position = 0  # 当前持仓数量
         self.last_signal = None
         self.trade_history = []
+        
+        # 增量MACD，由attach_stream设置
+        self.stream = None
+    
+    def _position_in(self, positions: List[Dict]) -> float:
+        """从持仓列表中取出本标的的持仓数量"""
+        for pos in positions:
+            if pos['symbol'] == self.symbol:
+                return pos['qty']
+        return 0
+    
+    def _action_for(self, signal: int) -> Optional[str]:
+        """
+        根据信号和当前持仓决定交易方向
+        
+        Args:
+            signal: 1=买入, -1=卖出, 0=无操作
+            
+        Returns:
+            'BUY'、'SELL'，无需交易时为None
+        """
+        if signal == 1 and self.position <= 0:  # 买入信号且无多头持仓
+            return 'BUY'
+        if signal == -1 and self.position > 0:  # 卖出信号且有多头持仓
+            return 'SELL'
+        return None
+    
+    def _record_trade(self, action: str, qty: float, order: Dict, price: float = None):
+        """记录一笔已提交的订单"""
+        self.trade_history.append({
+            'timestamp': datetime.now(),
+            'action': action,
+            'symbol': self.symbol,
+            'qty': qty,
+            'order_id': order['order_id'],
+            'signal_price': price
+        })
+        print(f"执行{'买入' if action == 'BUY' else '卖出'}: {qty} 股 {self.symbol}")
+    
+    def get_trade_summary(self) -> Dict:
+        """获取交易摘要"""
+        if not self.trade_history:
+            return {'total_trades': 0}
+        
+        buy_trades = [t for t in self.trade_history if t['action'] == 'BUY']
+        sell_trades = [t for t in self.trade_history if t['action'] == 'SELL']
+        
+        return {
+            'total_trades': len(self.trade_history),
+            'buy_trades': len(buy_trades),
+            'sell_trades': len(sell_trades),
+            'current_position': self.position,
+            'last_signal': self.last_signal,
+            'trade_history': self.trade_history
+        }
+
+
+class TradingBot(_BotBookkeeping):
+    """自动交易机器人"""
+    
+    def __init__(self, symbol: str = "AAPL", trader: Optional[AlpacaTrader] = None):
+        """
+        初始化交易机器人
+        
+        Args:
+            symbol: 交易标的
+            trader: 共用的AlpacaTrader，默认新建
+        """
+        super().__init__(trader or AlpacaTrader(), symbol)
+        self._tick_signal_bar = None
+    
+    def attach_stream(self, stream: StreamingMACD):
+        """
+        绑定已预热的增量MACD，之后通过on_bar/on_tick驱动交易
+        
+        Args:
+            stream: StreamingMACD实例
+        """
+        self.stream = stream
+        self._tick_signal_bar = None
+    
+    def on_bar(self, close: float) -> int:
+        """
+        处理一根新收盘的K线：常数时间更新MACD，出现交叉时执行信号
+        
+        Args:
+            close: 收盘价
+            
+        Returns:
+            交叉信号
+        """
+        signal = self.stream.update(close)
+        
+        # 本根K线内已按逐笔成交执行过同向信号时不再重复下单
+        acted = self._tick_signal_bar == self.stream.bars - 1 and self.last_signal == signal
+        if signal != 0 and not acted:
+            self.execute_signal(signal, close)
+        
+        return signal
+    
+    def on_tick(self, price: float) -> int:
+        """
+        处理一笔最新成交：按当前K线以该价格收盘预判交叉，每根K线最多执行一次
+        
+        Args:
+            price: 最新成交价
+            
+        Returns:
+            预判的交叉信号
+        """
+        signal = self.stream.peek(price)
+        
+        if signal != 0 and self._tick_signal_bar != self.stream.bars:
+            self._tick_signal_bar = self.stream.bars
+            self.execute_signal(signal, price)
+        
+        return signal
     
     def update_position(self):
         """更新当前持仓"""
         try:
-            positions = self.trader.get_positions()
-            self.position = 0
-            
-            for pos in positions:
-                if pos['symbol'] == self.symbol:
-                    self.position = pos['qty']
-                    break
-                    
+            self.position = self.trader.get_position_qty(self.symbol)
         except Exception as e:
             print(f"更新持仓失败: {e}")
     
@@ -328,60 +1427,84 @@ class TradingBot:
         """
         try:
             self.update_position()
+            action = self._action_for(signal)
             
-            if signal == 1 and self.position <= 0:  # 买入信号且无多头持仓
-                # 计算买入数量（使用可用资金的90%）
+            if action == 'BUY':
                 account = self.trader.get_account_info()
-                available_cash = account['buying_power'] * 0.9
-                
-                if price:
-                    qty = int(available_cash / price)
-                else:
-                    # 使用市价单，数量基于可用资金
-                    qty = int(available_cash / 100)  # 假设股价约100美元
-                
+                qty = _buy_qty(account['buying_power'], price)
                 if qty > 0:
-                    order = self.trader.buy_market(self.symbol, qty)
-                    self.trade_history.append({
-                        'timestamp': datetime.now(),
-                        'action': 'BUY',
-                        'symbol': self.symbol,
-                        'qty': qty,
-                        'order_id': order['order_id'],
-                        'signal_price': price
-                    })
-                    print(f"执行买入: {qty} 股 {self.symbol}")
-            
-            elif signal == -1 and self.position > 0:  # 卖出信号且有多头持仓
-                order = self.trader.sell_market(self.symbol, abs(self.position))
-                self.trade_history.append({
-                    'timestamp': datetime.now(),
-                    'action': 'SELL',
-                    'symbol': self.symbol,
-                    'qty': abs(self.position),
-                    'order_id': order['order_id'],
-                    'signal_price': price
-                })
-                print(f"执行卖出: {abs(self.position)} 股 {self.symbol}")
+                    self._record_trade('BUY', qty, self.trader.buy_market(self.symbol, qty), price)
+            
+            elif action == 'SELL':
+                qty = abs(self.position)
+                self._record_trade('SELL', qty, self.trader.sell_market(self.symbol, qty), price)
             
             self.last_signal = signal
             
         except Exception as e:
             print(f"执行交易信号失败: {e}")
+
+
+class AsyncTradingBot(_BotBookkeeping):
+    """
+    基于AsyncAlpacaTrader的交易机器人
     
-    def get_trade_summary(self) -> Dict:
-        """获取交易摘要"""
-        if not self.trade_history:
-            return {'total_trades': 0}
+    下单规则与TradingBot相同；执行信号时并发查询持仓和账户，
+    信号到下单的延迟只有一次查询往返加一次下单往返。
+    """
+    
+    def __init__(self, trader: AsyncAlpacaTrader, symbol: str = "AAPL"):
+        """
+        初始化交易机器人
         
-        buy_trades = [t for t in self.trade_history if t['action'] == 'BUY']
-        sell_trades = [t for t in self.trade_history if t['action'] == 'SELL']
+        Args:
+            trader: 已连接的AsyncAlpacaTrader（可由多个机器人共用）
+            symbol: 交易标的
+        """
+        super().__init__(trader, symbol)
+    
+    def attach_stream(self, stream: StreamingMACD):
+        """绑定已预热的增量MACD，之后通过on_bar驱动交易"""
+        self.stream = stream
+    
+    async def on_bar(self, close: float) -> int:
+        """
+        处理一根新收盘的K线，出现交叉时执行信号
         
-        return {
-            'total_trades': len(self.trade_history),
-            'buy_trades': len(buy_trades),
-            'sell_trades': len(sell_trades),
-            'current_position': self.position,
-            'last_signal': self.last_signal,
-            'trade_history': self.trade_history
-        }
\ No newline at end of file
+        Args:
+            close: 收盘价
+            
+        Returns:
+            交叉信号
+        """
+        signal = self.stream.update(close)
+        if signal != 0:
+            await self.execute_signal(signal, close)
+        return signal
+    
+    async def execute_signal(self, signal: int, price: float = None):
+        """
+        执行交易信号
+        
+        Args:
+            signal: 1=买入, -1=卖出, 0=无操作
+            price: 当前价格（用于记录）
+        """
+        try:
+            account, positions = await self.trader.get_snapshot()
+            self.position = self._position_in(positions)
+            action = self._action_for(signal)
+            
+            if action == 'BUY':
+                qty = _buy_qty(account['buying_power'], price)
+                if qty > 0:
+                    self._record_trade('BUY', qty, await self.trader.buy_market(self.symbol, qty), price)
+            
+            elif action == 'SELL':
+                qty = abs(self.position)
+                self._record_trade('SELL', qty, await self.trader.sell_market(self.symbol, qty), price)
+            
+            self.last_signal = signal
+            
+        except Exception as e:
+            print(f"执行交易信号失败: {e}")
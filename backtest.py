@@ -17,14 +17,24 @@ sys.path.insert(0, str(project_root))
 
 try:
     # 尝试相对导入（当作为包导入时）
-    from .data_provider import get_bitcoin_data
+    from .data_provider import get_bitcoin_data, BinanceDataProvider
     from .config import config
     from .strategy import MACDStrategy
+    from .vector_backtest import vectorized_backtest, downsample_equity
+    from .optimizer import ParallelOptimizer, AdaptiveSearch, compare_batch
+    from .indicators import parameter_grid
+    from .walk_forward import WalkForwardOptimizer
+    from .result_cache import ResultCache, data_fingerprint, ENGINE_BACKTESTING, ENGINE_VECTORIZED
 except ImportError:
     # 如果相对导入失败，使用绝对导入（当直接运行时）
-    from simple_trading_system.data_provider import get_bitcoin_data
+    from simple_trading_system.data_provider import get_bitcoin_data, BinanceDataProvider
     from simple_trading_system.config import config
     from simple_trading_system.strategy import MACDStrategy
+    from simple_trading_system.vector_backtest import vectorized_backtest, downsample_equity
+    from simple_trading_system.optimizer import ParallelOptimizer, AdaptiveSearch, compare_batch
+    from simple_trading_system.indicators import parameter_grid
+    from simple_trading_system.walk_forward import WalkForwardOptimizer
+    from simple_trading_system.result_cache import ResultCache, data_fingerprint, ENGINE_BACKTESTING, ENGINE_VECTORIZED
 
 
 # 使用strategy.py中的MACDStrategy类来生成适配backtesting.py的策略类
@@ -112,13 +122,15 @@ def create_macd_strategy(fast_period=12, slow_period=26, signal_period=9, positi
 class BacktestRunner:
     """回测运行器 - 集成strategy.py中的策略"""
     
-    def __init__(self, data: pd.DataFrame = None, strategy_params: dict = None):
+    def __init__(self, data: pd.DataFrame = None, strategy_params: dict = None,
+                 cache: ResultCache = None):
         """
         初始化回测运行器
         
         Args:
             data: 价格数据DataFrame，如果为None则自动获取比特币数据
             strategy_params: 策略参数字典，包含fast_period, slow_period, signal_period等
+            cache: 回测结果缓存，为None时不使用缓存
         """
         if data is None:
             print("正在获取比特币数据...")
@@ -134,9 +146,34 @@ class BacktestRunner:
             'position_size': 0.8
         }
         
+        self.cache = cache
+        self._fingerprint = None
+        
         # 确保数据格式正确
         self._prepare_data()
     
+    @property
+    def fingerprint(self) -> str:
+        """回测数据的指纹（首次使用时计算）"""
+        if self._fingerprint is None:
+            self._fingerprint = data_fingerprint(self.data)
+        return self._fingerprint
+    
+    def _cached_results(self, cash: float, commission: float, engine: str):
+        """读取当前策略参数在指定引擎下的缓存结果，未启用缓存或未命中时返回None"""
+        if self.cache is None:
+            return None
+        results = self.cache.get(self.fingerprint, self.strategy_params, cash, commission, engine=engine)
+        if results is not None:
+            print("使用缓存的回测结果")
+            self._print_results(results)
+        return results
+    
+    def _store_results(self, results: dict, cash: float, commission: float, engine: str):
+        """把回测结果写入缓存"""
+        if self.cache is not None:
+            self.cache.put(self.fingerprint, self.strategy_params, cash, commission, results, engine=engine)
+    
     def _prepare_data(self):
         """准备回测数据"""
         # 确保列名正确
@@ -158,20 +195,43 @@ class BacktestRunner:
                     strategy_class=None,
                     cash: float = 100000,  # 恢复到原来的10万美元
                     commission: float = 0.002,
-                    exclusive_orders: bool = True) -> dict:
+                    exclusive_orders: bool = True,
+                    headless: bool = False,
+                    equity_points: int = None) -> dict:
         """
         运行回测
         
+        headless模式下不生成Bokeh图表，也不保留回测实例和原始结果
+        （其中包含完整的权益曲线、交易列表和策略对象），只返回统计指标，
+        适合参数扫描和批量比较。缓存只保存统计指标，因此只有headless且不需要
+        权益曲线时才会读取缓存。
+        
         Args:
             strategy_class: 策略类，如果为None则使用默认的MACD策略
             cash: 初始资金
             commission: 手续费率
             exclusive_orders: 是否独占订单
+            headless: 是否以无图表、只保留统计指标的方式运行
+            equity_points: 返回压缩到约该点数的权益曲线，为None时不返回
             
         Returns:
             回测结果字典
         """
         try:
+            # 只有默认MACD策略的结果可以按策略参数缓存
+            cacheable = strategy_class is None and exclusive_orders
+            if cacheable and headless and equity_points is None:
+                cached = self._cached_results(cash, commission, ENGINE_BACKTESTING)
+                if cached is not None:
+                    return {
+                        'backtest_instance': None,
+                        'results': cached,
+                        'raw_results': None,
+                        'equity_curve': None,
+                        'strategy_params': self.strategy_params,
+                        'cached': True
+                    }
+            
             # 如果没有提供策略类，使用默认的MACD策略
             if strategy_class is None:
                 strategy_class = create_macd_strategy(**self.strategy_params)
@@ -190,8 +250,9 @@ class BacktestRunner:
             
             # 运行回测
             result = bt.run()
-            # 打印回测结果
-            bt.plot()
+            if not headless:
+                # 打印回测结果
+                bt.plot()
             # 转换结果为字典格式
             result_dict = {
                 'Start': result['Start'],
@@ -223,20 +284,91 @@ class BacktestRunner:
                 'SQN': result['SQN']
             }
             
+            equity_curve = None
+            if equity_points is not None:
+                equity_curve = downsample_equity(result['_equity_curve']['Equity'], equity_points)
+            
             print("回测完成！")
             self._print_results(result_dict)
+            if cacheable:
+                self._store_results(result_dict, cash, commission, ENGINE_BACKTESTING)
+            
+            if headless:
+                # 释放权益曲线、交易列表和策略对象
+                bt = result = None
             
             return {
                 'backtest_instance': bt,
                 'results': result_dict,
                 'raw_results': result,
-                'strategy_params': self.strategy_params
+                'equity_curve': equity_curve,
+                'strategy_params': self.strategy_params,
+                'cached': False
             }
             
         except Exception as e:
             print(f"回测运行失败: {e}")
             raise
     
+    def run_vectorized(self, cash: float = 100000, commission: float = 0.002,
+                       equity_points: int = None, headless: bool = False) -> dict:
+        """
+        使用纯NumPy向量化引擎运行MACD回测
+        
+        成交规则与run_backtest中的MACD策略 + FractionalBacktest一致（下一根K线
+        开盘成交、只做多、固定仓位比例），统计结果使用相同的键，但不生成图表。
+        headless模式下只返回统计指标（不返回权益曲线和交易列表），此时才会读取缓存。
+        
+        Args:
+            cash: 初始资金
+            commission: 手续费率
+            equity_points: 把权益曲线压缩到约该点数，为None时返回完整曲线
+            headless: 是否只返回统计指标
+            
+        Returns:
+            回测结果字典
+        """
+        try:
+            cached = None
+            if headless and equity_points is None:
+                cached = self._cached_results(cash, commission, ENGINE_VECTORIZED)
+            if cached is not None:
+                return {
+                    'results': cached,
+                    'equity_curve': None,
+                    'trades': None,
+                    'strategy_params': self.strategy_params,
+                    'cached': True
+                }
+            
+            print("开始运行向量化回测...")
+            print(f"使用策略参数: {self.strategy_params}")
+            
+            result = vectorized_backtest(self.data, cash=cash, commission=commission,
+                                         **self.strategy_params)
+            
+            print("回测完成！")
+            self._print_results(result['results'])
+            self._store_results(result['results'], cash, commission, ENGINE_VECTORIZED)
+            
+            equity_curve = result['equity_curve']
+            if equity_points is not None:
+                equity_curve = downsample_equity(equity_curve, equity_points)
+            elif headless:
+                equity_curve = None
+            
+            return {
+                'results': result['results'],
+                'equity_curve': equity_curve,
+                'trades': None if headless else result['trades'],
+                'strategy_params': self.strategy_params,
+                'cached': False
+            }
+            
+        except Exception as e:
+            print(f"向量化回测运行失败: {e}")
+            raise
+    
     def _print_results(self, results: dict):
         """打印回测结果"""
         print("\n" + "="*50)
@@ -260,9 +392,19 @@ class BacktestRunner:
                          slow_range=(20, 30),
                          signal_range=(6, 12),
                          position_size_range=(0.5, 1.0),
-                         maximize='Return [%]') -> dict:
+                         maximize='Return [%]',
+                         cash: float = 100000,
+                         commission: float = 0.002,
+                         max_workers: int = None,
+                         progress_callback=None,
+                         method: str = 'grid',
+                         max_evals: int = None,
+                         seed: int = None) -> dict:
         """
-        优化策略参数 - 使用strategy.py中的策略逻辑
+        优化策略参数
+
+        method为'grid'时在进程池中并行评估整个参数网格；为'halving'（逐次减半）
+        或'tpe'时在max_evals次评估的预算内自适应搜索。
         
         Args:
             fast_range: 快速EMA周期范围
@@ -270,6 +412,13 @@ class BacktestRunner:
             signal_range: 信号线EMA周期范围
             position_size_range: 仓位大小范围
             maximize: 优化目标指标
+            cash: 初始资金
+            commission: 手续费率
+            max_workers: 工作进程数，None为CPU核数
+            progress_callback: 进度回调，参数为(已完成组合数, 总组合数)，仅用于网格搜索
+            method: 搜索方式，'grid'、'halving'或'tpe'
+            max_evals: 自适应搜索的评估次数预算，默认为网格大小的10%
+            seed: 自适应搜索的随机种子
             
         Returns:
             优化结果
@@ -277,52 +426,124 @@ class BacktestRunner:
         try:
             print("开始参数优化...")
             
-            # 创建用于优化的策略类
-            OptimizationStrategy = create_macd_strategy()
-            
-            bt = FractionalBacktest(self.data, OptimizationStrategy)
+            fast_periods = range(*fast_range)
+            slow_periods = range(*slow_range)
+            signal_periods = range(*signal_range)
+            position_sizes = np.round(np.arange(*position_size_range, 0.1), 10)
             
-            # 运行优化
-            optimization_result = bt.optimize(
-                fast_period=range(*fast_range),
-                slow_period=range(*slow_range),
-                signal_period=range(*signal_range),
-                position_size=np.arange(*position_size_range, 0.1),
-                maximize=maximize,
-                constraint=lambda p: p.fast_period < p.slow_period  # 确保快线周期小于慢线周期
-            )
+            if method == 'grid':
+                optimizer = ParallelOptimizer(self.data, cash=cash, commission=commission,
+                                              max_workers=max_workers, cache=self.cache)
+                optimization_result = optimizer.run(
+                    fast_periods=fast_periods,
+                    slow_periods=slow_periods,
+                    signal_periods=signal_periods,
+                    position_sizes=position_sizes,
+                    maximize=maximize,
+                    progress_callback=progress_callback
+                )
+            elif method in ('halving', 'tpe'):
+                search = AdaptiveSearch(self.data, cash=cash, commission=commission,
+                                        cache=self.cache, seed=seed)
+                space = search.build_space(fast_periods, slow_periods, signal_periods, position_sizes)
+                if max_evals is None:
+                    grid_size = len(parameter_grid(fast_periods, slow_periods, signal_periods)) * len(position_sizes)
+                    max_evals = max(20, grid_size // 10)
+                if method == 'halving':
+                    optimization_result = search.successive_halving(space, max_evals, maximize=maximize)
+                else:
+                    optimization_result = search.tpe(space, max_evals, maximize=maximize)
+            else:
+                raise ValueError(f"未知的优化方式: {method}")
+            best_params = optimization_result['best_params']
+            best_result = optimization_result['best_result']
             
             print("参数优化完成！")
             print(f"最优参数:")
-            print(f"  快速EMA周期: {optimization_result._strategy.fast_period}")
-            print(f"  慢速EMA周期: {optimization_result._strategy.slow_period}")
-            print(f"  信号线EMA周期: {optimization_result._strategy.signal_period}")
-            print(f"  仓位大小: {optimization_result._strategy.position_size}")
-            print(f"  优化指标 ({maximize}): {optimization_result[maximize]:.2f}")
+            print(f"  快速EMA周期: {best_params['fast_period']}")
+            print(f"  慢速EMA周期: {best_params['slow_period']}")
+            print(f"  信号线EMA周期: {best_params['signal_period']}")
+            print(f"  仓位大小: {best_params['position_size']}")
+            print(f"  优化指标 ({maximize}): {best_result[maximize]:.2f}")
             
             # 更新策略参数
-            self.strategy_params.update({
-                'fast_period': optimization_result._strategy.fast_period,
-                'slow_period': optimization_result._strategy.slow_period,
-                'signal_period': optimization_result._strategy.signal_period,
-                'position_size': optimization_result._strategy.position_size
-            })
+            self.strategy_params.update(best_params)
             
-            return {
-                'best_params': {
-                    'fast_period': optimization_result._strategy.fast_period,
-                    'slow_period': optimization_result._strategy.slow_period,
-                    'signal_period': optimization_result._strategy.signal_period,
-                    'position_size': optimization_result._strategy.position_size
-                },
-                'best_result': optimization_result,
-                'optimization_target': maximize
-            }
+            return optimization_result
             
         except Exception as e:
             print(f"参数优化失败: {e}")
             raise
 
+    
+    def walk_forward(self,
+                     train_bars: int,
+                     test_bars: int,
+                     fast_range=(8, 16),
+                     slow_range=(20, 30),
+                     signal_range=(6, 12),
+                     position_size_range=(0.5, 1.0),
+                     step: int = None,
+                     anchored: bool = False,
+                     maximize='Return [%]',
+                     cash: float = 100000,
+                     commission: float = 0.002,
+                     max_workers: int = None,
+                     progress_callback=None) -> dict:
+        """
+        滚动窗口(Walk-Forward)验证 - 在训练窗口上优化参数，在随后的测试窗口上检验
+        
+        Args:
+            train_bars: 训练窗口K线数
+            test_bars: 测试窗口K线数
+            fast_range: 快速EMA周期范围
+            slow_range: 慢速EMA周期范围
+            signal_range: 信号线EMA周期范围
+            position_size_range: 仓位大小范围
+            step: 相邻两折的间隔，默认为test_bars
+            anchored: 训练窗口是否始终从第一根K线开始
+            maximize: 优化目标指标
+            cash: 初始资金
+            commission: 手续费率
+            max_workers: 工作进程数，None为CPU核数
+            progress_callback: 进度回调，参数为(已完成折数, 总折数)
+            
+        Returns:
+            包含样本外统计、样本外权益曲线和每折结果的字典
+        """
+        try:
+            print("开始滚动窗口验证...")
+            
+            optimizer = WalkForwardOptimizer(self.data, cash=cash, commission=commission,
+                                             max_workers=max_workers)
+            result = optimizer.run(
+                train_bars=train_bars,
+                test_bars=test_bars,
+                fast_periods=range(*fast_range),
+                slow_periods=range(*slow_range),
+                signal_periods=range(*signal_range),
+                position_sizes=np.round(np.arange(*position_size_range, 0.1), 10),
+                step=step,
+                anchored=anchored,
+                maximize=maximize,
+                progress_callback=progress_callback
+            )
+            
+            print("滚动窗口验证完成！样本外结果:")
+            self._print_results(result['results'])
+            
+            return result
+            
+        except Exception as e:
+            print(f"滚动窗口验证失败: {e}")
+            raise
+
+
+def _open_cache(cache_path: str = None):
+    """打开回测结果缓存，未配置路径时返回None"""
+    cache_path = cache_path or config.RESULT_CACHE_PATH
+    return ResultCache(cache_path) if cache_path else None
+
 
 def run_simple_backtest(days: int = 90, cash: float = 10000, strategy_params: dict = None) -> dict:
     """
@@ -346,13 +567,15 @@ def run_simple_backtest(days: int = 90, cash: float = 10000, strategy_params: di
     return runner.run_backtest(cash=cash)
 
 
-def optimize_macd_strategy(days: int = 90, strategy_params: dict = None) -> dict:
+def optimize_macd_strategy(days: int = 90, strategy_params: dict = None,
+                           cache_path: str = None) -> dict:
     """
     优化MACD策略参数的便捷函数 - 使用strategy.py中的策略
     
     Args:
         days: 回测数据天数
         strategy_params: 初始策略参数
+        cache_path: 回测结果缓存数据库路径，默认使用config.RESULT_CACHE_PATH
         
     Returns:
         优化结果
@@ -361,19 +584,46 @@ def optimize_macd_strategy(days: int = 90, strategy_params: dict = None) -> dict
     data = get_bitcoin_data(days=days)
     
     # 创建回测运行器
-    runner = BacktestRunner(data, strategy_params)
+    runner = BacktestRunner(data, strategy_params, cache=_open_cache(cache_path))
     
     # 运行优化
     return runner.optimize_strategy()
 
 
-def compare_strategies(days: int = 90, cash: float = 10000) -> dict:
+# compare_strategies 默认比较的策略参数组合
+DEFAULT_STRATEGY_CONFIGS = [
+    {'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'position_size': 0.8},
+    {'fast_period': 8, 'slow_period': 21, 'signal_period': 5, 'position_size': 0.6},
+    {'fast_period': 15, 'slow_period': 30, 'signal_period': 12, 'position_size': 1.0},
+]
+
+
+def _utc_timestamp(value) -> pd.Timestamp:
+    """窗口端点转换为UTC时间，无时区的时间按UTC处理"""
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+
+def _load_symbol_bars(provider: BinanceDataProvider, symbol: str, interval: str, windows: list) -> pd.DataFrame:
+    """一次性下载覆盖所有时间窗口的K线，起点为None时使用数据提供者的默认起点"""
+    starts = [_utc_timestamp(start) for start, _ in windows if start is not None]
+    ends = [_utc_timestamp(end) if end is not None else pd.Timestamp.now(tz='UTC') for _, end in windows]
+    return provider.get_historical_range(
+        symbol=symbol,
+        interval=interval,
+        start_time=int(min(starts).timestamp() * 1000) if len(starts) == len(windows) else None,
+        end_time=int(max(ends).timestamp() * 1000)
+    )
+
+
+def compare_strategies(days: int = 90, cash: float = 10000, cache_path: str = None) -> dict:
     """
     比较不同策略参数的性能
     
     Args:
         days: 回测数据天数
         cash: 初始资金
+        cache_path: 回测结果缓存数据库路径，默认使用config.RESULT_CACHE_PATH
         
     Returns:
         比较结果
@@ -381,22 +631,68 @@ def compare_strategies(days: int = 90, cash: float = 10000) -> dict:
     # 获取数据
     data = get_bitcoin_data(days=days)
     
-    # 定义不同的策略参数组合
-    strategy_configs = [
-        {'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'position_size': 0.8},
-        {'fast_period': 8, 'slow_period': 21, 'signal_period': 5, 'position_size': 0.6},
-        {'fast_period': 15, 'slow_period': 30, 'signal_period': 12, 'position_size': 1.0},
-    ]
-    
     results = {}
+    cache = _open_cache(cache_path)
     
-    for i, params in enumerate(strategy_configs):
+    for i, params in enumerate(DEFAULT_STRATEGY_CONFIGS):
         print(f"\n运行策略配置 {i+1}: {params}")
-        runner = BacktestRunner(data, params)
-        result = runner.run_backtest(cash=cash)
+        runner = BacktestRunner(data, params, cache=cache)
+        result = runner.run_backtest(cash=cash, headless=True)
         results[f"Strategy_{i+1}"] = {
             'params': params,
             'results': result['results']
         }
     
-    return results
\ No newline at end of file
+    return results
+
+
+def compare_strategies_batch(days: int = 90, cash: float = 10000, cache_path: str = None,
+                             symbols: list = None,
+                             windows: list = None,
+                             strategy_configs: list = None,
+                             interval: str = '1h',
+                             commission: float = 0.002,
+                             max_workers: int = None,
+                             data: dict = None) -> pd.DataFrame:
+    """
+    批量比较不同交易对、时间窗口和策略参数的性能
+    
+    每个交易对的K线只下载一次（覆盖所有窗口），交易对 × 窗口 × 参数的
+    组合在进程池中用向量化引擎并行回测。
+    
+    Args:
+        days: 未指定windows时，使用最近days天作为唯一窗口
+        cash: 初始资金
+        cache_path: 回测结果缓存数据库路径，默认使用config.RESULT_CACHE_PATH
+        symbols: 交易对列表，默认使用配置中的SYMBOL
+        windows: (start, end) 时间窗口列表（UTC），end为None表示到当前时间
+        strategy_configs: 策略参数字典列表，默认与compare_strategies相同的三组参数
+        interval: K线时间间隔
+        commission: 手续费率
+        max_workers: 工作进程数，None为CPU核数
+        data: 预先加载的 交易对 -> OHLCV数据 字典，提供时不再下载
+        
+    Returns:
+        每个(交易对, 窗口, 参数)一行的结果DataFrame，seconds列为该任务的回测耗时
+    """
+    symbols = symbols or [config.SYMBOL]
+    windows = windows or [(pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days), None)]
+    strategy_configs = strategy_configs or DEFAULT_STRATEGY_CONFIGS
+    
+    # 每个交易对只加载一次
+    datasets = {}
+    provider = None
+    for symbol in symbols:
+        if data is not None and symbol in data:
+            datasets[symbol] = data[symbol]
+            continue
+        provider = provider or BinanceDataProvider()
+        try:
+            datasets[symbol] = _load_symbol_bars(provider, symbol, interval, windows)
+        except Exception as e:
+            print(f"{symbol} 数据加载失败，已跳过: {e}")
+    
+    print(f"开始批量比较: {len(datasets)} 个交易对 × {len(windows)} 个窗口 × {len(strategy_configs)} 组参数")
+    
+    return compare_batch(datasets, windows, strategy_configs, cash=cash, commission=commission,
+                         max_workers=max_workers, cache=_open_cache(cache_path))
@@ -0,0 +1,496 @@
+"""
+性能基准测试模块
+Benchmark Module
+"""
+
+import time
+import os
+import sys
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from simple_trading_system.strategy import MACDStrategy
+from simple_trading_system.indicators import parameter_grid, batch_macd, batch_crossover
+from simple_trading_system.data_provider import DataStorage
+from simple_trading_system.backtest import create_macd_strategy
+from simple_trading_system.vector_backtest import vectorized_backtest
+from simple_trading_system.optimizer import ParallelOptimizer, AdaptiveSearch
+from simple_trading_system.strategy import StreamingMACD
+from simple_trading_system.engine import EventEngine, SimulatedBroker
+
+
+def make_bars(n: int, seed: int = 42, freq: str = '1min') -> pd.DataFrame:
+    """
+    生成随机游走的OHLCV测试数据
+
+    Args:
+        n: K线数量
+        seed: 随机种子
+        freq: K线频率
+
+    Returns:
+        OHLCV DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    close = 45000 + np.cumsum(rng.normal(0, 20, n))
+    return pd.DataFrame({
+        'Open': close * 0.999,
+        'High': close * 1.002,
+        'Low': close * 0.998,
+        'Close': close,
+        'Volume': rng.uniform(1, 100, n)
+    }, index=pd.date_range(start='2020-01-01', periods=n, freq=freq))
+
+
+def legacy_generate_signals(strategy: MACDStrategy, df: pd.DataFrame) -> pd.DataFrame:
+    """原始逐行循环版本的信号生成（作为基准和一致性参照）"""
+    result = df.copy()
+
+    macd_line, signal_line, histogram = strategy.calculate_macd(df['Close'])
+    result['MACD'] = macd_line
+    result['MACD_Signal'] = signal_line
+    result['MACD_Histogram'] = histogram
+
+    result['Signal'] = 0
+    result['Position'] = 0
+
+    for i in range(1, len(result)):
+        current_macd = result['MACD'].iloc[i]
+        current_signal = result['MACD_Signal'].iloc[i]
+        prev_macd = result['MACD'].iloc[i-1]
+        prev_signal = result['MACD_Signal'].iloc[i-1]
+
+        if pd.isna(current_macd) or pd.isna(current_signal) or pd.isna(prev_macd) or pd.isna(prev_signal):
+            continue
+
+        if prev_macd <= prev_signal and current_macd > current_signal:
+            result.loc[result.index[i], 'Signal'] = 1
+            strategy.position = 1
+        elif prev_macd >= prev_signal and current_macd < current_signal:
+            result.loc[result.index[i], 'Signal'] = -1
+            strategy.position = -1
+
+        result.loc[result.index[i], 'Position'] = strategy.position
+
+    return result
+
+
+def _timed(func, *args, **kwargs):
+    """运行函数并返回(结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_generate_signals(sizes=(10_000, 1_000_000, 10_000_000),
+                           legacy_limit: int = 20_000) -> list:
+    """
+    对比向量化信号生成与原始循环的耗时
+
+    原始循环在大数据量下需要数小时，超过legacy_limit的规模按
+    legacy_limit处测得的单行耗时线性外推。
+
+    Args:
+        sizes: 测试的K线数量
+        legacy_limit: 实际运行原始循环的最大K线数量
+
+    Returns:
+        每个规模的结果字典列表
+    """
+    print("\n" + "="*50)
+    print("MACD信号生成基准测试")
+    print("="*50)
+
+    legacy_per_row = None
+    rows = []
+
+    for n in sizes:
+        df = make_bars(n)
+
+        signals, vector_time = _timed(MACDStrategy().generate_signals, df)
+
+        if n <= legacy_limit:
+            expected, legacy_time = _timed(legacy_generate_signals, MACDStrategy(), df)
+            pd.testing.assert_frame_equal(signals, expected)
+            legacy_per_row = legacy_time / n
+            estimated = False
+        else:
+            if legacy_per_row is None:
+                sample = make_bars(legacy_limit)
+                _, sample_time = _timed(legacy_generate_signals, MACDStrategy(), sample)
+                legacy_per_row = sample_time / legacy_limit
+            legacy_time = legacy_per_row * n
+            estimated = True
+
+        speedup = legacy_time / vector_time if vector_time > 0 else float('inf')
+        rows.append({
+            'rows': n,
+            'vectorized_s': vector_time,
+            'legacy_s': legacy_time,
+            'legacy_estimated': estimated,
+            'speedup': speedup
+        })
+
+        suffix = " (外推)" if estimated else ""
+        print(f"{n:>12,} 行: 向量化 {vector_time:.4f}秒, "
+              f"循环 {legacy_time:.2f}秒{suffix}, 加速 {speedup:,.0f}x")
+
+    return rows
+
+
+def bench_batch_macd(bars: int = 20_000,
+                     fast_range=(8, 16), slow_range=(20, 30), signal_range=(6, 12)) -> dict:
+    """
+    对比逐组参数生成信号与批量MACD内核的耗时
+
+    Args:
+        bars: K线数量
+        fast_range: 快速EMA周期范围
+        slow_range: 慢速EMA周期范围
+        signal_range: 信号线EMA周期范围
+
+    Returns:
+        结果字典
+    """
+    print("\n" + "="*50)
+    print("批量MACD参数扫描基准测试")
+    print("="*50)
+
+    df = make_bars(bars)
+    params = parameter_grid(range(*fast_range), range(*slow_range), range(*signal_range))
+
+    def per_combination():
+        for fast, slow, signal in params:
+            MACDStrategy(int(fast), int(slow), int(signal)).generate_signals(df)
+
+    def batched():
+        macd, signal, _ = batch_macd(df['Close'].values, params)
+        return batch_crossover(macd, signal)
+
+    _, loop_time = _timed(per_combination)
+    _, batch_time = _timed(batched)
+
+    result = {
+        'bars': bars,
+        'combinations': len(params),
+        'per_combination_s': loop_time,
+        'batched_s': batch_time,
+        'speedup': loop_time / batch_time
+    }
+
+    print(f"{len(params)} 组参数 x {bars:,} 根K线: 逐组 {loop_time:.3f}秒, "
+          f"批量 {batch_time:.3f}秒, 加速 {result['speedup']:.1f}x")
+    return result
+
+
+def bench_backtest_engines(sizes=(10_000, 200_000, 2_000_000),
+                           event_limit: int = 200_000) -> list:
+    """
+    对比FractionalBacktest逐K线回测与向量化回测引擎的耗时
+
+    FractionalBacktest超过event_limit的规模按单根K线耗时线性外推。
+
+    Args:
+        sizes: 测试的K线数量
+        event_limit: 实际运行FractionalBacktest的最大K线数量
+
+    Returns:
+        每个规模的结果字典列表
+    """
+    import warnings
+    from backtesting.lib import FractionalBacktest
+
+    print("\n" + "="*50)
+    print("回测引擎基准测试")
+    print("="*50)
+
+    event_per_row = None
+    rows = []
+
+    for n in sizes:
+        df = make_bars(n)
+        vector, vector_time = _timed(vectorized_backtest, df)
+
+        if n <= event_limit:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                bt = FractionalBacktest(df, create_macd_strategy(), cash=100000,
+                                        commission=0.002, exclusive_orders=True)
+                stats, event_time = _timed(bt.run)
+            assert stats['# Trades'] == vector['results']['# Trades']
+            event_per_row = event_time / n
+            estimated = False
+        else:
+            event_time = event_per_row * n
+            estimated = True
+
+        speedup = event_time / vector_time
+        rows.append({
+            'rows': n,
+            'vectorized_s': vector_time,
+            'fractional_backtest_s': event_time,
+            'estimated': estimated,
+            'speedup': speedup
+        })
+
+        suffix = " (外推)" if estimated else ""
+        print(f"{n:>12,} 行: 向量化 {vector_time:.3f}秒, "
+              f"FractionalBacktest {event_time:.2f}秒{suffix}, 加速 {speedup:,.0f}x")
+
+    return rows
+
+
+def bench_event_engine(sizes=(200_000, 2_000_000), step_limit: int = 200_000) -> list:
+    """
+    对比事件引擎的批量回放与逐根on_bar的吞吐量
+
+    逐根on_bar超过step_limit的规模按单根K线耗时线性外推。
+
+    Args:
+        sizes: 测试的K线数量
+        step_limit: 实际逐根运行的最大K线数量
+
+    Returns:
+        每个规模的结果字典列表
+    """
+    print("\n" + "="*50)
+    print("事件引擎基准测试")
+    print("="*50)
+
+    step_per_row = None
+    rows = []
+
+    for n in sizes:
+        df = make_bars(n)
+        timestamps, open_prices, close_prices = df.index, df['Open'].values, df['Close'].values
+        engine = EventEngine(StreamingMACD(), SimulatedBroker())
+        replayed, replay_time = _timed(engine.replay, timestamps, open_prices, close_prices)
+
+        if n <= step_limit:
+            stepped = EventEngine(StreamingMACD(), SimulatedBroker())
+            started = time.perf_counter()
+            for i in range(n):
+                stepped.on_bar(timestamps[i], open_prices[i], close_prices[i])
+            step_time = time.perf_counter() - started
+            assert stepped.results()['results']['# Trades'] == replayed['results']['# Trades']
+            step_per_row = step_time / n
+            estimated = False
+        else:
+            step_time = step_per_row * n
+            estimated = True
+
+        rows.append({
+            'rows': n,
+            'replay_s': replay_time,
+            'on_bar_s': step_time,
+            'estimated': estimated,
+            'replay_bars_per_s': n / replay_time
+        })
+
+        suffix = " (外推)" if estimated else ""
+        print(f"{n:>12,} 行: 批量回放 {replay_time:.3f}秒 ({n / replay_time:,.0f} 根/秒), "
+              f"逐根on_bar {step_time:.2f}秒{suffix}")
+
+    return rows
+
+
+def bench_optimizer(bars: int = 20_000, workers=(1, 2, 4)) -> list:
+    """
+    测量并行参数优化随工作进程数的扩展性
+
+    Args:
+        bars: K线数量
+        workers: 测试的工作进程数
+
+    Returns:
+        每个进程数的结果字典列表
+    """
+    print("\n" + "="*50)
+    print(f"并行参数优化基准测试 (CPU核数: {os.cpu_count()})")
+    print("="*50)
+
+    df = make_bars(bars, freq='1h')
+    rows = []
+    baseline = None
+
+    for count in workers:
+        optimizer = ParallelOptimizer(df, max_workers=count)
+        result, elapsed = _timed(optimizer.run, range(8, 16), range(20, 30), range(6, 12), (0.5, 0.8))
+        baseline = baseline or elapsed
+        rows.append({
+            'workers': count,
+            'combinations': len(result['results']),
+            'seconds': elapsed,
+            'speedup': baseline / elapsed
+        })
+        print(f"{count} 个进程: {elapsed:.2f}秒, 相对单进程 {baseline / elapsed:.2f}x")
+
+    return rows
+
+
+def bench_adaptive_search(bars: int = 20_000, budget_ratio: float = 0.1, seeds=(0, 1, 2)) -> list:
+    """
+    比较自适应搜索与完整网格搜索的评估次数、耗时和结果质量
+
+    Args:
+        bars: K线数量
+        budget_ratio: 评估预算占网格大小的比例
+        seeds: 随机种子
+
+    Returns:
+        每种搜索方式和种子的结果字典列表
+    """
+    print("\n" + "="*50)
+    print("自适应参数搜索基准测试")
+    print("="*50)
+
+    df = make_bars(bars, freq='1h')
+    space_args = (range(5, 20), range(20, 40), range(5, 15), (0.5, 0.6, 0.7, 0.8, 0.9))
+
+    grid, grid_seconds = _timed(ParallelOptimizer(df, max_workers=1).run, *space_args)
+    returns = grid['results']['Return [%]'].fillna(-np.inf).values
+    budget = int(len(returns) * budget_ratio)
+    rows = [{'method': 'grid', 'seed': None, 'evaluations': len(returns), 'seconds': grid_seconds,
+             'best': returns.max(), 'percentile': 0.0}]
+    print(f"网格搜索: {len(returns)} 次评估, {grid_seconds:.2f}秒, 最优收益 {returns.max():.2f}%")
+
+    for method in ('successive_halving', 'tpe'):
+        for seed in seeds:
+            search = AdaptiveSearch(df, seed=seed)
+            result, elapsed = _timed(getattr(search, method), search.build_space(*space_args), budget)
+            best = result['best_result']['Return [%]']
+            # 网格中优于该结果的组合比例
+            percentile = (returns > best).mean() * 100
+            rows.append({'method': method, 'seed': seed, 'evaluations': result['evaluations'],
+                         'seconds': elapsed, 'best': best, 'percentile': percentile})
+            print(f"{method} (seed={seed}): {result['evaluations']} 次评估, {elapsed:.2f}秒, "
+                  f"最优收益 {best:.2f}%, 位于网格前 {percentile:.2f}%")
+
+    return rows
+
+
+def legacy_save_data(db_path: str, df: pd.DataFrame, symbol: str, interval: str = '1h'):
+    """原始iterrows逐行构造元组的写入方式（作为基准，写入当前表结构）"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('INSERT OR IGNORE INTO symbols (symbol) VALUES (?)', (symbol,))
+        symbol_id = conn.execute('SELECT id FROM symbols WHERE symbol = ?', (symbol,)).fetchone()[0]
+
+        data_to_insert = []
+        for timestamp, row in df.iterrows():
+            data_to_insert.append((
+                symbol_id,
+                interval,
+                timestamp.value // 1_000_000,
+                row['Open'],
+                row['High'],
+                row['Low'],
+                row['Close'],
+                row['Volume']
+            ))
+
+        conn.executemany('''
+            INSERT OR IGNORE INTO price_data
+            (symbol_id, interval, ts_ms, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', data_to_insert)
+
+
+def bench_save_data(rows: int = 5_000_000, legacy_rows: int = 50_000) -> dict:
+    """
+    对比批量写入路径与原始iterrows写入的吞吐量
+
+    原始写入只在legacy_rows规模上实际运行，再线性外推到rows。
+
+    Args:
+        rows: 批量写入的K线数量
+        legacy_rows: 原始写入实际运行的K线数量
+
+    Returns:
+        结果字典
+    """
+    print("\n" + "="*50)
+    print("数据库写入基准测试")
+    print("="*50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        df = make_bars(rows)
+        storage = DataStorage(os.path.join(temp_dir, 'bulk.db'))
+        _, bulk_time = _timed(storage.save_data, df, 'BENCH', '1m')
+
+        legacy_storage = DataStorage(os.path.join(temp_dir, 'legacy.db'))
+        _, legacy_time = _timed(legacy_save_data, legacy_storage.db_path,
+                                df.iloc[:legacy_rows], 'BENCH', '1m')
+        legacy_estimate = legacy_time / legacy_rows * rows
+
+    result = {
+        'rows': rows,
+        'bulk_s': bulk_time,
+        'bulk_rows_per_s': rows / bulk_time,
+        'legacy_s_estimated': legacy_estimate,
+        'speedup': legacy_estimate / bulk_time
+    }
+
+    print(f"批量写入 {rows:,} 行: {bulk_time:.2f}秒 ({result['bulk_rows_per_s']:,.0f} 行/秒)")
+    print(f"原始写入 (外推): {legacy_estimate:.2f}秒, 加速 {result['speedup']:.1f}x")
+    return result
+
+
+def bench_load_data(rows: int = 525_600) -> dict:
+    """
+    对比SQLite读取与Parquet缓存读取一年1m K线的耗时
+
+    Args:
+        rows: K线数量，默认约一年的1m K线
+
+    Returns:
+        结果字典
+    """
+    print("\n" + "="*50)
+    print("数据加载基准测试")
+    print("="*50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, 'load.db')
+        with DataStorage(db_path, cache_dir=os.path.join(temp_dir, 'cache')) as storage:
+            storage.save_data(make_bars(rows), 'BENCH', '1m')
+            cached, cache_time = _timed(storage.load_data, 'BENCH', interval='1m')
+
+        with DataStorage(db_path) as storage:
+            loaded, db_time = _timed(storage.load_data, 'BENCH', interval='1m')
+
+    pd.testing.assert_frame_equal(cached, loaded, check_freq=False)
+
+    result = {
+        'rows': rows,
+        'sqlite_s': db_time,
+        'parquet_s': cache_time,
+        'speedup': db_time / cache_time
+    }
+
+    print(f"SQLite读取 {rows:,} 行: {db_time:.3f}秒")
+    print(f"Parquet缓存读取 {rows:,} 行: {cache_time:.3f}秒, 加速 {result['speedup']:.1f}x")
+    return result
+
+
+def run_all_benchmarks():
+    """运行所有基准测试"""
+    bench_generate_signals()
+    bench_batch_macd()
+    bench_backtest_engines()
+    bench_event_engine()
+    bench_optimizer()
+    bench_adaptive_search()
+    bench_save_data()
+    bench_load_data()
+
+
+if __name__ == "__main__":
+    run_all_benchmarks()
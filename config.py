@@ -26,6 +26,21 @@ class Config:
     # 数据库配置
     DATABASE_PATH: str = "trading_data.db"
     
+    # Parquet列式缓存目录（需要pyarrow），为空时不启用
+    PARQUET_CACHE_DIR: Optional[str] = None
+    
+    # K线存储后端: sqlite 或 mmap（内存映射NumPy列文件）
+    STORAGE_BACKEND: str = "sqlite"
+    MMAP_STORE_DIR: str = "bar_store"
+    
+    # 回测结果缓存数据库，为空时不启用
+    RESULT_CACHE_PATH: Optional[str] = None
+    
+    # Alpaca账户/持仓/挂单快照缓存有效期（秒），0为不缓存
+    ALPACA_ACCOUNT_TTL: float = 5.0
+    ALPACA_POSITIONS_TTL: float = 5.0
+    ALPACA_ORDERS_TTL: float = 1.0
+    
     # MACD策略参数
     MACD_FAST: int = 12
     MACD_SLOW: int = 26
@@ -52,6 +67,23 @@ class Config:
             os.getenv('APCA_API_BASE_URL') or 
             self.ALPACA_BASE_URL
         )
+        
+        self.PARQUET_CACHE_DIR = (
+            os.getenv('PARQUET_CACHE_DIR') or
+            self.PARQUET_CACHE_DIR
+        )
+        self.STORAGE_BACKEND = (
+            os.getenv('STORAGE_BACKEND') or
+            self.STORAGE_BACKEND
+        )
+        self.MMAP_STORE_DIR = (
+            os.getenv('MMAP_STORE_DIR') or
+            self.MMAP_STORE_DIR
+        )
+        self.RESULT_CACHE_PATH = (
+            os.getenv('RESULT_CACHE_PATH') or
+            self.RESULT_CACHE_PATH
+        )
 
 # 全局配置实例
 config = Config()
\ No newline at end of file
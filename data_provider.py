@@ -4,8 +4,14 @@ Binance Data Provider
 """
 
 import pandas as pd
+import numpy as np
 import sqlite3
 import requests
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
 from datetime import datetime, timedelta
 from typing import Optional, List
 import sys
@@ -18,19 +24,123 @@ sys.path.insert(0, str(project_root))
 try:
     # 尝试相对导入（当作为包导入时）
     from .config import config
+    from .parquet_cache import ParquetBarCache
+    from .mmap_store import MmapBarStore
 except ImportError:
     # 如果相对导入失败，使用绝对导入（当直接运行时）
     from simple_trading_system.config import config
+    from simple_trading_system.parquet_cache import ParquetBarCache
+    from simple_trading_system.mmap_store import MmapBarStore
+
+
+# 币安单次请求K线数量上限
+KLINES_PER_REQUEST = 1000
+
+# K线周期对应的毫秒数（1M按28天计，仅用于切分请求窗口，保证每个窗口不超过1000根）
+INTERVAL_MS = {
+    '1m': 60_000,
+    '3m': 3 * 60_000,
+    '5m': 5 * 60_000,
+    '15m': 15 * 60_000,
+    '30m': 30 * 60_000,
+    '1h': 3_600_000,
+    '2h': 2 * 3_600_000,
+    '4h': 4 * 3_600_000,
+    '6h': 6 * 3_600_000,
+    '8h': 8 * 3_600_000,
+    '12h': 12 * 3_600_000,
+    '1d': 86_400_000,
+    '3d': 3 * 86_400_000,
+    '1w': 7 * 86_400_000,
+    '1M': 28 * 86_400_000,
+}
+
+# 按日历划分、长度不固定的时间间隔，不能用固定毫秒数推算K线边界
+CALENDAR_INTERVALS = frozenset({'1M'})
+
+
+class NoDataError(ValueError):
+    """交易所在请求的时间范围内没有K线（例如停机或尚未上市）"""
 
 
 class BinanceDataProvider:
     """币安数据提供者 - 直接使用REST API"""
     
-    def __init__(self):
-        """初始化币安API客户端"""
-        self.base_url = "https://api.binance.com"
+    def __init__(self, base_url: str = None, max_workers: int = 4):
+        """
+        初始化币安API客户端
+        
+        Args:
+            base_url: API地址，默认使用配置中的BINANCE_BASE_URL
+            max_workers: 分页并发下载的最大线程数
+        """
+        self.base_url = (base_url or config.BINANCE_BASE_URL).rstrip('/')
+        self.max_workers = max_workers
         self.session = requests.Session()
         
+        # 连接池大小与并发线程数一致，保证所有线程复用keep-alive连接
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # 最近一次分页下载的统计信息
+        self.last_fetch_stats = {}
+    
+    def _request_klines(self,
+                        symbol: str,
+                        interval: str,
+                        start_time: Optional[int] = None,
+                        end_time: Optional[int] = None,
+                        limit: int = KLINES_PER_REQUEST) -> list:
+        """请求一页原始K线数据"""
+        url = f"{self.base_url}/api/v3/klines"
+        
+        params = {
+            'symbol': symbol,
+            'interval': interval,
+            'limit': min(limit, KLINES_PER_REQUEST)  # 币安API限制最大1000条
+        }
+        
+        if start_time:
+            params['startTime'] = start_time
+        if end_time:
+            params['endTime'] = end_time
+        
+        response = self.session.get(url, params=params)
+        if response.status_code == 400:
+            # 无效的交易对或时间间隔，重试不会成功
+            try:
+                message = response.json().get('msg', response.text)
+            except ValueError:
+                message = response.text
+            raise ValueError(f"币安拒绝请求 ({symbol} {interval}): {message}")
+        response.raise_for_status()
+        
+        return response.json()
+    
+    @staticmethod
+    def _klines_to_dataframe(klines: list) -> pd.DataFrame:
+        """将原始K线列表转换为OHLCV DataFrame"""
+        df = pd.DataFrame(klines, columns=[
+            'timestamp', 'Open', 'High', 'Low', 'Close', 'Volume',
+            'close_time', 'quote_asset_volume', 'number_of_trades',
+            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+        ])
+        
+        # 数据类型转换
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df['Open'] = df['Open'].astype(float)
+        df['High'] = df['High'].astype(float)
+        df['Low'] = df['Low'].astype(float)
+        df['Close'] = df['Close'].astype(float)
+        df['Volume'] = df['Volume'].astype(float)
+        
+        # 设置时间索引
+        df.set_index('timestamp', inplace=True)
+        
+        # 只保留OHLCV列
+        return df[['Open', 'High', 'Low', 'Close', 'Volume']]
+        
     def get_historical_data(self, 
                           symbol: str = "BTCUSDT",
                           interval: str = "1h",
@@ -51,50 +161,12 @@ class BinanceDataProvider:
             包含OHLCV数据的DataFrame
         """
         try:
-            # 构建API请求URL
-            url = f"{self.base_url}/api/v3/klines"
-            
-            # 构建请求参数
-            params = {
-                'symbol': symbol,
-                'interval': interval,
-                'limit': min(limit, 1000)  # 币安API限制最大1000条
-            }
-            
-            if start_time:
-                params['startTime'] = start_time
-            if end_time:
-                params['endTime'] = end_time
-            
-            # 发送请求
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            
-            klines = response.json()
+            klines = self._request_klines(symbol, interval, start_time, end_time, limit)
             
             if not klines:
-                raise ValueError("未获取到数据")
+                raise NoDataError("未获取到数据")
             
-            # 转换为DataFrame
-            df = pd.DataFrame(klines, columns=[
-                'timestamp', 'Open', 'High', 'Low', 'Close', 'Volume',
-                'close_time', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-            ])
-            
-            # 数据类型转换
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df['Open'] = df['Open'].astype(float)
-            df['High'] = df['High'].astype(float)
-            df['Low'] = df['Low'].astype(float)
-            df['Close'] = df['Close'].astype(float)
-            df['Volume'] = df['Volume'].astype(float)
-            
-            # 设置时间索引
-            df.set_index('timestamp', inplace=True)
-            
-            # 只保留OHLCV列
-            df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
+            df = self._klines_to_dataframe(klines)
             
             print(f"成功获取 {symbol} 数据，共 {len(df)} 条记录")
             return df
@@ -106,6 +178,79 @@ class BinanceDataProvider:
             print(f"获取数据失败: {e}")
             raise
     
+    def get_historical_range(self,
+                             symbol: str = "BTCUSDT",
+                             interval: str = "1h",
+                             start_time: int = None,
+                             end_time: int = None,
+                             max_workers: int = None) -> pd.DataFrame:
+        """
+        分页并发获取任意时间范围的K线数据
+        
+        将[start_time, end_time]按每页1000根K线切分成窗口，通过有界线程池
+        并发请求（复用同一个Session），再按时间顺序拼接并去重。
+        
+        Args:
+            symbol: 交易对符号
+            interval: 时间间隔
+            start_time: 开始时间戳(毫秒)
+            end_time: 结束时间戳(毫秒)，默认为当前时间
+            max_workers: 并发线程数，默认使用初始化时的max_workers
+            
+        Returns:
+            包含OHLCV数据的DataFrame
+        """
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"不支持的时间间隔: {interval}")
+        
+        if end_time is None:
+            end_time = int(datetime.now().timestamp() * 1000)
+        if start_time is None:
+            start_time = end_time - INTERVAL_MS[interval] * KLINES_PER_REQUEST
+        if start_time > end_time:
+            raise ValueError("开始时间不能晚于结束时间")
+        
+        # 按1000根K线切分请求窗口
+        window_ms = INTERVAL_MS[interval] * KLINES_PER_REQUEST
+        windows = [
+            (window_start, min(window_start + window_ms - 1, end_time))
+            for window_start in range(start_time, end_time + 1, window_ms)
+        ]
+        
+        workers = max(1, min(max_workers or self.max_workers, len(windows)))
+        started = time.perf_counter()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pages = list(executor.map(
+                    lambda window: self._request_klines(symbol, interval, window[0], window[1]),
+                    windows
+                ))
+        except requests.exceptions.RequestException as e:
+            print(f"网络请求错误: {e}")
+            raise
+        
+        # 按窗口顺序拼接并去重
+        klines = [kline for page in pages for kline in page]
+        if not klines:
+            raise NoDataError("未获取到数据")
+        
+        df = self._klines_to_dataframe(klines)
+        df = df[~df.index.duplicated(keep='first')].sort_index()
+        
+        elapsed = time.perf_counter() - started
+        self.last_fetch_stats = {
+            'bars': len(df),
+            'requests': len(windows),
+            'workers': workers,
+            'seconds': elapsed,
+            'bars_per_second': len(df) / elapsed if elapsed > 0 else float('inf')
+        }
+        
+        print(f"成功获取 {symbol} 数据，共 {len(df)} 条记录 "
+              f"({len(windows)} 次请求, {self.last_fetch_stats['bars_per_second']:,.0f} 条/秒)")
+        return df
+    
     def get_latest_price(self, symbol: str = "BTCUSDT") -> float:
         """获取最新价格"""
         try:
@@ -138,98 +283,475 @@ class BinanceDataProvider:
             raise
 
 
+# 批量写入时每次转换的行数
+SAVE_CHUNK_SIZE = 100_000
+
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 256
+
+# 连接池中每个连接使用的PRAGMA：WAL日志、NORMAL同步级别、64MB页缓存
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
 class DataStorage:
     """数据存储管理"""
     
-    def __init__(self, db_path: str = None):
-        """初始化数据库连接"""
+    # 当前数据库结构版本（PRAGMA user_version）
+    SCHEMA_VERSION = 2
+    
+    def __init__(self, db_path: str = None, cache_dir: str = None,
+                 backend: str = None, store_dir: str = None):
+        """
+        初始化数据库连接
+        
+        Args:
+            db_path: SQLite数据库路径
+            cache_dir: Parquet缓存目录，默认使用配置中的PARQUET_CACHE_DIR，为空时不启用缓存
+            backend: K线存储后端 'sqlite' 或 'mmap'，默认使用配置中的STORAGE_BACKEND
+            store_dir: mmap后端的存储目录，默认使用配置中的MMAP_STORE_DIR
+        """
         self.db_path = db_path or config.DATABASE_PATH
-        self._init_database()
+        self.backend = backend or config.STORAGE_BACKEND
+        
+        if self.backend not in ('sqlite', 'mmap'):
+            raise ValueError(f"不支持的存储后端: {self.backend}")
+        
+        # mmap后端：K线以内存映射的列文件保存，不经过SQLite和Parquet缓存
+        self.bar_store = (
+            MmapBarStore(store_dir or config.MMAP_STORE_DIR) if self.backend == 'mmap' else None
+        )
+        
+        # 可选的Parquet列式缓存，save_data时同步写入
+        cache_dir = cache_dir or config.PARQUET_CACHE_DIR
+        self.cache = ParquetBarCache(cache_dir) if cache_dir and self.bar_store is None else None
+        
+        # 连接池：每个线程一个持久连接，close()时统一关闭
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+        
+        if self.bar_store is None:
+            self._init_database()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接，首次使用时创建并加入连接池"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            conn = sqlite3.connect(
+                self.db_path,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE
+            )
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            
+            with self._pool_lock:
+                self._connections.append(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+        
+        return conn
+    
+    def _cursor(self) -> sqlite3.Cursor:
+        """获取当前线程复用的游标"""
+        self._connection()
+        return self._local.cursor
+    
+    @contextmanager
+    def _transaction(self):
+        """在当前线程的连接上开启一个事务"""
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+    
+    def close(self):
+        """关闭连接池中的所有连接，之后的调用会重新建立连接"""
+        with self._pool_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._generation += 1
     
     def _init_database(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._transaction() as conn:
+            # v1的price_data以文本时间戳存储，先改名为price_data_v1等待迁移
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(price_data)')]
+            if 'timestamp' in columns:
+                conn.execute('DROP INDEX IF EXISTS idx_symbol_timestamp')
+                conn.execute('DROP INDEX IF EXISTS idx_symbol_interval_timestamp')
+                conn.execute('ALTER TABLE price_data RENAME TO price_data_v1')
+            
+            # 交易对字典表
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS symbols (
+                    id INTEGER PRIMARY KEY,
+                    symbol TEXT NOT NULL UNIQUE
+                )
+            ''')
+            
+            # K线表：以(symbol_id, interval, ts_ms)为聚簇主键
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS price_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT NOT NULL,
-                    timestamp DATETIME NOT NULL,
+                    symbol_id INTEGER NOT NULL,
+                    interval TEXT NOT NULL,
+                    ts_ms INTEGER NOT NULL,
                     open REAL NOT NULL,
                     high REAL NOT NULL,
                     low REAL NOT NULL,
                     close REAL NOT NULL,
                     volume REAL NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(symbol, timestamp)
-                )
+                    PRIMARY KEY (symbol_id, interval, ts_ms)
+                ) WITHOUT ROWID
             ''')
             
-            # 创建索引
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON price_data(symbol, timestamp)')
+            # 已确认交易所没有数据的区间，增量同步时不再回补
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS empty_ranges (
+                    symbol_id INTEGER NOT NULL,
+                    interval TEXT NOT NULL,
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL,
+                    PRIMARY KEY (symbol_id, interval, start_ms)
+                ) WITHOUT ROWID
+            ''')
+            
+            if not self._v1_pending(conn):
+                conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        
+        if self.needs_migration():
+            # 迁移需要重写整个表，不在打开数据库时执行
+            print("数据库中有待迁移的v1 K线数据，请运行 python main.py --mode migrate 完成迁移")
+    
+    @staticmethod
+    def _v1_pending(conn: sqlite3.Connection) -> bool:
+        """是否还有未迁移的v1表"""
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_data_v1'"
+        ).fetchone() is not None
+    
+    def needs_migration(self) -> bool:
+        """是否有尚未迁移到v2结构的v1 K线数据"""
+        return self.bar_store is None and self._v1_pending(self._connection())
+    
+    def migrate_to_v2(self, batch_size: int = 50_000, vacuum: bool = False) -> int:
+        """
+        将v1的price_data_v1在线迁移到v2结构
+        
+        需要显式调用（命令行 --mode migrate），打开数据库时不会自动执行。
+        按id分批复制，每批在一个短事务中写入v2表并从v1表删除，迁移期间其他连接
+        仍可读写；中途中断后再次调用从剩余的行继续。迁移完成前v1中的数据不可读。
+        
+        Args:
+            batch_size: 每批复制的行数
+            vacuum: 迁移完成后是否VACUUM回收空间（需要重写整个数据库文件）
+            
+        Returns:
+            迁移的行数
+        """
+        conn = self._connection()
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(price_data_v1)')]
+        if not columns:
+            return 0
+        
+        # 最早版本的表没有interval列，数据均为1h K线
+        interval_expr = 'v.interval' if 'interval' in columns else "'1h'"
+        
+        with self._transaction():
+            conn.execute('INSERT OR IGNORE INTO symbols (symbol) SELECT DISTINCT symbol FROM price_data_v1')
+        
+        migrated = 0
+        while True:
+            with self._transaction():
+                # 另一个进程可能已经完成迁移
+                if not self._v1_pending(conn):
+                    break
+                first_id = conn.execute('SELECT MIN(id) FROM price_data_v1').fetchone()[0]
+                if first_id is None:
+                    conn.execute('DROP TABLE price_data_v1')
+                    conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+                    break
+                last_id = first_id + batch_size - 1
+                rows = conn.execute(f'''
+                    INSERT OR IGNORE INTO price_data
+                    (symbol_id, interval, ts_ms, open, high, low, close, volume)
+                    SELECT s.id, {interval_expr},
+                           CAST(strftime('%s', v.timestamp) AS INTEGER) * 1000,
+                           v.open, v.high, v.low, v.close, v.volume
+                    FROM price_data_v1 v JOIN symbols s ON s.symbol = v.symbol
+                    WHERE v.id BETWEEN ? AND ?
+                ''', (first_id, last_id)).rowcount
+                conn.execute('DELETE FROM price_data_v1 WHERE id <= ?', (last_id,))
+            
+            migrated += max(rows, 0)
+        
+        if vacuum:
+            conn.execute('VACUUM')
+        
+        print(f"数据库结构迁移完成，共迁移 {migrated} 条记录")
+        return migrated
+    
+    @staticmethod
+    def _symbol_id(conn, symbol: str, create: bool = False) -> Optional[int]:
+        """查询交易对编号，create为True时不存在则新建"""
+        if create:
+            conn.execute('INSERT OR IGNORE INTO symbols (symbol) VALUES (?)', (symbol,))
+        row = conn.execute('SELECT id FROM symbols WHERE symbol = ?', (symbol,)).fetchone()
+        return row[0] if row else None
+    
+    @staticmethod
+    def _to_ms(value) -> int:
+        """将日期字符串或时间戳转换为毫秒（无时区视为UTC）"""
+        return pd.Timestamp(value).value // 1_000_000
+    
+    @staticmethod
+    def _iter_rows(df: pd.DataFrame, symbol_id: int, interval: str, chunk_size: int = SAVE_CHUNK_SIZE):
+        """按块将DataFrame转换为原生类型的插入元组，逐行产出"""
+        values = df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=np.float64)
+        ts_ms = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        
+        for start in range(0, len(df), chunk_size):
+            stop = start + chunk_size
+            columns = values[start:stop].T.tolist()
+            yield from zip(repeat(symbol_id), repeat(interval), ts_ms[start:stop].tolist(), *columns)
     
-    def save_data(self, df: pd.DataFrame, symbol: str):
-        """保存数据到数据库"""
+    def save_data(self, df: pd.DataFrame, symbol: str, interval: str = '1h'):
+        """保存数据到数据库（单事务批量写入，忽略重复数据）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # 准备数据
-                data_to_insert = []
-                for timestamp, row in df.iterrows():
-                    data_to_insert.append((
-                        symbol,
-                        timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                        row['Open'],
-                        row['High'],
-                        row['Low'],
-                        row['Close'],
-                        row['Volume']
-                    ))
-                
-                # 批量插入，忽略重复数据
+            if self.bar_store is not None:
+                self.bar_store.save_bars(df, symbol, interval)
+                print(f"成功保存 {len(df)} 条 {symbol} 数据到内存映射存储")
+                return
+            
+            with self._transaction() as conn:
+                symbol_id = self._symbol_id(conn, symbol, create=True)
                 conn.executemany('''
                     INSERT OR IGNORE INTO price_data 
-                    (symbol, timestamp, open, high, low, close, volume)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', data_to_insert)
-                
-                print(f"成功保存 {len(data_to_insert)} 条 {symbol} 数据到数据库")
+                    (symbol_id, interval, ts_ms, open, high, low, close, volume)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', self._iter_rows(df, symbol_id, interval))
+            
+            if self.cache is not None:
+                # 只有缓存已包含该交易对/周期时才直接追加；缓存为空时数据库中可能已有
+                # 未缓存的历史数据，从数据库完整重建，避免缓存只含本次写入的部分
+                if self.cache.has_data(symbol, interval):
+                    self.cache.write(df, symbol, interval)
+                else:
+                    self.rebuild_cache(symbol, interval)
+            
+            print(f"成功保存 {len(df)} 条 {symbol} 数据到数据库")
                 
         except Exception as e:
             print(f"保存数据失败: {e}")
             raise
     
-    def load_data(self, symbol: str, start_date: str = None, end_date: str = None) -> pd.DataFrame:
-        """从数据库加载数据"""
+    def get_latest_timestamp(self, symbol: str, interval: str = '1h') -> Optional[int]:
+        """
+        获取已保存的最新K线时间
+        
+        Args:
+            symbol: 交易对符号
+            interval: 时间间隔
+            
+        Returns:
+            最新K线开盘时间戳(毫秒)，没有数据时返回None
+        """
+        if self.bar_store is not None:
+            return self.bar_store.latest_timestamp(symbol, interval)
+        
+        row = self._cursor().execute('''
+            SELECT MAX(p.ts_ms) FROM price_data p JOIN symbols s ON s.id = p.symbol_id
+            WHERE s.symbol = ? AND p.interval = ?
+        ''', (symbol, interval)).fetchone()
+        
+        return row[0] if row and row[0] is not None else None
+    
+    def find_gaps(self, symbol: str, interval: str = '1h') -> List[tuple]:
+        """
+        查找已保存数据内部缺失的K线区间
+        
+        Args:
+            symbol: 交易对符号
+            interval: 时间间隔
+            
+        Returns:
+            缺失区间列表 [(开始时间戳, 结束时间戳)]，单位毫秒，首尾均包含
+        """
+        if interval in CALENDAR_INTERVALS:
+            raise ValueError(f"按日历月划分的时间间隔不支持缺口检查: {interval}")
+        interval_ms = INTERVAL_MS[interval]
+        
+        if self.bar_store is not None:
+            return self.bar_store.find_gaps(symbol, interval, interval_ms)
+        
+        rows = self._cursor().execute('''
+            SELECT prev_ts, ts FROM (
+                SELECT p.ts_ms AS ts, LAG(p.ts_ms) OVER (ORDER BY p.ts_ms) AS prev_ts
+                FROM price_data p JOIN symbols s ON s.id = p.symbol_id
+                WHERE s.symbol = ? AND p.interval = ?
+            )
+            WHERE ts - prev_ts > ?
+        ''', (symbol, interval, interval_ms)).fetchall()
+        
+        return [(prev_ts + interval_ms, ts - interval_ms) for prev_ts, ts in rows]
+    
+    def mark_empty(self, symbol: str, interval: str, ranges: List[tuple]):
+        """
+        记录已确认交易所没有K线的区间
+        
+        Args:
+            symbol: 交易对符号
+            interval: 时间间隔
+            ranges: 区间列表 [(开始时间戳, 结束时间戳)]，单位毫秒，首尾均包含
+        """
+        if not ranges:
+            return
+        
+        if self.bar_store is not None:
+            self.bar_store.mark_empty(symbol, interval, ranges)
+            return
+        
+        with self._transaction() as conn:
+            symbol_id = self._symbol_id(conn, symbol, create=True)
+            conn.executemany(
+                'INSERT OR REPLACE INTO empty_ranges (symbol_id, interval, start_ms, end_ms) VALUES (?, ?, ?, ?)',
+                [(symbol_id, interval, int(start), int(end)) for start, end in ranges]
+            )
+    
+    def empty_ranges(self, symbol: str, interval: str = '1h') -> List[tuple]:
+        """
+        已确认交易所没有K线的区间
+        
+        Returns:
+            区间列表 [(开始时间戳, 结束时间戳)]，单位毫秒
+        """
+        if self.bar_store is not None:
+            return self.bar_store.empty_ranges(symbol, interval)
+        
+        rows = self._cursor().execute('''
+            SELECT e.start_ms, e.end_ms FROM empty_ranges e JOIN symbols s ON s.id = e.symbol_id
+            WHERE s.symbol = ? AND e.interval = ? ORDER BY e.start_ms
+        ''', (symbol, interval)).fetchall()
+        return [tuple(row) for row in rows]
+    
+    def _read_db(self, symbol: str, interval: str,
+                 start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> pd.DataFrame:
+        """按主键顺序从数据库读取K线"""
+        conn = self._connection()
+        symbol_id = self._symbol_id(self._cursor(), symbol)
+        if symbol_id is None:
+            return pd.DataFrame()
+        
+        query = ("SELECT ts_ms, open, high, low, close, volume FROM price_data "
+                 "WHERE symbol_id = ? AND interval = ?")
+        params = [symbol_id, interval]
+        
+        if start_ms is not None:
+            query += " AND ts_ms >= ?"
+            params.append(start_ms)
+        
+        if end_ms is not None:
+            query += " AND ts_ms <= ?"
+            params.append(end_ms)
+        
+        query += " ORDER BY ts_ms"
+        
+        df = pd.read_sql_query(query, conn, params=params)
+        
+        if df.empty:
+            return pd.DataFrame()
+        
+        # 转换数据类型
+        df['ts_ms'] = pd.to_datetime(df['ts_ms'], unit='ms')
+        df.set_index('ts_ms', inplace=True)
+        df.index.name = 'timestamp'
+        df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+        return df
+    
+    def rebuild_cache(self, symbol: str, interval: str = '1h'):
+        """用数据库中的全部数据重建该交易对/周期的Parquet缓存"""
+        if self.cache is None:
+            return
+        
+        self.cache.clear(symbol, interval)
+        self.cache.write(self._read_db(symbol, interval), symbol, interval)
+    
+    def load_data(self, symbol: str, start_date: str = None, end_date: str = None,
+                  interval: str = '1h') -> pd.DataFrame:
+        """从数据库加载数据（启用缓存时从Parquet分区读取）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                query = "SELECT timestamp, open, high, low, close, volume FROM price_data WHERE symbol = ?"
-                params = [symbol]
-                
-                if start_date:
-                    query += " AND timestamp >= ?"
-                    params.append(start_date)
-                
-                if end_date:
-                    query += " AND timestamp <= ?"
-                    params.append(end_date)
-                
-                query += " ORDER BY timestamp"
-                
-                df = pd.read_sql_query(query, conn, params=params)
-                
-                if df.empty:
-                    return pd.DataFrame()
-                
-                # 转换数据类型
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                df.set_index('timestamp', inplace=True)
-                df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
-                
-                print(f"从数据库加载 {symbol} 数据，共 {len(df)} 条记录")
-                return df
-                
+            start_ms = self._to_ms(start_date) if start_date else None
+            end_ms = self._to_ms(end_date) if end_date else None
+            
+            if self.bar_store is not None:
+                df = self.bar_store.load_bars(symbol, interval, start_ms, end_ms)
+                source = "内存映射存储"
+            elif self.cache is not None:
+                # 首次读取时从数据库构建缓存
+                if not self.cache.has_data(symbol, interval):
+                    self.rebuild_cache(symbol, interval)
+                df = self.cache.read(symbol, interval, start_ms, end_ms)
+                source = "缓存"
+            else:
+                df = self._read_db(symbol, interval, start_ms, end_ms)
+                source = "数据库"
+            
+            if df.empty:
+                return pd.DataFrame()
+            
+            print(f"从{source}加载 {symbol} 数据，共 {len(df)} 条记录")
+            return df
+            
         except Exception as e:
             print(f"加载数据失败: {e}")
             raise
+    
+    def load_arrays(self, symbol: str, start_date: str = None, end_date: str = None,
+                    interval: str = '1h') -> dict:
+        """
+        以NumPy列数组形式加载K线（ts毫秒、open、high、low、close、volume）
+        
+        mmap后端直接返回只读内存映射视图，不做解析和拷贝；
+        SQLite后端从load_data的结果转换。
+        """
+        start_ms = self._to_ms(start_date) if start_date else None
+        end_ms = self._to_ms(end_date) if end_date else None
+        
+        if self.bar_store is not None:
+            return self.bar_store.load_arrays(symbol, interval, start_ms, end_ms)
+        
+        df = self.load_data(symbol, start_date, end_date, interval)
+        if df.empty:
+            return {}
+        
+        return {
+            'ts': df.index.values.astype('datetime64[ms]').astype(np.int64),
+            'open': df['Open'].to_numpy(),
+            'high': df['High'].to_numpy(),
+            'low': df['Low'].to_numpy(),
+            'close': df['Close'].to_numpy(),
+            'volume': df['Volume'].to_numpy(),
+        }
 
 
 def get_bitcoin_data(days: int = 30, save_to_db: bool = True) -> pd.DataFrame:
@@ -244,14 +766,13 @@ def get_bitcoin_data(days: int = 30, save_to_db: bool = True) -> pd.DataFrame:
         比特币价格数据DataFrame
     """
     provider = BinanceDataProvider()
-    storage = DataStorage()
     
     # 计算时间戳范围
     end_time = int(datetime.now().timestamp() * 1000)
     start_time = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
     
     # 获取数据
-    df = provider.get_historical_data(
+    df = provider.get_historical_range(
         symbol=config.SYMBOL,
         interval="1h",
         start_time=start_time,
@@ -260,6 +781,132 @@ def get_bitcoin_data(days: int = 30, save_to_db: bool = True) -> pd.DataFrame:
     
     # 保存到数据库
     if save_to_db:
-        storage.save_data(df, config.SYMBOL)
+        with DataStorage() as storage:
+            storage.save_data(df, config.SYMBOL)
+    
+    return df
+
+
+def _missing_ranges(start_ms: int, end_ms: int, interval_ms: int, open_ms: np.ndarray) -> List[tuple]:
+    """[start_ms, end_ms]内没有出现在open_ms中的连续K线区间"""
+    expected = np.arange(start_ms, end_ms + 1, interval_ms, dtype=np.int64)
+    missing = expected[~np.isin(expected, open_ms)]
+    if not len(missing):
+        return []
+    
+    breaks = np.flatnonzero(np.diff(missing) > interval_ms)
+    starts = np.concatenate(([missing[0]], missing[breaks + 1]))
+    ends = np.concatenate((missing[breaks], [missing[-1]]))
+    return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def sync_data(symbol: str = None,
+              interval: str = '1h',
+              days: int = 30,
+              fill_gaps: bool = True,
+              provider: BinanceDataProvider = None,
+              storage: DataStorage = None) -> int:
+    """
+    增量同步K线数据到数据库
+    
+    只下载数据库中最新K线之后的部分，并回补数据内部的缺口；
+    数据库中没有该交易对时下载最近days天。只保存已收盘的K线。
+    回补后交易所仍然没有数据的缺口会被记录，之后的同步不再请求。
+    无效的交易对或时间间隔抛出ValueError；K线长度不固定的1M不支持增量同步。
+    
+    Args:
+        symbol: 交易对符号，默认使用配置中的SYMBOL
+        interval: 时间间隔
+        days: 首次同步时下载的天数
+        fill_gaps: 是否回补内部缺口
+        provider: 数据提供者，默认新建
+        storage: 数据存储，默认新建
+        
+    Returns:
+        新下载的K线数量
+    """
+    if interval not in INTERVAL_MS:
+        raise ValueError(f"不支持的时间间隔: {interval}")
+    if interval in CALENDAR_INTERVALS:
+        raise ValueError(f"增量同步不支持按日历月划分的时间间隔: {interval}")
+    
+    symbol = symbol or config.SYMBOL
+    provider = provider or BinanceDataProvider()
+    storage = storage or DataStorage()
+    interval_ms = INTERVAL_MS[interval]
+    
+    # 最后一根已收盘K线的开盘时间
+    now_ms = int(datetime.now().timestamp() * 1000)
+    last_closed = now_ms - interval_ms
+    
+    latest = storage.get_latest_timestamp(symbol, interval)
+    if latest is None:
+        ranges = [(now_ms - days * 86_400_000, last_closed)]
+    else:
+        ranges = [(latest + interval_ms, last_closed)]
+    
+    gaps = []
+    if fill_gaps and latest is not None:
+        # 跳过已确认交易所没有数据的缺口
+        verified = storage.empty_ranges(symbol, interval)
+        gaps = [(start, end) for start, end in storage.find_gaps(symbol, interval)
+                if not any(v_start <= start and end <= v_end for v_start, v_end in verified)]
+    
+    fetched = 0
+    for start_time, end_time in gaps + ranges:
+        if start_time > end_time:
+            continue
+        
+        try:
+            df = provider.get_historical_range(symbol, interval, start_time, end_time)
+        except NoDataError:
+            # 交易所在该区间没有数据（例如停机）
+            df = pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'],
+                              index=pd.DatetimeIndex([]), dtype=float)
+        
+        # 丢弃尚未收盘的K线
+        open_ms = df.index.asi8 // 1_000_000
+        df = df[open_ms + interval_ms <= now_ms]
+        
+        if not df.empty:
+            storage.save_data(df, symbol, interval)
+            fetched += len(df)
+        
+        if (start_time, end_time) in gaps:
+            storage.mark_empty(symbol, interval,
+                               _missing_ranges(start_time, end_time, interval_ms, open_ms))
+    
+    print(f"{symbol} {interval} 增量同步完成，新增 {fetched} 条记录")
+    return fetched
+
+
+def sync_symbols(symbols: List[str], interval: str = '1h', days: int = 30) -> dict:
+    """
+    批量增量同步多个交易对，共享同一个数据提供者和数据库
+    
+    单个交易对失败（例如已下架或无效）只记录并继续同步其余交易对；
+    不支持的时间间隔在同步前抛出ValueError。
+    
+    Args:
+        symbols: 交易对列表
+        interval: 时间间隔
+        days: 首次同步时下载的天数
+        
+    Returns:
+        每个交易对新增K线数量的字典，同步失败的交易对为None
+    """
+    if interval not in INTERVAL_MS or interval in CALENDAR_INTERVALS:
+        raise ValueError(f"不支持增量同步的时间间隔: {interval}")
+    
+    provider = BinanceDataProvider()
+    
+    results = {}
+    with DataStorage() as storage:
+        for symbol in symbols:
+            try:
+                results[symbol] = sync_data(symbol, interval, days, provider=provider, storage=storage)
+            except Exception as e:
+                print(f"{symbol} 同步失败: {e}")
+                results[symbol] = None
     
-    return df
\ No newline at end of file
+    return results
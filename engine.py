@@ -0,0 +1,433 @@
+"""
+事件驱动交易引擎
+Event-Driven Trading Engine
+"""
+
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .strategy import StreamingMACD
+    from .vector_backtest import FRACTIONAL_UNIT, compute_stats, macd_warmup
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.strategy import StreamingMACD
+    from simple_trading_system.vector_backtest import FRACTIONAL_UNIT, compute_stats, macd_warmup
+
+
+class SimulatedBroker:
+    """
+    模拟经纪商
+
+    提供与AlpacaTrader相同的账户、持仓和下单接口。市价单在下一根K线
+    开盘价成交（与backtesting.py一致），数量按fractional_unit向下取整，
+    开仓和平仓各收取一次commission比例的手续费。
+    """
+
+    def __init__(self,
+                 cash: float = 100000,
+                 commission: float = 0.002,
+                 fractional_unit: float = FRACTIONAL_UNIT):
+        """
+        初始化模拟经纪商
+
+        Args:
+            cash: 初始资金
+            commission: 手续费率
+            fractional_unit: 最小交易单位
+        """
+        self.initial_cash = cash
+        self.cash = cash
+        self.commission = commission
+        self.fractional_unit = fractional_unit
+
+        # 以最小交易单位计的持仓数量，避免浮点累积误差
+        self.units: Dict[str, int] = {}
+        self.entry_price: Dict[str, float] = {}
+        self.last_price: Dict[str, float] = {}
+        self.pending: List[dict] = []
+        self.fills: List[dict] = []
+        self._order_id = 0
+
+    def get_account_info(self) -> Dict:
+        """获取账户信息"""
+        equity = self.cash + sum(
+            units * self.fractional_unit * (self.last_price[symbol] - self.entry_price[symbol])
+            for symbol, units in self.units.items() if units
+        )
+        return {
+            'equity': equity,
+            'buying_power': self.cash,
+            'cash': self.cash,
+            'portfolio_value': equity
+        }
+
+    def get_positions(self) -> List[Dict]:
+        """获取当前持仓"""
+        return [
+            {
+                'symbol': symbol,
+                'qty': units * self.fractional_unit,
+                'avg_entry_price': self.entry_price[symbol],
+                'current_price': self.last_price[symbol],
+                'market_value': units * self.fractional_unit * self.last_price[symbol]
+            }
+            for symbol, units in self.units.items() if units
+        ]
+
+    def _submit(self, symbol: str, side: str, qty: Optional[float] = None,
+                notional: Optional[float] = None) -> Dict:
+        """加入待成交的市价单"""
+        self._order_id += 1
+        order = {
+            'order_id': str(self._order_id),
+            'symbol': symbol,
+            'qty': qty,
+            'notional': notional,
+            'side': side,
+            'order_type': 'market',
+            'status': 'accepted',
+            'submitted_at': None,
+            'filled_qty': 0.0,
+            'filled_avg_price': 0.0
+        }
+        self.pending.append(order)
+        return order
+
+    def buy_market(self, symbol: str, qty: float) -> Dict:
+        """市价买入"""
+        return self._submit(symbol, 'buy', qty=qty)
+
+    def sell_market(self, symbol: str, qty: float) -> Dict:
+        """市价卖出"""
+        return self._submit(symbol, 'sell', qty=qty)
+
+    def buy_notional(self, symbol: str, notional: float) -> Dict:
+        """按金额市价买入，成交时按成交价和手续费换算数量"""
+        return self._submit(symbol, 'buy', notional=notional)
+
+    def process_bar(self, symbol: str, bar: int, timestamp, open_price: float):
+        """
+        新K线开盘：按开盘价撮合待成交订单
+
+        Args:
+            symbol: 交易标的
+            bar: K线序号
+            timestamp: K线时间
+            open_price: 开盘价
+        """
+        self.last_price[symbol] = open_price
+        if not self.pending:
+            return
+
+        remaining = []
+        for order in self.pending:
+            if order['symbol'] != symbol:
+                remaining.append(order)
+                continue
+            self._fill(order, bar, timestamp, open_price)
+        self.pending = remaining
+
+    def _fill(self, order: dict, bar: int, timestamp, price: float):
+        """按price成交一笔订单，资金不足或数量为0时取消"""
+        symbol = order['symbol']
+        price_units = price * self.fractional_unit
+        held = self.units.get(symbol, 0)
+
+        if order['side'] == 'buy':
+            price_plus_commission = price_units + price_units * self.commission
+            if order['notional'] is not None:
+                units = int(order['notional'] // price_plus_commission)
+            else:
+                units = int(round(order['qty'] / self.fractional_unit))
+            if not units or units * price_plus_commission > self.cash:
+                order['status'] = 'canceled'
+                return
+            fee = units * price_units * self.commission
+            self.cash -= fee
+            # 新开仓或加仓时按成交量加权更新开仓均价
+            self.entry_price[symbol] = (
+                (held * self.entry_price.get(symbol, 0.0) + units * price) / (held + units)
+            )
+            self.units[symbol] = held + units
+        else:
+            units = min(held, int(round(order['qty'] / self.fractional_unit)))
+            if not units:
+                order['status'] = 'canceled'
+                return
+            fee = units * price_units * self.commission
+            self.cash += units * (price_units - self.entry_price[symbol] * self.fractional_unit) - fee
+            self.units[symbol] = held - units
+
+        order.update(status='filled', filled_qty=units * self.fractional_unit, filled_avg_price=price)
+        self.fills.append({
+            'bar': bar,
+            'timestamp': timestamp,
+            'symbol': symbol,
+            'side': order['side'],
+            'units': units,
+            'price': price,
+            'commission': fee,
+            'cash': self.cash
+        })
+
+
+class EventEngine:
+    """
+    事件驱动的策略执行引擎
+
+    K线逐根（on_bar）或整批（replay）驱动StreamingMACD，交叉信号通过
+    同一个_on_signal转换为订单交给经纪商：回测时使用SimulatedBroker，
+    实盘时换成AlpacaTrader即可。成交规则与MACD回测策略一致：只做多，
+    信号变化时下单，开仓金额为当前资金的position_size比例。
+    """
+
+    def __init__(self,
+                 strategy: StreamingMACD,
+                 broker,
+                 symbol: str = "BTCUSDT",
+                 position_size: float = 0.8):
+        """
+        初始化引擎
+
+        Args:
+            strategy: 增量MACD（未预热）
+            broker: 经纪商，SimulatedBroker或AlpacaTrader
+            symbol: 交易标的
+            position_size: 每次开仓使用的资金比例（0-1之间）；>= 1 时为固定单位数量
+        """
+        self.strategy = strategy
+        self.broker = broker
+        self.symbol = symbol
+        self.position_size = position_size
+
+        # 与MACD回测策略一致：预热结束后的下一根K线开始调用，且前 max(周期)+9 根不交易
+        periods = (strategy.fast_period, strategy.slow_period, strategy.signal_period)
+        lookback = strategy.slow_period + strategy.signal_period - 2
+        self.first_bar = max(1 + lookback, max(periods) + 9)
+
+        self.bars = 0
+        self._prev_signal = 0
+        self._pending_order = False
+        self._timestamps = []
+        self._closes = []
+        self.orders = []
+
+    @property
+    def _simulated(self) -> bool:
+        """经纪商是否需要逐根K线撮合"""
+        return hasattr(self.broker, 'process_bar')
+
+    def _position_qty(self) -> float:
+        """当前持仓数量"""
+        if isinstance(self.broker, SimulatedBroker):
+            return self.broker.units.get(self.symbol, 0) * self.broker.fractional_unit
+        for position in self.broker.get_positions():
+            if position['symbol'] == self.symbol:
+                return position['qty']
+        return 0.0
+
+    def _on_signal(self, signal: int, price: float):
+        """把交叉信号转换为订单，回放和实盘共用"""
+        prev, self._prev_signal = self._prev_signal, signal
+        if signal == 0 or signal == prev:
+            return
+
+        qty = self._position_qty()
+        if signal == 1 and not qty and not self._pending_order:
+            if self.position_size < 1:
+                notional = self.broker.get_account_info()['cash'] * self.position_size
+                order = self.broker.buy_notional(self.symbol, notional)
+            else:
+                # 与向量化回测一致：position_size >= 1 时买入 int(position_size) 个最小交易单位
+                fractional_unit = getattr(self.broker, 'fractional_unit', FRACTIONAL_UNIT)
+                order = self.broker.buy_market(self.symbol, int(self.position_size) * fractional_unit)
+        elif signal == -1 and qty > 0:
+            order = self.broker.sell_market(self.symbol, qty)
+        else:
+            return
+
+        self._pending_order = self._simulated
+        self.orders.append({'bar': self.bars, 'signal': signal, 'price': price, **order})
+
+    def _open(self, bar: int, timestamp, open_price: float):
+        """K线开盘：模拟经纪商撮合上一根K线提交的订单"""
+        if self._simulated:
+            self.broker.process_bar(self.symbol, bar, timestamp, open_price)
+            self._pending_order = False
+
+    def on_bar(self, timestamp, open_price: float, close_price: float) -> int:
+        """
+        处理一根新收盘的K线（实盘和逐根回放的入口）
+
+        Args:
+            timestamp: K线时间
+            open_price: 开盘价
+            close_price: 收盘价
+
+        Returns:
+            交叉信号
+        """
+        self._open(self.bars, timestamp, open_price)
+        signal = self.strategy.update(close_price)
+        self._timestamps.append(timestamp)
+        self._closes.append(close_price)
+
+        if self.bars >= self.first_bar:
+            self._on_signal(signal, close_price)
+        else:
+            self._prev_signal = signal
+        self.bars += 1
+        return signal
+
+    def replay(self, timestamps, open_prices, close_prices) -> dict:
+        """
+        批量回放历史K线
+
+        指标和交叉信号整批计算（与逐根on_bar结果一致），只在出现信号的K线
+        和其后一根K线（订单撮合）上进入事件循环，其余K线不产生事件。
+
+        Args:
+            timestamps: K线时间数组
+            open_prices: 开盘价数组
+            close_prices: 收盘价数组
+
+        Returns:
+            results()的回测结果字典
+        """
+        if self.bars:
+            raise RuntimeError("replay只能在新引擎上调用")
+
+        started = time.perf_counter()
+        open_prices = np.asarray(open_prices, dtype=np.float64)
+        close_prices = np.asarray(close_prices, dtype=np.float64)
+        n = len(close_prices)
+
+        signals = self.strategy.replay(close_prices)
+        self._timestamps = timestamps
+        self._closes = close_prices
+
+        # 信号变化的K线才可能下单
+        prev = np.r_[0, signals[:-1]]
+        events = np.flatnonzero((signals != 0) & (signals != prev))
+        events = events[events >= self.first_bar]
+
+        for bar in events:
+            self.bars = int(bar)
+            self._prev_signal = int(prev[bar])
+            self._on_signal(int(signals[bar]), close_prices[bar])
+            if self._pending_order and bar + 1 < n:
+                self._open(int(bar) + 1, timestamps[bar + 1], open_prices[bar + 1])
+
+        self.bars = n
+        self._prev_signal = int(signals[-1]) if n else 0
+        if self._simulated and n:
+            self.broker.last_price[self.symbol] = close_prices[-1]
+
+        elapsed = time.perf_counter() - started
+        print(f"回放 {n} 根K线, {len(events)} 个信号事件, 耗时 {elapsed:.3f}秒"
+              f" ({n / elapsed if elapsed > 0 else float('inf'):,.0f} 根/秒)")
+        return self.results()
+
+    def replay_storage(self, storage, symbol: str = None, start_date: str = None,
+                       end_date: str = None, interval: str = '1h') -> dict:
+        """
+        从DataStorage加载K线并回放
+
+        Args:
+            storage: DataStorage实例
+            symbol: 数据的交易对，默认使用引擎的symbol
+            start_date: 开始日期
+            end_date: 结束日期
+            interval: 时间间隔
+
+        Returns:
+            回测结果字典
+        """
+        arrays = storage.load_arrays(symbol or self.symbol, start_date, end_date, interval)
+        if not arrays:
+            raise ValueError("数据库中没有可回放的K线")
+        timestamps = pd.DatetimeIndex(np.asarray(arrays['ts']).astype('datetime64[ms]'))
+        return self.replay(timestamps, arrays['open'], arrays['close'])
+
+    def results(self) -> dict:
+        """
+        根据模拟经纪商的成交记录计算权益曲线、交易列表和统计指标
+
+        Returns:
+            包含统计结果(results)、权益曲线(equity_curve)和交易列表(trades)的字典
+        """
+        if not isinstance(self.broker, SimulatedBroker):
+            raise TypeError("只有SimulatedBroker可以计算回测结果")
+
+        broker = self.broker
+        index = pd.DatetimeIndex(self._timestamps)
+        close = np.asarray(self._closes, dtype=np.float64)
+        n = len(close)
+        fills = [fill for fill in broker.fills if fill['symbol'] == self.symbol]
+
+        # 每根K线的现金为该K线及之前最后一次成交后的余额，持仓按收盘价计值
+        fill_bars = np.array([0] + [fill['bar'] for fill in fills], dtype=np.int64)
+        balances = np.array([broker.initial_cash] + [fill['cash'] for fill in fills])
+        cash = balances[np.searchsorted(fill_bars, np.arange(n), side='right') - 1]
+        held = np.zeros(n)
+        entry = np.zeros(n)
+        trades = {name: [] for name in ('size', 'entry_bar', 'exit_bar', 'entry_price', 'exit_price',
+                                        'pnl', 'commission', 'return_pct')}
+        for k, fill in enumerate(fills):
+            if fill['side'] != 'buy':
+                continue
+            exit_fill = fills[k + 1] if k + 1 < len(fills) else None
+            exit_bar = exit_fill['bar'] if exit_fill else n
+            held[fill['bar']:exit_bar] = fill['units'] * broker.fractional_unit
+            entry[fill['bar']:exit_bar] = fill['price']
+            if exit_fill is None:
+                continue
+            size = fill['units'] * broker.fractional_unit
+            commissions = fill['commission'] + exit_fill['commission']
+            gross = size * (exit_fill['price'] - fill['price'])
+            trades['size'].append(size)
+            trades['entry_bar'].append(fill['bar'])
+            trades['exit_bar'].append(exit_bar)
+            trades['entry_price'].append(fill['price'])
+            trades['exit_price'].append(exit_fill['price'])
+            trades['pnl'].append(gross - commissions)
+            trades['commission'].append(commissions)
+            trades['return_pct'].append((exit_fill['price'] / fill['price'] - 1) - commissions / (size * fill['price']))
+
+        equity = cash + held * (close - entry)
+        trades = {name: np.array(values, dtype=np.int64 if name in ('entry_bar', 'exit_bar') else np.float64)
+                  for name, values in trades.items()}
+
+        strategy = self.strategy
+        warmup = macd_warmup(n, strategy.fast_period, strategy.slow_period, strategy.signal_period)
+        results = compute_stats(index, close, equity, trades, warmup)
+
+        trades_df = pd.DataFrame({
+            'Size': trades['size'],
+            'EntryBar': trades['entry_bar'],
+            'ExitBar': trades['exit_bar'],
+            'EntryPrice': trades['entry_price'],
+            'ExitPrice': trades['exit_price'],
+            'PnL': trades['pnl'],
+            'Commission': trades['commission'],
+            'ReturnPct': trades['return_pct'],
+            'EntryTime': index[trades['entry_bar']],
+            'ExitTime': index[trades['exit_bar']],
+        })
+
+        return {
+            'results': results,
+            'equity_curve': pd.Series(equity, index=index, name='Equity'),
+            'trades': trades_df
+        }
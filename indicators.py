@@ -0,0 +1,149 @@
+"""
+批量技术指标模块
+Batched Indicator Module
+"""
+
+from itertools import product
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import talib
+
+
+def parameter_grid(fast_periods: Iterable[int],
+                   slow_periods: Iterable[int],
+                   signal_periods: Iterable[int]) -> np.ndarray:
+    """
+    生成满足 快线周期 < 慢线周期 的MACD参数组合
+
+    Args:
+        fast_periods: 快速EMA周期集合
+        slow_periods: 慢速EMA周期集合
+        signal_periods: 信号线EMA周期集合
+
+    Returns:
+        形状为 (n_params, 3) 的整数数组，每行为 (fast, slow, signal)
+    """
+    combos = [
+        (fast, slow, signal)
+        for fast, slow, signal in product(fast_periods, slow_periods, signal_periods)
+        if fast < slow
+    ]
+    return np.array(combos, dtype=np.int64).reshape(-1, 3)
+
+
+def _shifted_ema(close: np.ndarray, period: int, offset: int) -> np.ndarray:
+    """从close[offset:]开始计算的EMA，前部补NaN对齐到原序列"""
+    result = np.full(len(close), np.nan)
+    if len(close) - offset >= period:
+        result[offset:] = talib.EMA(close[offset:], timeperiod=period)
+    return result
+
+
+def batch_macd(close, params) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    一次性计算多组参数的MACD
+
+    TA-Lib的MACD中，慢线EMA以前slow根价格的均值作为初值，快线EMA以
+    close[slow-fast:slow]的均值作为初值。因此每个(周期, 起点)的EMA只
+    计算一次：慢线按slow周期共享，快线按(fast, slow)共享，MACD线再在
+    不同signal周期之间共享。结果与逐组调用talib.MACD逐位一致。
+
+    Args:
+        close: 收盘价序列
+        params: 形状为 (n_params, 3) 的 (fast, slow, signal) 参数数组
+
+    Returns:
+        (macd, signal, histogram)，形状均为 (n_params, n_bars)
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    params = np.asarray(params, dtype=np.int64).reshape(-1, 3)
+    n_params, n_bars = len(params), len(close)
+
+    macd = np.empty((n_params, n_bars))
+    signal = np.empty((n_params, n_bars))
+
+    emas: Dict[Tuple[int, int], np.ndarray] = {}
+    macd_lines: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def ema(period: int, offset: int) -> np.ndarray:
+        key = (period, offset)
+        if key not in emas:
+            emas[key] = _shifted_ema(close, period, offset)
+        return emas[key]
+
+    for row, (fast, slow, signal_period) in enumerate(params):
+        fast, slow, signal_period = int(fast), int(slow), int(signal_period)
+        # 与talib一致：慢线周期小于快线周期时交换
+        if slow < fast:
+            fast, slow = slow, fast
+
+        key = (fast, slow)
+        if key not in macd_lines:
+            macd_lines[key] = ema(fast, slow - fast) - ema(slow, 0)
+        line = macd_lines[key]
+
+        # talib的三个输出共用同一个lookback
+        start = min(slow + signal_period - 2, n_bars)
+        macd[row] = line
+        macd[row, :start] = np.nan
+        if start < n_bars:
+            signal[row] = talib.EMA(line, timeperiod=signal_period)
+        signal[row, :start] = np.nan
+
+    return macd, signal, macd - signal
+
+
+def batch_crossover(macd: np.ndarray,
+                    signal: np.ndarray,
+                    initial_position: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    一次性计算多组参数的交叉信号矩阵
+
+    每一行的语义与 strategy._crossover_signals 完全一致。
+
+    Args:
+        macd: MACD线矩阵，形状为 (n_params, n_bars)
+        signal: 信号线矩阵，形状为 (n_params, n_bars)
+        initial_position: 尚未出现交叉时的仓位
+
+    Returns:
+        (signals, positions)，形状均为 (n_params, n_bars) 的int8矩阵
+    """
+    macd = np.atleast_2d(macd)
+    signal = np.atleast_2d(signal)
+    n_params, n_bars = macd.shape
+
+    signals = np.zeros((n_params, n_bars), dtype=np.int8)
+    positions = np.zeros((n_params, n_bars), dtype=np.int8)
+    if n_bars < 2:
+        return signals, positions
+
+    above = macd > signal
+    below = macd < signal
+    nan = np.isnan(macd) | np.isnan(signal)
+    valid = ~(nan[:, 1:] | nan[:, :-1])
+
+    # 两者均非NaN时 prev <= 等价于 not prev >
+    buy = valid & ~above[:, :-1] & above[:, 1:]
+    sell = valid & ~buy & ~below[:, :-1] & below[:, 1:]
+    signals[:, 1:] = buy.astype(np.int8) - sell.astype(np.int8)
+
+    # 仓位沿每一行向前延续最近一次信号。信号是稀疏的：在每个信号处记录
+    # 与上一个仓位的差值，再按行累加即可还原仓位
+    flat = np.flatnonzero(signals != 0)
+    rows = flat // n_bars
+    values = signals.reshape(-1)[flat]
+    previous = np.empty_like(values)
+    if len(values):
+        previous[0] = initial_position
+        previous[1:] = values[:-1]
+        # 每行的第一个信号从initial_position起算
+        previous[1:][rows[1:] != rows[:-1]] = initial_position
+    delta = np.zeros((n_params, n_bars), dtype=np.int8)
+    delta.reshape(-1)[flat] = values - previous
+    carried = np.cumsum(delta, axis=1, dtype=np.int8)
+    carried += np.int8(initial_position)
+    positions[:, 1:] = np.where(valid, carried[:, 1:], 0)
+
+    return signals, positions
@@ -0,0 +1,210 @@
+"""
+实盘K线调度模块
+Live Bar Scheduler Module
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .alpaca_trader import TIMEFRAME_SECONDS
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.alpaca_trader import TIMEFRAME_SECONDS
+
+
+def next_bar_close(now: float, period: float) -> float:
+    """
+    计算下一根K线的收盘时间（按UNIX纪元对齐，与交易所K线边界一致）
+
+    Args:
+        now: 当前UNIX时间（秒）
+        period: K线周期（秒）
+
+    Returns:
+        下一个收盘时间（秒）
+    """
+    return (now // period + 1) * period
+
+
+class LiveRunner:
+    """
+    按K线收盘时间调度的实盘运行器
+
+    一个asyncio事件循环驱动多个标的：每根K线收盘后（留出settle秒等待行情接口生成K线）
+    唤醒一次，并发为每个标的只请求上次处理之后新收盘的K线，逐根交给机器人的on_bar，
+    然后休眠到下一次收盘。K线还没有出现在行情接口中时按retry_delay重试，最多max_retries次。
+
+    行情请求和同步机器人的下单在线程池中执行，不阻塞事件循环；
+    AsyncTradingBot的on_bar直接在事件循环中等待。
+    """
+
+    def __init__(self,
+                 trader,
+                 timeframe: str = '1Hour',
+                 settle: float = 2.0,
+                 retry_delay: float = 1.0,
+                 max_retries: int = 10,
+                 period: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        初始化运行器
+
+        Args:
+            trader: 提供get_bars_after的交易客户端（AlpacaTrader）
+            timeframe: K线周期，'1Min', '5Min', '15Min', '1Hour', '1Day'
+            settle: 收盘后等待行情接口生成K线的时间（秒）
+            retry_delay: K线尚未生成时的重试间隔（秒）
+            max_retries: 每次收盘的最大重试次数
+            period: K线周期秒数，默认由timeframe推导
+            clock: 返回UNIX时间（秒）的时钟
+        """
+        self.trader = trader
+        self.timeframe = timeframe
+        self.period = period or TIMEFRAME_SECONDS[timeframe]
+        self.settle = settle
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.clock = clock
+        self.symbols: Dict[str, dict] = {}
+        self._stopping = False
+
+    def add_symbol(self, symbol: str, bot, last_bar_time=None):
+        """
+        添加一个标的
+
+        Args:
+            symbol: 交易标的
+            bot: 已绑定增量MACD的TradingBot或AsyncTradingBot
+            last_bar_time: 预热数据中最后一根已收盘K线的时间（见closed_bars），为None时从下一次收盘的K线开始
+        """
+        self.symbols[symbol] = {
+            'bot': bot,
+            'last_bar_time': None if last_bar_time is None else pd.Timestamp(last_bar_time),
+            'bars': 0,
+            'fetches': 0,
+            'signals': 0,
+            'latency': []
+        }
+
+    def stop(self):
+        """在当前收盘处理完成后停止"""
+        self._stopping = True
+
+    async def _wait_until(self, target: float):
+        """休眠到目标时间"""
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    async def _poll_symbol(self, symbol: str, close_time: float) -> int:
+        """获取一个标的新收盘的K线并交给机器人，返回处理的K线数量"""
+        state = self.symbols[symbol]
+        bot = state['bot']
+        loop = asyncio.get_running_loop()
+
+        after = state['last_bar_time']
+        if after is None:
+            # 尚未处理过K线时，只取刚收盘的这一根（after为它前一根K线的开盘时间）
+            after = pd.Timestamp(close_time - 2 * self.period, unit='s', tz='UTC').round('ms')
+
+        bars = None
+        for attempt in range(self.max_retries + 1):
+            bars = await loop.run_in_executor(None, self.trader.get_bars_after, symbol, self.timeframe, after)
+            state['fetches'] += 1
+            if len(bars):
+                # 只处理已收盘的K线（忽略接口返回的未完成K线）
+                index = bars.index if bars.index.tz is not None else bars.index.tz_localize('UTC')
+                bars = bars[index.asi8 / 1e9 + self.period <= close_time + 1e-6]
+            if len(bars) or attempt == self.max_retries:
+                break
+            await asyncio.sleep(self.retry_delay)
+
+        for bar_time, bar in bars.iterrows():
+            if asyncio.iscoroutinefunction(bot.on_bar):
+                signal = await bot.on_bar(bar['Close'])
+            else:
+                signal = await loop.run_in_executor(None, bot.on_bar, bar['Close'])
+            state['last_bar_time'] = bar_time
+            state['bars'] += 1
+
+            if signal != 0:
+                state['signals'] += 1
+                print(f"{symbol} 检测到信号: {signal} @ ${bar['Close']:.2f}")
+
+        if len(bars):
+            state['latency'].append(self.clock() - close_time)
+        else:
+            print(f"{symbol} 在收盘后未获取到新K线")
+        return len(bars)
+
+    async def run_once(self) -> Dict[str, int]:
+        """
+        等待下一次K线收盘并处理所有标的
+
+        Returns:
+            每个标的处理的K线数量
+        """
+        close_time = next_bar_close(self.clock(), self.period)
+        await self._wait_until(close_time + self.settle)
+
+        symbols = list(self.symbols)
+        results = await asyncio.gather(*(self._poll_symbol(symbol, close_time) for symbol in symbols),
+                                       return_exceptions=True)
+
+        processed = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"{symbol} 处理K线失败: {result}")
+                result = 0
+            processed[symbol] = result
+        return processed
+
+    async def run(self, max_closes: Optional[int] = None):
+        """
+        持续按K线收盘运行
+
+        Args:
+            max_closes: 最多处理的收盘次数，None为一直运行直到stop()
+        """
+        self._stopping = False
+        print(f"实盘调度启动: {len(self.symbols)} 个标的, 周期 {self.period:g}秒")
+
+        closes = 0
+        while not self._stopping and (max_closes is None or closes < max_closes):
+            await self.run_once()
+            closes += 1
+
+    def stats(self) -> pd.DataFrame:
+        """
+        每个标的的运行统计
+
+        Returns:
+            包含处理K线数、请求次数、信号数和收盘到处理完成延迟的DataFrame
+        """
+        rows = []
+        for symbol, state in self.symbols.items():
+            latency = np.array(state['latency'])
+            rows.append({
+                'symbol': symbol,
+                'bars': state['bars'],
+                'fetches': state['fetches'],
+                'signals': state['signals'],
+                'last_bar_time': state['last_bar_time'],
+                'latency_mean': latency.mean() if len(latency) else np.nan,
+                'latency_max': latency.max() if len(latency) else np.nan
+            })
+        return pd.DataFrame(rows)
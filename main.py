@@ -14,10 +14,11 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from simple_trading_system.config import config
-from simple_trading_system.data_provider import get_bitcoin_data, BinanceDataProvider, DataStorage
+from simple_trading_system.data_provider import get_bitcoin_data, sync_symbols, BinanceDataProvider, DataStorage
 from simple_trading_system.strategy import MACDStrategy
 from simple_trading_system.backtest import run_simple_backtest, optimize_macd_strategy, BacktestRunner
-from simple_trading_system.alpaca_trader import AlpacaTrader, TradingBot
+from simple_trading_system.alpaca_trader import AlpacaTrader, TradingBot, closed_bars
+from simple_trading_system.live_runner import LiveRunner
 
 
 def show_menu():
@@ -163,53 +164,52 @@ def live_trading_menu():
         return
     
     try:
-        symbol = input("请输入交易标的 (默认AAPL): ") or "AAPL"
+        symbols = input("请输入交易标的，多个用逗号分隔 (默认AAPL): ") or "AAPL"
+        symbols = [s.strip().upper() for s in symbols.split(',') if s.strip()]
         
-        # 创建交易机器人
-        bot = TradingBot(symbol=symbol)
-        
-        print(f"交易机器人已启动，监控标的: {symbol}")
-        print("按 Ctrl+C 停止交易")
-        
-        # 获取历史数据用于策略计算
+        # 所有标的共用一个交易客户端
         trader = AlpacaTrader()
-        data = trader.get_market_data(symbol, timeframe='1Hour', limit=100)
         
-        # 创建策略实例
+        # 订阅交易推送，成交后持仓由推送更新，不再每个信号查询一次
+        try:
+            trader.start_trade_stream()
+        except Exception as e:
+            print(f"交易推送不可用，使用REST查询持仓: {e}")
+        
+        # 每根1小时K线收盘时唤醒，只获取新收盘的K线
+        runner = LiveRunner(trader, timeframe='1Hour')
+        bots = {}
         strategy = MACDStrategy()
+        for symbol in symbols:
+            bot = TradingBot(symbol=symbol, trader=trader)
+            
+            # 用已收盘的历史K线一次性预热增量MACD，之后每根新K线常数时间更新；
+            # 形成中的最后一根K线留给运行器在收盘后获取
+            data = closed_bars(trader.get_market_data(symbol, timeframe='1Hour', limit=100), '1Hour')
+            if data.empty:
+                # 没有已收盘的K线（新上市或接口暂无数据）：从下一次收盘的K线开始预热
+                print(f"{symbol} 没有可用于预热的已收盘K线，将从下一根收盘K线开始")
+            bot.attach_stream(strategy.create_stream(data['Close']))
+            runner.add_symbol(symbol, bot, last_bar_time=None if data.empty else data.index[-1])
+            bots[symbol] = bot
+        
+        print(f"交易机器人已启动，监控标的: {', '.join(symbols)}")
+        print("按 Ctrl+C 停止交易")
         
-        print("开始实时监控...")
-        
-        import time
-        while True:
-            try:
-                # 获取最新数据
-                current_data = trader.get_market_data(symbol, timeframe='1Hour', limit=50)
-                
-                # 生成信号
-                signals_df = strategy.generate_signals(current_data)
-                latest_signal = signals_df['Signal'].iloc[-1]
-                current_price = current_data['Close'].iloc[-1]
-                
-                if latest_signal != 0:
-                    print(f"检测到信号: {latest_signal} @ ${current_price:.2f}")
-                    bot.execute_signal(latest_signal, current_price)
-                
-                # 等待5分钟
-                time.sleep(300)
-                
-            except KeyboardInterrupt:
-                print("\n交易已停止")
-                break
-            except Exception as e:
-                print(f"交易过程中出错: {e}")
-                time.sleep(60)  # 出错后等待1分钟再继续
+        import asyncio
+        try:
+            asyncio.run(runner.run())
+        except KeyboardInterrupt:
+            print("\n交易已停止")
+        
+        trader.stop_trade_stream()
         
         # 显示交易摘要
-        summary = bot.get_trade_summary()
         print(f"\n交易摘要:")
-        print(f"总交易次数: {summary['total_trades']}")
-        print(f"当前持仓: {summary['current_position']}")
+        print(runner.stats().to_string(index=False))
+        for symbol, bot in bots.items():
+            summary = bot.get_trade_summary()
+            print(f"{symbol}: 总交易次数 {summary['total_trades']}, 当前持仓 {bot.position}")
         
     except Exception as e:
         print(f"实时交易失败: {e}")
@@ -312,11 +312,14 @@ def main():
 def cli_main():
     """命令行接口"""
     parser = argparse.ArgumentParser(description='简化量化交易系统')
-    parser.add_argument('--mode', choices=['data', 'backtest', 'optimize', 'live'], 
+    parser.add_argument('--mode', choices=['data', 'sync', 'migrate', 'backtest', 'optimize', 'live'], 
                        help='运行模式')
     parser.add_argument('--days', type=int, default=30, help='数据天数')
     parser.add_argument('--cash', type=float, default=10000, help='初始资金')
     parser.add_argument('--symbol', default='AAPL', help='交易标的')
+    parser.add_argument('--symbols', default=config.SYMBOL, help='增量同步的交易对，逗号分隔')
+    parser.add_argument('--interval', default='1h', help='K线周期')
+    parser.add_argument('--vacuum', action='store_true', help='迁移完成后VACUUM回收数据库空间')
     
     args = parser.parse_args()
     
@@ -325,6 +328,28 @@ def cli_main():
         df = get_bitcoin_data(days=args.days)
         print(f"数据获取完成，共 {len(df)} 条记录")
         
+    elif args.mode == 'sync':
+        symbols = [s.strip() for s in args.symbols.split(',') if s.strip()]
+        print(f"增量同步 {len(symbols)} 个交易对的 {args.interval} 数据...")
+        try:
+            results = sync_symbols(symbols, interval=args.interval, days=args.days)
+        except ValueError as e:
+            # 无效的时间间隔：以非零状态退出，便于定时任务发现
+            sys.exit(f"同步失败: {e}")
+        print(f"同步完成，共新增 {sum(n or 0 for n in results.values())} 条记录")
+        failed = [symbol for symbol, count in results.items() if count is None]
+        if failed:
+            # 其余交易对已同步，最后以非零状态退出并列出失败的交易对
+            sys.exit(f"以下交易对同步失败: {', '.join(failed)}")
+        
+    elif args.mode == 'migrate':
+        with DataStorage() as storage:
+            if not storage.needs_migration():
+                print("数据库已是最新结构，无需迁移")
+            else:
+                print("迁移v1 K线数据到v2结构，中断后重新运行会从剩余的数据继续...")
+                storage.migrate_to_v2(vacuum=args.vacuum)
+        
     elif args.mode == 'backtest':
         print(f"运行 {args.days} 天回测，初始资金 ${args.cash}")
         result = run_simple_backtest(days=args.days, cash=args.cash)
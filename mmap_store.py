@@ -0,0 +1,250 @@
+"""
+内存映射NumPy K线存储
+Memory-mapped NumPy Bar Store
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# 列文件及其固定宽度的数据类型
+COLUMN_DTYPES = {
+    'ts': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.float64,
+}
+
+# 新建列文件时的最小容量
+MIN_CAPACITY = 1024
+
+HEADER_VERSION = 1
+
+
+class MmapBarStore:
+    """
+    每个交易对/周期一组内存映射的.npy列文件
+
+    目录结构为 root/<symbol>/<interval>/{ts,open,high,low,close,volume}.npy
+    加 header.json。列文件按容量预分配，header中的rows记录有效行数；
+    读取时直接返回只读内存映射的切片视图，多个进程映射同一文件时共享页缓存。
+    """
+
+    def __init__(self, root: str):
+        """
+        初始化存储目录
+
+        Args:
+            root: 存储根目录
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _series_dir(self, symbol: str, interval: str) -> Path:
+        """交易对/周期对应的目录"""
+        return self.root / symbol / interval
+
+    def read_header(self, symbol: str, interval: str) -> Optional[dict]:
+        """读取header，不存在时返回None"""
+        path = self._series_dir(symbol, interval) / 'header.json'
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_header(self, directory: Path, rows: int, capacity: int, ts: np.ndarray):
+        """在列数据写入完成后原子更新header"""
+        header = {
+            'version': HEADER_VERSION,
+            'rows': int(rows),
+            'capacity': int(capacity),
+            'first_ts': int(ts[0]) if rows else None,
+            'last_ts': int(ts[rows - 1]) if rows else None,
+        }
+        tmp_path = directory / f".header.json.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, directory / 'header.json')
+
+    def _write_columns(self, directory: Path, columns: Dict[str, np.ndarray], capacity: int):
+        """以给定容量重写全部列文件"""
+        directory.mkdir(parents=True, exist_ok=True)
+        rows = len(columns['ts'])
+
+        for name, dtype in COLUMN_DTYPES.items():
+            tmp_path = directory / f".{name}.npy.{os.getpid()}.tmp"
+            array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(capacity,))
+            array[:rows] = columns[name]
+            array.flush()
+            del array
+            os.replace(tmp_path, directory / f"{name}.npy")
+
+        self._write_header(directory, rows, capacity, columns['ts'])
+
+    @staticmethod
+    def _columns_from_frame(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """将OHLCV DataFrame转换为按时间排序去重的列数组"""
+        ts = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        values = df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=np.float64)
+
+        ts, first = np.unique(ts, return_index=True)
+        values = values[first]
+        return {
+            'ts': ts,
+            'open': values[:, 0],
+            'high': values[:, 1],
+            'low': values[:, 2],
+            'close': values[:, 3],
+            'volume': values[:, 4],
+        }
+
+    def save_bars(self, df: pd.DataFrame, symbol: str, interval: str) -> int:
+        """
+        保存K线，已存在的时间戳保留原值
+
+        新数据全部晚于已有数据时直接追加到预分配的空间（不足时按倍数扩容），
+        否则合并后重写列文件。
+
+        Args:
+            df: 以时间为索引的OHLCV DataFrame
+            symbol: 交易对符号
+            interval: 时间间隔
+
+        Returns:
+            新写入的K线数量
+        """
+        if df.empty:
+            return 0
+
+        directory = self._series_dir(symbol, interval)
+        new = self._columns_from_frame(df)
+        header = self.read_header(symbol, interval)
+
+        if header is None or header['rows'] == 0:
+            capacity = max(MIN_CAPACITY, len(new['ts']))
+            self._write_columns(directory, new, capacity)
+            return len(new['ts'])
+
+        rows, capacity = header['rows'], header['capacity']
+
+        if new['ts'][0] > header['last_ts']:
+            needed = rows + len(new['ts'])
+            if needed <= capacity:
+                # 原地追加
+                for name, dtype in COLUMN_DTYPES.items():
+                    array = np.load(directory / f"{name}.npy", mmap_mode='r+')
+                    array[rows:needed] = new[name]
+                    array.flush()
+                    del array
+                ts = np.load(directory / 'ts.npy', mmap_mode='r')
+                self._write_header(directory, needed, capacity, ts)
+                return len(new['ts'])
+
+            existing = self.load_arrays(symbol, interval)
+            merged = {name: np.concatenate([existing[name], new[name]]) for name in COLUMN_DTYPES}
+            self._write_columns(directory, merged, max(capacity * 2, needed))
+            return len(new['ts'])
+
+        # 与已有数据重叠：合并去重，已有数据优先
+        existing = self.load_arrays(symbol, interval)
+        ts = np.concatenate([existing['ts'], new['ts']])
+        ts, first = np.unique(ts, return_index=True)
+        merged = {'ts': ts}
+        for name in COLUMN_DTYPES:
+            if name != 'ts':
+                merged[name] = np.concatenate([existing[name], new[name]])[first]
+
+        self._write_columns(directory, merged, max(capacity, len(ts)))
+        return len(ts) - rows
+
+    def load_arrays(self, symbol: str, interval: str,
+                    start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        以只读内存映射视图的形式读取K线列，不做任何解析或拷贝
+
+        Args:
+            symbol: 交易对符号
+            interval: 时间间隔
+            start_ms: 开始时间戳(毫秒)，包含
+            end_ms: 结束时间戳(毫秒)，包含
+
+        Returns:
+            列名到数组视图的字典，无数据时为空字典
+        """
+        header = self.read_header(symbol, interval)
+        if header is None or header['rows'] == 0:
+            return {}
+
+        directory = self._series_dir(symbol, interval)
+        rows = header['rows']
+        columns = {
+            name: np.load(directory / f"{name}.npy", mmap_mode='r')[:rows]
+            for name in COLUMN_DTYPES
+        }
+
+        lo = 0 if start_ms is None else int(np.searchsorted(columns['ts'], start_ms, side='left'))
+        hi = rows if end_ms is None else int(np.searchsorted(columns['ts'], end_ms, side='right'))
+        return {name: array[lo:hi] for name, array in columns.items()}
+
+    def load_bars(self, symbol: str, interval: str,
+                  start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> pd.DataFrame:
+        """
+        读取K线为DataFrame
+
+        Returns:
+            以时间为索引的OHLCV DataFrame，无数据时返回空DataFrame
+        """
+        columns = self.load_arrays(symbol, interval, start_ms, end_ms)
+        if not columns or len(columns['ts']) == 0:
+            return pd.DataFrame()
+
+        return pd.DataFrame({
+            'Open': columns['open'],
+            'High': columns['high'],
+            'Low': columns['low'],
+            'Close': columns['close'],
+            'Volume': columns['volume'],
+        }, index=pd.DatetimeIndex(pd.to_datetime(columns['ts'], unit='ms'), name='timestamp'))
+
+    def latest_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        """最新K线开盘时间戳(毫秒)，没有数据时返回None"""
+        header = self.read_header(symbol, interval)
+        return header['last_ts'] if header else None
+
+    def find_gaps(self, symbol: str, interval: str, interval_ms: int) -> List[tuple]:
+        """查找内部缺失的K线区间 [(开始时间戳, 结束时间戳)]"""
+        columns = self.load_arrays(symbol, interval)
+        if not columns:
+            return []
+
+        ts = columns['ts']
+        idx = np.flatnonzero(np.diff(ts) > interval_ms)
+        return [(int(ts[i]) + interval_ms, int(ts[i + 1]) - interval_ms) for i in idx]
+
+    def mark_empty(self, symbol: str, interval: str, ranges: List[tuple]):
+        """记录已确认交易所没有K线的区间（保存在empty_ranges.json）"""
+        directory = self._series_dir(symbol, interval)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        merged = dict(self.empty_ranges(symbol, interval))
+        merged.update((int(start), int(end)) for start, end in ranges)
+
+        tmp_path = directory / f".empty_ranges.json.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sorted(merged.items()), f)
+        os.replace(tmp_path, directory / 'empty_ranges.json')
+
+    def empty_ranges(self, symbol: str, interval: str) -> List[tuple]:
+        """已确认交易所没有K线的区间 [(开始时间戳, 结束时间戳)]"""
+        path = self._series_dir(symbol, interval) / 'empty_ranges.json'
+        if not path.exists():
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return [tuple(item) for item in json.load(f)]
@@ -0,0 +1,832 @@
+"""
+并行参数优化模块
+Parallel Parameter Optimization Module
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .indicators import parameter_grid, batch_macd, batch_crossover
+    from .vector_backtest import simulate_long_only, compute_stats, macd_warmup, first_decision_bar
+    from .result_cache import ResultCache, data_fingerprint, params_key, PARAM_KEYS, ENGINE_VECTORIZED
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.indicators import parameter_grid, batch_macd, batch_crossover
+    from simple_trading_system.vector_backtest import (
+        simulate_long_only, compute_stats, macd_warmup, first_decision_bar
+    )
+    from simple_trading_system.result_cache import ResultCache, data_fingerprint, params_key, PARAM_KEYS, ENGINE_VECTORIZED
+
+
+# 发布到共享内存的列
+SHARED_COLUMNS = ('ts', 'open', 'close')
+
+
+class SharedBars:
+    """
+    把K线数组一次性发布到共享内存
+
+    工作进程按名称映射同一块内存，不需要为每个任务序列化整份数据。
+    """
+
+    def __init__(self, data: pd.DataFrame, extra: Optional[Dict[str, np.ndarray]] = None):
+        """
+        创建共享内存块并拷贝数据
+
+        Args:
+            data: 以时间为索引的OHLCV DataFrame
+            extra: 需要一起发布的其他数组（如预先计算的信号矩阵）
+        """
+        arrays = {
+            'ts': data.index.values.astype('datetime64[ns]').astype(np.int64),
+            'open': data['Open'].to_numpy(dtype=np.float64),
+            'close': data['Close'].to_numpy(dtype=np.float64),
+        }
+        for name, array in (extra or {}).items():
+            arrays[name] = np.ascontiguousarray(array)
+
+        self._blocks = []
+        self.spec = {}
+        try:
+            for name, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def attach(spec: dict):
+        """
+        在工作进程中映射共享内存
+
+        Returns:
+            (列名到数组的字典, 需要保持引用的共享内存对象列表)
+        """
+        arrays, blocks = {}, []
+        for name, (block_name, shape, dtype) in spec.items():
+            # 进程池的子进程与父进程共用同一个resource tracker，由创建方负责回收
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        return arrays, blocks
+
+    def close(self):
+        """释放并删除共享内存块"""
+        for block in self._blocks:
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# 工作进程中映射好的数据
+_worker_state: Dict[str, object] = {}
+
+
+def _init_worker(spec: dict, cash: float, commission: float):
+    """工作进程初始化：映射共享内存中的K线"""
+    arrays, blocks = SharedBars.attach(spec)
+    _worker_state.update(
+        blocks=blocks,
+        index=pd.DatetimeIndex(arrays['ts'].view('datetime64[ns]')),
+        open=arrays['open'],
+        close=arrays['close'],
+        cash=cash,
+        commission=commission,
+    )
+
+
+def evaluate_parameters(index: pd.Index,
+                        open_prices: np.ndarray,
+                        close_prices: np.ndarray,
+                        chunk: np.ndarray,
+                        position_sizes: tuple,
+                        cash: float,
+                        commission: float) -> list:
+    """
+    评估一组MACD参数
+
+    同一组(fast, slow, signal)的信号只计算一次，再分别模拟每个仓位大小。
+
+    Args:
+        index: K线时间索引
+        open_prices: 开盘价数组
+        close_prices: 收盘价数组
+        chunk: 形状为 (k, 3) 的 (fast, slow, signal) 参数数组
+        position_sizes: 仓位大小集合
+        cash: 初始资金
+        commission: 手续费率
+
+    Returns:
+        每个参数组合的结果字典列表
+    """
+    n = len(close_prices)
+
+    macd, signal, _ = batch_macd(close_prices, chunk)
+    signals, _ = batch_crossover(macd, signal)
+
+    results = []
+    for row, (fast, slow, signal_period) in enumerate(chunk):
+        fast, slow, signal_period = int(fast), int(slow), int(signal_period)
+        warmup = macd_warmup(n, fast, slow, signal_period)
+        first_bar = first_decision_bar(n, fast, slow, signal_period)
+
+        for position_size in position_sizes:
+            simulation = simulate_long_only(
+                open_prices, close_prices, signals[row],
+                position_size=position_size, cash=cash,
+                commission=commission, first_bar=first_bar
+            )
+            stats = compute_stats(index, close_prices, simulation['equity'],
+                                  simulation['trades'], warmup)
+            results.append({
+                'fast_period': fast,
+                'slow_period': slow,
+                'signal_period': signal_period,
+                'position_size': position_size,
+                **stats
+            })
+
+    return results
+
+
+def _evaluate_chunk(chunk: np.ndarray, position_sizes: tuple) -> list:
+    """在工作进程中用共享内存中的K线评估一组MACD参数"""
+    state = _worker_state
+    return evaluate_parameters(state['index'], state['open'], state['close'], chunk,
+                               position_sizes, state['cash'], state['commission'])
+
+
+def _init_batch_worker(specs: Dict[str, dict], cash: float, commission: float):
+    """批量比较的工作进程初始化：映射每个交易对共享内存中的K线"""
+    blocks, bars = [], {}
+    for symbol, spec in specs.items():
+        arrays, symbol_blocks = SharedBars.attach(spec)
+        blocks.extend(symbol_blocks)
+        bars[symbol] = (pd.DatetimeIndex(arrays['ts'].view('datetime64[ns]')),
+                        arrays['open'], arrays['close'])
+    _worker_state.update(blocks=blocks, bars=bars, cash=cash, commission=commission)
+
+
+def _evaluate_job(job: dict) -> tuple:
+    """在工作进程中评估一个(交易对, 时间窗口, 策略参数)任务，返回(统计指标, 耗时秒数)"""
+    started = time.perf_counter()
+    index, open_prices, close_prices = _worker_state['bars'][job['symbol']]
+    start, end = job['start_bar'], job['end_bar']
+    chunk = np.array([[job['fast_period'], job['slow_period'], job['signal_period']]], dtype=np.int64)
+    result = evaluate_parameters(index[start:end], open_prices[start:end], close_prices[start:end],
+                                 chunk, (job['position_size'],),
+                                 _worker_state['cash'], _worker_state['commission'])[0]
+    metrics = {key: value for key, value in result.items() if key not in PARAM_KEYS}
+    return metrics, time.perf_counter() - started
+
+
+def _as_index_time(index: pd.DatetimeIndex, value) -> pd.Timestamp:
+    """把窗口端点转换为与K线索引相同的时区表示，无时区的索引按UTC处理"""
+    value = pd.Timestamp(value)
+    if index.tz is None and value.tzinfo is not None:
+        return value.tz_convert('UTC').tz_localize(None)
+    if index.tz is not None and value.tzinfo is None:
+        return value.tz_localize('UTC').tz_convert(index.tz)
+    return value
+
+
+def _window_bounds(index: pd.DatetimeIndex, window: tuple) -> tuple:
+    """时间窗口(start, end)对应的K线切片范围，两端均包含，None表示不限"""
+    start, end = window
+    start_bar = 0 if start is None else int(index.searchsorted(_as_index_time(index, start), side='left'))
+    end_bar = len(index) if end is None else int(index.searchsorted(_as_index_time(index, end), side='right'))
+    return start_bar, end_bar
+
+
+def compare_batch(datasets: Dict[str, pd.DataFrame],
+                  windows: Iterable[tuple],
+                  strategy_configs: Iterable[dict],
+                  cash: float = 10000,
+                  commission: float = 0.002,
+                  max_workers: Optional[int] = None,
+                  mp_context=None,
+                  cache: Optional[ResultCache] = None,
+                  progress_callback: Optional[Callable[[int, int], None]] = None) -> pd.DataFrame:
+    """
+    在进程池中批量比较 交易对 × 时间窗口 × 策略参数
+
+    每个交易对的K线只通过共享内存发布一次，工作进程按窗口切片后用向量化
+    引擎回测，每个任务单独计时。配置了结果缓存时，命中的任务不再重新评估。
+
+    Args:
+        datasets: 交易对到OHLCV数据的字典
+        windows: (start, end) 时间窗口列表，两端均包含，None表示不限
+        strategy_configs: 策略参数字典列表
+        cash: 初始资金
+        commission: 手续费率
+        max_workers: 工作进程数，None为CPU核数
+        mp_context: multiprocessing上下文
+        cache: 结果缓存
+        progress_callback: 进度回调，参数为(已完成任务数, 总任务数)
+
+    Returns:
+        每个任务一行的结果DataFrame，包含交易对、窗口、策略参数、统计指标和耗时(seconds)
+    """
+    windows = list(windows)
+    strategy_configs = list(strategy_configs)
+
+    jobs = []
+    for symbol, data in datasets.items():
+        for window in windows:
+            start_bar, end_bar = _window_bounds(data.index, window)
+            if end_bar - start_bar < 2:
+                print(f"警告: {symbol} 在窗口 {window} 内没有足够的数据，已跳过")
+                continue
+            fingerprint = None
+            if cache is not None:
+                fingerprint = data_fingerprint(data.iloc[start_bar:end_bar], symbol=symbol)
+            for params in strategy_configs:
+                jobs.append({
+                    'symbol': symbol,
+                    'window_start': data.index[start_bar],
+                    'window_end': data.index[end_bar - 1],
+                    'bars': end_bar - start_bar,
+                    'start_bar': start_bar,
+                    'end_bar': end_bar,
+                    'fingerprint': fingerprint,
+                    **{key: params[key] for key in PARAM_KEYS}
+                })
+
+    total = len(jobs)
+    rows = []
+    pending_jobs = []
+    for job in jobs:
+        metrics = None
+        if cache is not None:
+            metrics = cache.get(job['fingerprint'], job, cash, commission, engine=ENGINE_VECTORIZED)
+        if metrics is None:
+            pending_jobs.append(job)
+        else:
+            rows.append({**job, **metrics, 'seconds': 0.0, 'cached': True})
+    if rows and progress_callback:
+        progress_callback(len(rows), total)
+
+    started = time.perf_counter()
+    if pending_jobs:
+        symbols = sorted({job['symbol'] for job in pending_jobs})
+        shared = {}
+        try:
+            for symbol in symbols:
+                shared[symbol] = SharedBars(datasets[symbol])
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=mp_context,
+                initializer=_init_batch_worker,
+                initargs=({symbol: bars.spec for symbol, bars in shared.items()}, cash, commission)
+            ) as executor:
+                futures = {executor.submit(_evaluate_job, job): job for job in pending_jobs}
+                pending = set(futures)
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        job = futures[future]
+                        metrics, seconds = future.result()
+                        rows.append({**job, **metrics, 'seconds': seconds, 'cached': False})
+                        if cache is not None:
+                            cache.put(job['fingerprint'], job, cash, commission, metrics, engine=ENGINE_VECTORIZED)
+                        if progress_callback:
+                            progress_callback(len(rows), total)
+        finally:
+            for bars in shared.values():
+                bars.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"批量比较完成: {total} 个任务 ({total - len(pending_jobs)} 个命中缓存), 耗时 {elapsed:.2f}秒")
+
+    if not rows:
+        return pd.DataFrame()
+
+    columns = ['symbol', 'window_start', 'window_end', 'bars', *PARAM_KEYS]
+    df = pd.DataFrame(rows).drop(columns=['start_bar', 'end_bar', 'fingerprint'])
+    df = df.sort_values(columns[:3] + list(PARAM_KEYS), kind='stable').reset_index(drop=True)
+    df = df[columns + [column for column in df.columns if column not in columns]]
+
+    slowest = df[~df['cached']].nlargest(5, 'seconds')
+    if not slowest.empty:
+        print("耗时最长的任务:")
+    for _, row in slowest.iterrows():
+        print(f"  {row['symbol']} {row['window_start']} ~ {row['window_end']} "
+              f"({row['fast_period']}, {row['slow_period']}, {row['signal_period']}, "
+              f"{row['position_size']}): {row['seconds']:.3f}秒")
+
+    return df
+
+
+class ParallelOptimizer:
+    """
+    基于进程池的MACD参数网格优化器
+
+    K线只通过共享内存发布一次，参数网格按块分发给工作进程，
+    每完成一块就立即返回其结果。
+    """
+
+    def __init__(self,
+                 data: pd.DataFrame,
+                 cash: float = 100000,
+                 commission: float = 0.002,
+                 max_workers: Optional[int] = None,
+                 chunk_size: int = 8,
+                 mp_context=None,
+                 cache: Optional[ResultCache] = None):
+        """
+        初始化优化器
+
+        Args:
+            data: OHLCV数据
+            cash: 初始资金
+            commission: 手续费率
+            max_workers: 工作进程数，None为CPU核数
+            chunk_size: 每个任务包含的(fast, slow, signal)组合数
+            mp_context: multiprocessing上下文
+            cache: 结果缓存，命中的参数组合不再重新评估
+        """
+        self.data = data
+        self.cash = cash
+        self.commission = commission
+        self.max_workers = max_workers
+        self.chunk_size = max(1, int(chunk_size))
+        self.mp_context = mp_context
+        self.cache = cache
+        self.fingerprint = data_fingerprint(data) if cache is not None else None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        取消优化，尚未开始的任务不再执行
+
+        可以在迭代开始之前调用；取消是一次性的，之后需要新建优化器才能重新运行。
+        """
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已请求取消"""
+        return self._cancel.is_set()
+
+    def iter_results(self,
+                     fast_periods: Iterable[int],
+                     slow_periods: Iterable[int],
+                     signal_periods: Iterable[int],
+                     position_sizes: Iterable[float] = (0.8,),
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> Iterator[dict]:
+        """
+        按完成顺序逐个产出参数组合的结果
+
+        只评估满足 fast_period < slow_period 的组合。配置了结果缓存时，
+        先产出命中的组合，只把未命中的组合交给进程池，完成后写回缓存。
+
+        Args:
+            fast_periods: 快速EMA周期集合
+            slow_periods: 慢速EMA周期集合
+            signal_periods: 信号线EMA周期集合
+            position_sizes: 仓位大小集合
+            progress_callback: 进度回调，参数为(已完成组合数, 总组合数)
+
+        Yields:
+            单个参数组合的结果字典
+        """
+        position_sizes = tuple(float(size) for size in position_sizes)
+        grid = parameter_grid(fast_periods, slow_periods, signal_periods)
+        total = len(grid) * len(position_sizes)
+        if total == 0:
+            return
+
+        done = 0
+        rows = [tuple(int(value) for value in row) for row in grid]
+        missing = {row: position_sizes for row in rows}
+
+        if self.cache is not None:
+            combos = [dict(zip(PARAM_KEYS, (*row, size))) for row in rows for size in position_sizes]
+            cached = self.cache.get_many(self.fingerprint, combos, self.cash, self.commission,
+                                          engine=ENGINE_VECTORIZED)
+            for combo in combos:
+                metrics = cached.get(params_key(combo))
+                if metrics is None:
+                    continue
+                row = (combo['fast_period'], combo['slow_period'], combo['signal_period'])
+                missing[row] = tuple(size for size in missing[row] if size != combo['position_size'])
+                done += 1
+                yield {**combo, **metrics}
+            if done and progress_callback:
+                progress_callback(done, total)
+
+        # 缺失相同仓位集合的参数组合放在同一批任务中
+        groups: Dict[tuple, list] = {}
+        for row, sizes in missing.items():
+            if sizes:
+                groups.setdefault(sizes, []).append(row)
+        tasks = [
+            (np.array(group[i:i + self.chunk_size], dtype=np.int64), sizes)
+            for sizes, group in groups.items()
+            for i in range(0, len(group), self.chunk_size)
+        ]
+        if not tasks or self.cancelled:
+            return
+
+        with SharedBars(self.data) as bars:
+            executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self.mp_context,
+                initializer=_init_worker,
+                initargs=(bars.spec, self.cash, self.commission)
+            )
+            pending = set()
+            try:
+                pending = {executor.submit(_evaluate_chunk, chunk, sizes) for chunk, sizes in tasks}
+                while pending and not self.cancelled:
+                    finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        results = future.result()
+                        done += len(results)
+                        if self.cache is not None:
+                            self._store(results)
+                        for result in results:
+                            yield result
+                        if progress_callback:
+                            progress_callback(done, total)
+            finally:
+                # 取消尚未开始的任务（shutdown的cancel_futures参数需要Python 3.9）
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=True)
+
+    def _store(self, results: list):
+        """把新评估的结果写入缓存"""
+        entries = [
+            ({key: result[key] for key in PARAM_KEYS},
+             {key: value for key, value in result.items() if key not in PARAM_KEYS})
+            for result in results
+        ]
+        self.cache.put_many(self.fingerprint, entries, self.cash, self.commission, engine=ENGINE_VECTORIZED)
+
+    def run(self,
+            fast_periods: Iterable[int],
+            slow_periods: Iterable[int],
+            signal_periods: Iterable[int],
+            position_sizes: Iterable[float] = (0.8,),
+            maximize: str = 'Return [%]',
+            progress_callback: Optional[Callable[[int, int], None]] = None,
+            on_result: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        运行完整的网格优化
+
+        Args:
+            fast_periods: 快速EMA周期集合
+            slow_periods: 慢速EMA周期集合
+            signal_periods: 信号线EMA周期集合
+            position_sizes: 仓位大小集合
+            maximize: 优化目标指标
+            progress_callback: 进度回调，参数为(已完成组合数, 总组合数)
+            on_result: 每个组合完成时的回调
+
+        Returns:
+            优化结果字典
+        """
+        start = time.perf_counter()
+        results = []
+        for result in self.iter_results(fast_periods, slow_periods, signal_periods,
+                                        position_sizes, progress_callback):
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+        if not results:
+            raise ValueError("没有可评估的参数组合")
+
+        scores = np.array([result[maximize] for result in results], dtype=np.float64)
+        if np.isnan(scores).all():
+            raise ValueError(f"所有参数组合的优化指标 {maximize} 均为NaN")
+        best = results[int(np.nanargmax(scores))]
+
+        elapsed = time.perf_counter() - start
+        print(f"评估 {len(results)} 组参数, 耗时 {elapsed:.2f}秒"
+              f"{' (已取消)' if self.cancelled else ''}")
+
+        return {
+            'best_params': {
+                'fast_period': best['fast_period'],
+                'slow_period': best['slow_period'],
+                'signal_period': best['signal_period'],
+                'position_size': best['position_size']
+            },
+            'best_result': best,
+            'results': pd.DataFrame(results),
+            'optimization_target': maximize,
+            'cancelled': self.cancelled,
+            'seconds': elapsed
+        }
+
+
+def _score(result: dict, maximize: str) -> float:
+    """优化目标值，NaN视为最差"""
+    value = float(result[maximize])
+    return -np.inf if np.isnan(value) else value
+
+
+class AdaptiveSearch:
+    """
+    自适应参数搜索
+
+    提供两种在评估预算内逼近网格最优解的模式：
+    - successive_halving: 在逐步加长的数据片段上淘汰较差的参数组合
+    - tpe: 基于树状Parzen估计器(TPE)的序贯模型搜索
+
+    评估在当前进程中进行；全量数据上的评估会读写结果缓存。
+    """
+
+    def __init__(self,
+                 data: pd.DataFrame,
+                 cash: float = 100000,
+                 commission: float = 0.002,
+                 cache: Optional[ResultCache] = None,
+                 seed: Optional[int] = None):
+        """
+        初始化搜索器
+
+        Args:
+            data: OHLCV数据
+            cash: 初始资金
+            commission: 手续费率
+            cache: 结果缓存
+            seed: 随机种子
+        """
+        self.index = data.index
+        self.open = data['Open'].to_numpy(dtype=np.float64)
+        self.close = data['Close'].to_numpy(dtype=np.float64)
+        self.cash = cash
+        self.commission = commission
+        self.cache = cache
+        self.fingerprint = data_fingerprint(data) if cache is not None else None
+        self.rng = np.random.default_rng(seed)
+        self.evaluations = 0
+
+    @staticmethod
+    def build_space(fast_periods: Iterable[int],
+                    slow_periods: Iterable[int],
+                    signal_periods: Iterable[int],
+                    position_sizes: Iterable[float]) -> Dict[str, list]:
+        """构造各参数的候选值列表（升序）"""
+        return {
+            'fast_period': sorted(int(value) for value in fast_periods),
+            'slow_period': sorted(int(value) for value in slow_periods),
+            'signal_period': sorted(int(value) for value in signal_periods),
+            'position_size': sorted(float(value) for value in position_sizes),
+        }
+
+    @staticmethod
+    def _valid(params: dict) -> bool:
+        """参数约束：快线周期小于慢线周期"""
+        return params['fast_period'] < params['slow_period']
+
+    def _all_combinations(self, space: Dict[str, list]) -> List[dict]:
+        """搜索空间中所有满足约束的参数组合"""
+        grid = parameter_grid(space['fast_period'], space['slow_period'], space['signal_period'])
+        return [
+            dict(zip(PARAM_KEYS, (int(fast), int(slow), int(signal), size)))
+            for fast, slow, signal in grid
+            for size in space['position_size']
+        ]
+
+    def _evaluate(self, params_list: List[dict], bars: Optional[int] = None) -> List[dict]:
+        """
+        评估参数组合
+
+        Args:
+            params_list: 参数字典列表
+            bars: 只使用最近bars根K线，为None时使用全部数据
+
+        Returns:
+            与params_list顺序一致的结果字典列表
+        """
+        full = bars is None or bars >= len(self.close)
+        start = 0 if full else len(self.close) - bars
+
+        results: Dict[str, dict] = {}
+        if full and self.cache is not None:
+            cached = self.cache.get_many(self.fingerprint, params_list, self.cash, self.commission,
+                                         engine=ENGINE_VECTORIZED)
+            for params in params_list:
+                metrics = cached.get(params_key(params))
+                if metrics is not None:
+                    results[params_key(params)] = {**params, **metrics}
+
+        # 按仓位大小分组，同组的(fast, slow, signal)一起计算指标
+        groups: Dict[float, list] = {}
+        for params in params_list:
+            key = params_key(params)
+            if key not in results:
+                groups.setdefault(params['position_size'], []).append(params)
+
+        evaluated = []
+        for size, group in groups.items():
+            chunk = np.array([[p['fast_period'], p['slow_period'], p['signal_period']] for p in group],
+                             dtype=np.int64)
+            evaluated.extend(evaluate_parameters(
+                self.index[start:], self.open[start:], self.close[start:],
+                chunk, (size,), self.cash, self.commission
+            ))
+        self.evaluations += len(evaluated)
+
+        for result in evaluated:
+            results[params_key(result)] = result
+        if full and self.cache is not None and evaluated:
+            self.cache.put_many(self.fingerprint, [
+                ({key: result[key] for key in PARAM_KEYS},
+                 {key: value for key, value in result.items() if key not in PARAM_KEYS})
+                for result in evaluated
+            ], self.cash, self.commission, engine=ENGINE_VECTORIZED)
+
+        return [results[params_key(params)] for params in params_list]
+
+    def _finish(self, results: List[dict], maximize: str, started: float, method: str) -> dict:
+        """整理成与网格优化相同结构的结果"""
+        if not results:
+            raise ValueError("没有可评估的参数组合")
+        best = max(results, key=lambda result: _score(result, maximize))
+        elapsed = time.perf_counter() - started
+        print(f"{method}: 评估 {self.evaluations} 次, 耗时 {elapsed:.2f}秒")
+
+        return {
+            'best_params': {key: best[key] for key in PARAM_KEYS},
+            'best_result': best,
+            'results': pd.DataFrame(results),
+            'optimization_target': maximize,
+            'evaluations': self.evaluations,
+            'seconds': elapsed
+        }
+
+    def successive_halving(self,
+                           space: Dict[str, list],
+                           max_evals: int,
+                           maximize: str = 'Return [%]',
+                           eta: int = 3,
+                           min_bars: int = 500) -> dict:
+        """
+        逐次减半搜索
+
+        随机抽取一批参数组合，先在最近的一小段数据上评估，保留前1/eta进入
+        下一轮并把数据长度扩大eta倍，最后一轮使用全部数据。
+
+        Args:
+            space: build_space构造的搜索空间
+            max_evals: 评估次数预算（各轮评估次数之和）
+            maximize: 优化目标指标
+            eta: 每轮的淘汰比例和数据增长倍数
+            min_bars: 第一轮使用的最少K线数
+
+        Returns:
+            优化结果字典，结构与网格优化一致
+        """
+        started = time.perf_counter()
+        self.evaluations = 0
+        n = len(self.close)
+
+        rounds = 1
+        while rounds < 5 and n / eta ** rounds >= min_bars:
+            rounds += 1
+        # 每个初始候选平均消耗的评估次数
+        cost = sum(eta ** -r for r in range(rounds))
+
+        combos = self._all_combinations(space)
+        count = int(min(len(combos), max(1, max_evals // cost)))
+        # 每轮保留数向上取整，总评估次数可能略超预算
+        while count > 1 and self._halving_cost(count, rounds, eta) > max_evals:
+            count -= 1
+        candidates = [combos[i] for i in self.rng.choice(len(combos), size=count, replace=False)]
+
+        results = []
+        for r in range(rounds):
+            bars = int(n / eta ** (rounds - 1 - r))
+            results = self._evaluate(candidates, bars)
+            if r < rounds - 1:
+                keep = max(1, int(np.ceil(len(candidates) / eta)))
+                order = np.argsort([-_score(result, maximize) for result in results], kind='stable')
+                candidates = [candidates[i] for i in order[:keep]]
+
+        return self._finish(results, maximize, started, "逐次减半搜索")
+
+    @staticmethod
+    def _halving_cost(count: int, rounds: int, eta: int) -> int:
+        """逐次减半各轮评估次数之和"""
+        total = 0
+        for _ in range(rounds):
+            total += count
+            count = max(1, int(np.ceil(count / eta)))
+        return total
+
+    def tpe(self,
+            space: Dict[str, list],
+            max_evals: int,
+            maximize: str = 'Return [%]',
+            n_startup: Optional[int] = None,
+            gamma: float = 0.25,
+            n_candidates: int = 24) -> dict:
+        """
+        TPE序贯模型搜索
+
+        先随机评估n_startup组参数，之后每次按目标值把已评估的组合分为
+        较好的前gamma部分和其余部分，对每个参数分别用核密度估计两组的分布
+        l(x)和g(x)，从l(x)中采样候选并选取l(x)/g(x)最大的组合评估。
+
+        Args:
+            space: build_space构造的搜索空间
+            max_evals: 评估次数预算
+            maximize: 优化目标指标
+            n_startup: 随机评估的次数，默认为预算的20%（至少10次）
+            gamma: 较好组合所占比例
+            n_candidates: 每次从l(x)中采样的候选数量
+
+        Returns:
+            优化结果字典，结构与网格优化一致
+        """
+        started = time.perf_counter()
+        self.evaluations = 0
+
+        combos = self._all_combinations(space)
+        max_evals = min(max_evals, len(combos))
+        if n_startup is None:
+            n_startup = max(10, max_evals // 5)
+        n_startup = min(n_startup, max_evals)
+
+        startup = [combos[i] for i in self.rng.choice(len(combos), size=n_startup, replace=False)]
+        results = self._evaluate(startup)
+        seen = {params_key(params) for params in startup}
+
+        # 参数值在各自候选列表中的位置，核函数在位置上计算
+        dims = {name: np.asarray(values) for name, values in space.items()}
+
+        while len(results) < max_evals:
+            scores = np.array([_score(result, maximize) for result in results])
+            order = np.argsort(-scores, kind='stable')
+            n_good = max(1, int(np.ceil(gamma * len(results))))
+            good = [results[i] for i in order[:n_good]]
+            bad = [results[i] for i in order[n_good:]] or good
+
+            densities = {name: (self._parzen(values, good, name), self._parzen(values, bad, name))
+                         for name, values in dims.items()}
+
+            best_params, best_ratio = None, -np.inf
+            for _ in range(n_candidates):
+                positions = {name: self.rng.choice(len(values), p=densities[name][0])
+                             for name, values in dims.items()}
+                params = {name: dims[name][pos].item() for name, pos in positions.items()}
+                if not self._valid(params) or params_key(params) in seen:
+                    continue
+                ratio = sum(np.log(densities[name][0][pos]) - np.log(densities[name][1][pos])
+                            for name, pos in positions.items())
+                if ratio > best_ratio:
+                    best_params, best_ratio = params, ratio
+
+            if best_params is None:
+                # l(x)附近已全部评估过，随机选一个未评估的组合
+                remaining = [params for params in combos if params_key(params) not in seen]
+                if not remaining:
+                    break
+                best_params = remaining[self.rng.integers(len(remaining))]
+
+            seen.add(params_key(best_params))
+            results.extend(self._evaluate([best_params]))
+
+        return self._finish(results, maximize, started, "TPE搜索")
+
+    @staticmethod
+    def _parzen(values: np.ndarray, observations: List[dict], name: str) -> np.ndarray:
+        """在离散候选值上的高斯核密度估计，混合均匀先验"""
+        m = len(values)
+        positions = np.searchsorted(values, [observation[name] for observation in observations])
+        bandwidth = max(1.0, m / 8)
+        grid = np.arange(m)
+        weights = np.exp(-0.5 * ((grid[:, None] - positions[None, :]) / bandwidth) ** 2).sum(axis=1)
+        weights = weights / weights.sum() * len(observations) + 1.0 / m
+        return weights / weights.sum()
@@ -0,0 +1,164 @@
+"""
+Parquet列式K线缓存
+Parquet Bar Cache
+"""
+
+import os
+from pathlib import Path
+from typing import Optional, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow为可选依赖
+    pa = None
+    pq = None
+
+
+# 缓存文件中的列
+CACHE_COLUMNS = ['ts_ms', 'open', 'high', 'low', 'close', 'volume']
+
+
+class ParquetBarCache:
+    """
+    按交易对/周期/月份分区的Parquet K线缓存
+
+    目录结构为 root/<symbol>/<interval>/<YYYY-MM>.parquet，每个文件按时间排序。
+    范围读取只打开涉及的月份分区。
+    """
+
+    def __init__(self, root: str):
+        """
+        初始化缓存目录
+
+        Args:
+            root: 缓存根目录
+        """
+        if pq is None:
+            raise ImportError("使用Parquet缓存需要安装pyarrow: pip install pyarrow")
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _partition_dir(self, symbol: str, interval: str) -> Path:
+        """交易对/周期对应的分区目录"""
+        return self.root / symbol / interval
+
+    def _partition_path(self, symbol: str, interval: str, month: str) -> Path:
+        """月份分区文件路径"""
+        return self._partition_dir(symbol, interval) / f"{month}.parquet"
+
+    def months(self, symbol: str, interval: str) -> List[str]:
+        """已缓存的月份列表（升序）"""
+        directory = self._partition_dir(symbol, interval)
+        if not directory.exists():
+            return []
+        return sorted(path.stem for path in directory.glob('*.parquet'))
+
+    def has_data(self, symbol: str, interval: str) -> bool:
+        """是否已缓存该交易对/周期的数据"""
+        return bool(self.months(symbol, interval))
+
+    def write(self, df: pd.DataFrame, symbol: str, interval: str):
+        """
+        将K线合并写入对应的月份分区
+
+        与数据库的INSERT OR IGNORE语义一致：已存在的K线保留原值。
+
+        Args:
+            df: 以时间为索引的OHLCV DataFrame
+            symbol: 交易对符号
+            interval: 时间间隔
+        """
+        if df.empty:
+            return
+
+        ts_ms = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        months = ts_ms.astype('datetime64[ms]').astype('datetime64[M]')
+        values = df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=np.float64)
+
+        directory = self._partition_dir(symbol, interval)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        for month in np.unique(months):
+            mask = months == month
+            table = pa.table({
+                'ts_ms': ts_ms[mask],
+                'open': values[mask, 0],
+                'high': values[mask, 1],
+                'low': values[mask, 2],
+                'close': values[mask, 3],
+                'volume': values[mask, 4],
+            })
+
+            path = self._partition_path(symbol, interval, str(month))
+            if path.exists():
+                table = pa.concat_tables([pq.read_table(path), table])
+
+            self._write_partition(table, path)
+
+    @staticmethod
+    def _write_partition(table: 'pa.Table', path: Path):
+        """按时间排序去重后原子写入分区文件"""
+        ts = table.column('ts_ms').to_numpy()
+        _, first = np.unique(ts, return_index=True)  # 保留最先出现的记录
+        if len(first) != len(ts) or np.any(np.diff(ts) < 0):
+            table = table.take(pa.array(first))
+
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def read(self, symbol: str, interval: str,
+             start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> pd.DataFrame:
+        """
+        读取时间范围内的K线
+
+        Args:
+            symbol: 交易对符号
+            interval: 时间间隔
+            start_ms: 开始时间戳(毫秒)，包含
+            end_ms: 结束时间戳(毫秒)，包含
+
+        Returns:
+            以时间为索引的OHLCV DataFrame，无数据时返回空DataFrame
+        """
+        months = self.months(symbol, interval)
+        if start_ms is not None:
+            first = str(np.datetime64(start_ms, 'ms').astype('datetime64[M]'))
+            months = [month for month in months if month >= first]
+        if end_ms is not None:
+            last = str(np.datetime64(end_ms, 'ms').astype('datetime64[M]'))
+            months = [month for month in months if month <= last]
+
+        if not months:
+            return pd.DataFrame()
+
+        filters = []
+        if start_ms is not None:
+            filters.append(('ts_ms', '>=', start_ms))
+        if end_ms is not None:
+            filters.append(('ts_ms', '<=', end_ms))
+
+        tables = [
+            pq.read_table(self._partition_path(symbol, interval, month),
+                          columns=CACHE_COLUMNS, filters=filters or None)
+            for month in months
+        ]
+        table = pa.concat_tables(tables)
+        if table.num_rows == 0:
+            return pd.DataFrame()
+
+        # split_blocks避免合并成二维块，浮点列直接零拷贝转换
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('ts_ms').to_numpy(), unit='ms'), name='timestamp')
+        df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+        return df
+
+    def clear(self, symbol: str, interval: str):
+        """删除该交易对/周期的全部缓存分区"""
+        for month in self.months(symbol, interval):
+            self._partition_path(symbol, interval, month).unlink()
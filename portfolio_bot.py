@@ -0,0 +1,433 @@
+"""
+多标的组合交易模块
+Multi-Symbol Portfolio Bot Module
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .alpaca_trader import AlpacaTrader, TIMEFRAME_SECONDS
+    from .live_runner import next_bar_close
+    from .strategy import MACDStrategy, BatchStreamingMACD
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.alpaca_trader import AlpacaTrader, TIMEFRAME_SECONDS
+    from simple_trading_system.live_runner import next_bar_close
+    from simple_trading_system.strategy import MACDStrategy, BatchStreamingMACD
+
+
+class PortfolioBot:
+    """
+    多标的组合交易机器人
+
+    一个进程、一个AlpacaTrader（一次认证、一个连接池、一份账户和持仓快照）管理全部标的。
+    每根K线收盘后：
+      1. 标的按shard_size分片，每个分片用一次多标的行情请求获取新K线，分片在线程池中并发执行；
+      2. 所有标的的MACD由BatchStreamingMACD一次向量化更新；
+      3. 只读取一次账户和持仓快照，为出现信号的标的分配资金，在线程池中并发提交订单。
+    收盘后还没有新K线的标的按retry_delay重试（收盘后最多等待max_wait秒），重试取到的K线
+    单独计算和下单，不拖延已经到达的标的。上一次收盘也没有取到K线的落后标的（如停牌）
+    各自从自己的after单独请求且不重试，不让分片或其他落后标的的请求从更早的时间开始。
+    每个标的记录收盘到处理完成（有订单时为订单确认）的延迟。
+    """
+
+    def __init__(self,
+                 symbols: List[str],
+                 trader: Optional[AlpacaTrader] = None,
+                 timeframe: str = '1Hour',
+                 shard_size: int = 100,
+                 max_workers: int = 8,
+                 position_fraction: Optional[float] = None,
+                 settle: float = 2.0,
+                 retry_delay: float = 1.0,
+                 max_retries: int = 10,
+                 max_wait: float = 5.0,
+                 period: Optional[float] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        初始化组合交易机器人
+
+        Args:
+            symbols: 交易标的列表
+            trader: 共用的AlpacaTrader，默认新建
+            timeframe: K线周期，'1Min', '5Min', '15Min', '1Hour', '1Day'
+            shard_size: 每次行情请求包含的标的数量
+            max_workers: 行情请求和下单的线程数
+            position_fraction: 每个标的买入时占用账户权益的比例，默认1/标的数量
+            settle: 收盘后等待行情接口生成K线的时间（秒）
+            retry_delay: K线尚未生成时的重试间隔（秒）
+            max_retries: 每次收盘的最大重试次数
+            max_wait: 收盘后等待迟到K线的最长时间（秒），超过后本次收盘不再重试
+            period: K线周期秒数，默认由timeframe推导
+            clock: 返回UNIX时间（秒）的时钟
+        """
+        self.trader = trader or AlpacaTrader()
+        self.symbols = list(dict.fromkeys(symbols))
+        self.timeframe = timeframe
+        self.period = period or TIMEFRAME_SECONDS[timeframe]
+        self.shard_size = shard_size
+        self.position_fraction = position_fraction or 1.0 / max(len(self.symbols), 1)
+        self.settle = settle
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # 增量MACD，由warm_up设置
+        self.streams = []
+        self.batch: Optional[BatchStreamingMACD] = None
+
+        self.state: Dict[str, dict] = {}
+        self.cycles = []
+        self.trade_history = []
+        self._stopping = False
+
+    @property
+    def shards(self) -> List[List[str]]:
+        """按shard_size切分的标的列表"""
+        return [self.symbols[i:i + self.shard_size] for i in range(0, len(self.symbols), self.shard_size)]
+
+    def warm_up(self, limit: int = 100, strategy: Optional[MACDStrategy] = None) -> List[str]:
+        """
+        用历史数据预热所有标的的增量MACD（在线程池中并发下载）
+
+        尚未收盘的最后一根K线不参与预热，收盘后由process_close获取最终值。
+        历史数据不足或下载失败的标的会被移除。
+
+        Args:
+            limit: 每个标的下载的K线数量
+            strategy: 提供MACD参数的策略，默认MACDStrategy()
+
+        Returns:
+            被移除的标的列表
+        """
+        strategy = strategy or MACDStrategy()
+
+        def load(symbol):
+            try:
+                data = self.trader.get_market_data(symbol, timeframe=self.timeframe, limit=limit)
+                return self._closed(data, self.clock())
+            except Exception as e:
+                print(f"{symbol} 预热数据下载失败: {e}")
+                return None
+
+        symbols, streams, dropped = [], [], []
+        for symbol, data in zip(self.symbols, self.executor.map(load, self.symbols)):
+            stream = strategy.create_stream(data['Close']) if data is not None and len(data) else None
+            if stream is None or not stream.ready:
+                dropped.append(symbol)
+                continue
+            symbols.append(symbol)
+            streams.append(stream)
+            self.state[symbol] = {
+                'last_bar_time': data.index[-1],
+                'bars': 0,
+                'fetches': 0,
+                'signals': 0,
+                'orders': 0,
+                'latency': []
+            }
+
+        self.symbols = symbols
+        self.streams = streams
+        self.batch = BatchStreamingMACD(streams)
+
+        if dropped:
+            print(f"以下标的历史数据不足，已移除: {', '.join(dropped)}")
+        print(f"组合预热完成: {len(symbols)} 个标的, {len(self.shards)} 个分片")
+        return dropped
+
+    def stop(self):
+        """在当前收盘处理完成后停止"""
+        self._stopping = True
+
+    def close(self):
+        """关闭线程池"""
+        self.executor.shutdown(wait=True)
+
+    async def _wait_until(self, target: float):
+        """休眠到目标时间"""
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    def _closed(self, frame: pd.DataFrame, close_time: float) -> pd.DataFrame:
+        """只保留在close_time之前收盘的K线（忽略接口返回的未完成K线）"""
+        if not len(frame):
+            return frame
+        index = frame.index if frame.index.tz is not None else frame.index.tz_localize('UTC')
+        return frame[index.asi8 / 1e9 + self.period <= close_time + 1e-6]
+
+    async def _fetch(self, afters: Dict[str, pd.Timestamp], floor: pd.Timestamp,
+                     close_time: float) -> Dict[str, pd.DataFrame]:
+        """
+        按分片并发请求各标的after之后新收盘的K线
+
+        每个分片中after早于floor的落后标的各自从自己的after单独发一次请求，
+        其余标的的请求从不早于floor的时间开始。
+
+        Returns:
+            {标的: 新收盘的K线}，只包含取到K线的标的
+        """
+        loop = asyncio.get_running_loop()
+        symbols = list(afters)
+        requests = []
+        for i in range(0, len(symbols), self.shard_size):
+            shard = symbols[i:i + self.shard_size]
+            current = {symbol: afters[symbol] for symbol in shard if afters[symbol] >= floor}
+            if current:
+                requests.append(current)
+            # 落后标的合并请求时会从最早的after开始，一个长期停牌的标的就会让所有落后标的
+            # 每次收盘都重新翻页获取大量已处理的K线
+            requests.extend({symbol: afters[symbol]} for symbol in shard if afters[symbol] < floor)
+
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self.trader.get_bars_after_multi, group, self.timeframe)
+            for group in requests
+        ), return_exceptions=True)
+
+        fetched = {}
+        for group, result in zip(requests, results):
+            if isinstance(result, Exception):
+                print(f"分片 {next(iter(group))}..{next(reversed(group))} 获取K线失败: {result}")
+                continue
+            for symbol in group:
+                self.state[symbol]['fetches'] += 1
+            for symbol, frame in result.items():
+                frame = self._closed(frame, close_time)
+                if len(frame):
+                    fetched[symbol] = frame
+        return fetched
+
+    def _evaluate(self, bars: Dict[str, pd.DataFrame]) -> Dict[str, tuple]:
+        """
+        按时间顺序把新K线交给批量MACD
+
+        Returns:
+            {标的: (本次收盘中最后一个交叉信号, 信号K线收盘价)}
+        """
+        index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        closes = {symbol: frame['Close'].to_numpy(dtype=np.float64) for symbol, frame in bars.items()}
+        depth = max((len(values) for values in closes.values()), default=0)
+
+        signals = {}
+        for step in range(depth):
+            # 缺K线的标的补NaN，本步不更新
+            row = np.full(len(self.symbols), np.nan)
+            for symbol, values in closes.items():
+                offset = step - depth + len(values)
+                if offset >= 0:
+                    row[index[symbol]] = values[offset]
+
+            crossover = self.batch.update(row)
+            for i in np.flatnonzero(crossover):
+                signals[self.symbols[i]] = (int(crossover[i]), float(row[i]))
+
+        for symbol, frame in bars.items():
+            state = self.state[symbol]
+            state['last_bar_time'] = frame.index[-1]
+            state['bars'] += len(frame)
+        for symbol in signals:
+            self.state[symbol]['signals'] += 1
+        return signals
+
+    def _plan_orders(self, signals: Dict[str, tuple]) -> List[dict]:
+        """用一份账户和持仓快照为所有信号生成订单"""
+        positions = {position['symbol']: position['qty'] for position in self.trader.get_positions()}
+        account = self.trader.get_account_info()
+        buying_power = account['buying_power'] * 0.9
+        budget = account['equity'] * self.position_fraction
+
+        orders = []
+        for symbol, (signal, price) in signals.items():
+            held = positions.get(symbol, 0.0)
+            if signal == -1 and held > 0:
+                orders.append({'symbol': symbol, 'action': 'SELL', 'qty': held, 'signal_price': price})
+            elif signal == 1 and held <= 0:
+                qty = int(min(budget, buying_power) / price)
+                if qty > 0:
+                    buying_power -= qty * price
+                    orders.append({'symbol': symbol, 'action': 'BUY', 'qty': qty, 'signal_price': price})
+        return orders
+
+    async def _submit(self, order: dict, close_time: float):
+        """在线程池中提交一个订单并记录延迟"""
+        loop = asyncio.get_running_loop()
+        submit = self.trader.buy_market if order['action'] == 'BUY' else self.trader.sell_market
+        try:
+            result = await loop.run_in_executor(self.executor, submit, order['symbol'], order['qty'])
+        except Exception as e:
+            print(f"{order['symbol']} 下单失败: {e}")
+            return
+
+        state = self.state[order['symbol']]
+        state['orders'] += 1
+        state['latency'][-1] = self.clock() - close_time
+        self.trade_history.append({
+            'timestamp': datetime.now(),
+            'order_id': result['order_id'],
+            **order
+        })
+
+    async def _trade(self, bars: Dict[str, pd.DataFrame], close_time: float, cycle: Dict):
+        """把一批新K线交给批量MACD，为出现信号的标的下单，并累加本次收盘的统计"""
+        started = self.clock()
+        signals = self._evaluate(bars)
+        evaluated = self.clock()
+        for symbol in bars:
+            self.state[symbol]['latency'].append(evaluated - close_time)
+
+        orders = []
+        if signals:
+            try:
+                orders = self._plan_orders(signals)
+            except Exception as e:
+                print(f"读取账户快照失败，本次不下单: {e}")
+            await asyncio.gather(*(self._submit(order, close_time) for order in orders))
+
+        cycle['symbols'] += len(bars)
+        cycle['bars'] += sum(len(frame) for frame in bars.values())
+        cycle['signals'] += len(signals)
+        cycle['orders'] += len(orders)
+        cycle['evaluate_seconds'] += evaluated - started
+        cycle['execute_seconds'] += self.clock() - evaluated
+
+    async def process_close(self, close_time: float) -> Dict:
+        """
+        处理一次K线收盘：分片获取新K线、批量计算信号、并发下单
+
+        第一轮请求取到的标的立即计算和下单；其余标的按retry_delay重试，
+        每轮取到的K线单独处理，直到全部到达、达到max_retries或收盘后超过max_wait秒。
+
+        Args:
+            close_time: 收盘时间（UNIX秒）
+
+        Returns:
+            本次收盘的统计字典
+        """
+        # 正常情况下每个标的上次处理的是前一根K线，开盘时间为close_time - 2 * period
+        floor = pd.Timestamp(close_time - 2 * self.period, unit='s', tz='UTC').round('ms')
+        afters = {}
+        for symbol in self.symbols:
+            after = self.state[symbol]['last_bar_time']
+            afters[symbol] = floor if after is None else after
+
+        cycle = {
+            'close_time': pd.Timestamp(close_time, unit='s', tz='UTC'),
+            'symbols': 0,
+            'bars': 0,
+            'signals': 0,
+            'orders': 0,
+            'rounds': 0,
+            'fetch_seconds': 0.0,
+            'evaluate_seconds': 0.0,
+            'execute_seconds': 0.0
+        }
+        deadline = close_time + self.max_wait
+        for attempt in range(self.max_retries + 1):
+            started = self.clock()
+            bars = await self._fetch(afters, floor, close_time)
+            cycle['fetch_seconds'] += self.clock() - started
+            cycle['rounds'] += 1
+            if bars:
+                await self._trade(bars, close_time, cycle)
+
+            # 落后标的每次收盘只请求一次，不参与重试
+            afters = {symbol: after for symbol, after in afters.items() if symbol not in bars and after >= floor}
+            if not afters or attempt == self.max_retries or self.clock() + self.retry_delay > deadline:
+                break
+            await asyncio.sleep(self.retry_delay)
+
+        missing = len(self.symbols) - cycle['symbols']
+        if missing:
+            print(f"{missing} 个标的在收盘后未获取到新K线")
+
+        cycle['latency'] = self.clock() - close_time
+        self.cycles.append(cycle)
+        return cycle
+
+    async def run_once(self) -> Dict:
+        """
+        等待下一次K线收盘并处理所有标的
+
+        Returns:
+            本次收盘的统计字典
+        """
+        close_time = next_bar_close(self.clock(), self.period)
+        await self._wait_until(close_time + self.settle)
+        return await self.process_close(close_time)
+
+    async def run(self, max_closes: Optional[int] = None):
+        """
+        持续按K线收盘运行
+
+        Args:
+            max_closes: 最多处理的收盘次数，None为一直运行直到stop()
+        """
+        if self.batch is None:
+            raise RuntimeError("请先调用warm_up()预热增量MACD")
+
+        self._stopping = False
+        print(f"组合交易启动: {len(self.symbols)} 个标的, {len(self.shards)} 个分片, 周期 {self.period:g}秒")
+
+        closes = 0
+        while not self._stopping and (max_closes is None or closes < max_closes):
+            await self.run_once()
+            closes += 1
+
+    def stats(self) -> pd.DataFrame:
+        """
+        每个标的的运行统计
+
+        Returns:
+            包含处理K线数、请求次数、信号数、订单数和收盘到处理完成延迟的DataFrame
+        """
+        rows = []
+        for symbol in self.symbols:
+            state = self.state[symbol]
+            latency = np.array(state['latency'])
+            rows.append({
+                'symbol': symbol,
+                'bars': state['bars'],
+                'fetches': state['fetches'],
+                'signals': state['signals'],
+                'orders': state['orders'],
+                'last_bar_time': state['last_bar_time'],
+                'latency_mean': latency.mean() if len(latency) else np.nan,
+                'latency_max': latency.max() if len(latency) else np.nan
+            })
+        return pd.DataFrame(rows)
+
+    def cycle_stats(self) -> pd.DataFrame:
+        """每次收盘的分阶段耗时统计"""
+        return pd.DataFrame(self.cycles)
+
+    def get_trade_summary(self) -> Dict:
+        """获取交易摘要"""
+        if not self.trade_history:
+            return {'total_trades': 0}
+
+        return {
+            'total_trades': len(self.trade_history),
+            'buy_trades': sum(1 for t in self.trade_history if t['action'] == 'BUY'),
+            'sell_trades': sum(1 for t in self.trade_history if t['action'] == 'SELL'),
+            'symbols_traded': len({t['symbol'] for t in self.trade_history}),
+            'trade_history': self.trade_history
+        }
@@ -0,0 +1,213 @@
+"""
+回测结果缓存模块
+Backtest Result Cache Module
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# 回测引擎或统计口径变化时递增，使旧结果失效
+CACHE_VERSION = 1
+
+# 参与缓存键的策略参数
+PARAM_KEYS = ('fast_period', 'slow_period', 'signal_period', 'position_size')
+
+# 回测引擎名称：不同引擎的统计结果不能互相替代
+ENGINE_BACKTESTING = 'backtesting'  # backtesting.py的FractionalBacktest
+ENGINE_VECTORIZED = 'vectorized'    # vector_backtest的NumPy引擎（含优化器和批量比较）
+
+
+def data_fingerprint(data: pd.DataFrame, symbol: Optional[str] = None, interval: Optional[str] = None) -> str:
+    """
+    计算K线数据的指纹
+
+    由交易对、周期、首末时间戳、行数以及OHLCV内容的校验和组成，
+    数据被修改或向后延伸时指纹都会变化。
+
+    Args:
+        data: 以时间为索引的OHLCV DataFrame
+        symbol: 交易对符号，默认取data.attrs中的symbol
+        interval: 时间间隔，默认取data.attrs中的interval
+
+    Returns:
+        十六进制指纹字符串
+    """
+    symbol = symbol or data.attrs.get('symbol', '')
+    interval = interval or data.attrs.get('interval', '')
+
+    ts = data.index.values.astype('datetime64[ns]').astype(np.int64)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{symbol}|{interval}|{len(data)}|".encode())
+    if len(ts):
+        digest.update(f"{ts[0]}|{ts[-1]}|".encode())
+    digest.update(np.ascontiguousarray(ts).tobytes())
+    for column in ('Open', 'High', 'Low', 'Close', 'Volume'):
+        digest.update(np.ascontiguousarray(data[column].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def params_key(params: dict) -> str:
+    """策略参数的规范化键"""
+    normalized = {
+        'fast_period': int(params['fast_period']),
+        'slow_period': int(params['slow_period']),
+        'signal_period': int(params['signal_period']),
+        'position_size': round(float(params['position_size']), 10),
+    }
+    return json.dumps(normalized, sort_keys=True)
+
+
+def _encode(value):
+    """JSON无法直接表示的统计值"""
+    if isinstance(value, pd.Timestamp):
+        return {'__timestamp__': value.isoformat()}
+    if isinstance(value, pd.Timedelta):
+        return {'__timedelta__': int(value.value)}
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    raise TypeError(f"无法序列化的统计值: {type(value)}")
+
+
+def _decode(obj: dict):
+    """还原_encode编码的统计值"""
+    if '__timestamp__' in obj:
+        return pd.Timestamp(obj['__timestamp__'])
+    if '__timedelta__' in obj:
+        return pd.Timedelta(obj['__timedelta__'])
+    return obj
+
+
+class ResultCache:
+    """
+    SQLite回测结果缓存
+
+    以(数据指纹, 回测引擎, 策略参数, 初始资金, 手续费率)为键保存统计结果。
+    """
+
+    def __init__(self, db_path: str = "backtest_results.db"):
+        """
+        初始化缓存
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._init_database()
+
+    def _init_database(self):
+        """创建结果表"""
+        with sqlite3.connect(self.db_path) as conn:
+            # 旧版结果表不区分回测引擎，缓存可以重新生成，直接丢弃
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(backtest_results)')]
+            if columns and 'engine' not in columns:
+                conn.execute('DROP TABLE backtest_results')
+            
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS backtest_results (
+                    fingerprint TEXT NOT NULL,
+                    engine TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    cash REAL NOT NULL,
+                    commission REAL NOT NULL,
+                    version INTEGER NOT NULL,
+                    metrics TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (fingerprint, engine, params, cash, commission, version)
+                ) WITHOUT ROWID
+            ''')
+
+    def get_many(self, fingerprint: str, params_list: Iterable[dict],
+                 cash: float, commission: float, *, engine: str) -> Dict[str, dict]:
+        """
+        批量读取缓存结果
+
+        Args:
+            fingerprint: 数据指纹
+            params_list: 策略参数字典列表
+            cash: 初始资金
+            commission: 手续费率
+            engine: 回测引擎，ENGINE_BACKTESTING或ENGINE_VECTORIZED
+
+        Returns:
+            参数键到统计结果的字典，只包含命中的参数
+        """
+        keys = list(dict.fromkeys(params_key(params) for params in params_list))
+        found = {}
+        with sqlite3.connect(self.db_path) as conn:
+            # 分批查询，避免超过SQLite的变量数上限
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = conn.execute(f'''
+                    SELECT params, metrics FROM backtest_results
+                    WHERE fingerprint = ? AND engine = ? AND cash = ? AND commission = ? AND version = ?
+                      AND params IN ({','.join('?' * len(batch))})
+                ''', [fingerprint, engine, float(cash), float(commission), CACHE_VERSION, *batch]).fetchall()
+                for key, metrics in rows:
+                    found[key] = json.loads(metrics, object_hook=_decode)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, fingerprint: str, params: dict, cash: float, commission: float, *,
+            engine: str) -> Optional[dict]:
+        """读取单个参数组合的缓存结果，未命中时返回None"""
+        return self.get_many(fingerprint, [params], cash, commission, engine=engine).get(params_key(params))
+
+    def put_many(self, fingerprint: str, entries: List[tuple], cash: float, commission: float, *,
+                 engine: str):
+        """
+        批量写入结果
+
+        Args:
+            fingerprint: 数据指纹
+            entries: (策略参数, 统计结果) 元组列表
+            cash: 初始资金
+            commission: 手续费率
+            engine: 回测引擎，ENGINE_BACKTESTING或ENGINE_VECTORIZED
+        """
+        now = time.time()
+        rows = [
+            (fingerprint, engine, params_key(params), float(cash), float(commission), CACHE_VERSION,
+             json.dumps(metrics, default=_encode), now)
+            for params, metrics in entries
+        ]
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO backtest_results
+                (fingerprint, engine, params, cash, commission, version, metrics, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+    def put(self, fingerprint: str, params: dict, cash: float, commission: float, metrics: dict, *,
+            engine: str):
+        """写入单个参数组合的结果"""
+        self.put_many(fingerprint, [(params, metrics)], cash, commission, engine=engine)
+
+    def clear(self, fingerprint: Optional[str] = None) -> int:
+        """
+        删除缓存结果
+
+        Args:
+            fingerprint: 只删除该数据指纹的结果，为None时全部删除
+
+        Returns:
+            删除的行数
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            if fingerprint is None:
+                cursor = conn.execute('DELETE FROM backtest_results')
+            else:
+                cursor = conn.execute('DELETE FROM backtest_results WHERE fingerprint = ?', (fingerprint,))
+            return cursor.rowcount
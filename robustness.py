@@ -0,0 +1,216 @@
+"""
+蒙特卡洛稳健性分析模块
+Monte Carlo Robustness Module
+"""
+
+import sys
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .vector_backtest import vectorized_backtest
+    from .result_cache import PARAM_KEYS
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.vector_backtest import vectorized_backtest
+    from simple_trading_system.result_cache import PARAM_KEYS
+
+
+# 默认报告的分位数
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# 每个分块的默认内存上限（字节）
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+
+
+def trade_returns(trades: pd.DataFrame, cash: float) -> np.ndarray:
+    """
+    把交易列表换算成每笔交易对账户权益的收益率
+
+    交易互不重叠时，第k笔交易开仓前的权益为初始资金加上之前所有交易的盈亏，
+    因此 (1 + r).prod() 等于全部交易平仓后的权益与初始资金之比。
+    交易的ReturnPct是相对持仓市值的收益率，仓位小于100%时会高估对权益的影响。
+
+    Args:
+        trades: 包含PnL列的交易DataFrame（raw_results['_trades']或run_vectorized的trades）
+        cash: 初始资金
+
+    Returns:
+        每笔交易的权益收益率数组
+    """
+    pnl = trades['PnL'].to_numpy(dtype=np.float64)
+    equity_before = cash + np.concatenate([[0.0], np.cumsum(pnl)[:-1]])
+    return pnl / equity_before
+
+
+def monte_carlo(returns: np.ndarray,
+                n_sims: int = 10000,
+                method: str = 'bootstrap',
+                cash: float = 1.0,
+                trades_per_year: Optional[float] = None,
+                percentiles: Iterable[float] = DEFAULT_PERCENTILES,
+                max_memory: int = DEFAULT_MAX_MEMORY,
+                seed: Optional[int] = None) -> dict:
+    """
+    对交易收益率序列做蒙特卡洛重抽样
+
+    每个分块内的所有模拟作为一个 (模拟数, 交易数) 矩阵一次性计算权益路径、
+    最大回撤和夏普比率，分块大小由max_memory决定。
+
+    - bootstrap: 有放回抽样，最终权益、回撤和夏普比率都会变化
+    - shuffle: 随机打乱交易顺序，最终权益和夏普比率不变，只反映路径（回撤）风险
+
+    Args:
+        returns: 每笔交易的权益收益率
+        n_sims: 模拟次数
+        method: 'bootstrap'或'shuffle'
+        cash: 初始资金
+        trades_per_year: 每年交易笔数，提供时夏普比率按其年化，否则为单笔交易夏普比率
+        percentiles: 报告的分位数
+        max_memory: 每个分块的内存上限（字节）
+        seed: 随机种子
+
+    Returns:
+        包含各次模拟的final_equity/max_drawdown/sharpe数组、分位数表和亏损概率的字典
+    """
+    if method not in ('bootstrap', 'shuffle'):
+        raise ValueError(f"未知的重抽样方式: {method}")
+
+    returns = np.asarray(returns, dtype=np.float64)
+    returns = returns[~np.isnan(returns)]
+    n_trades = len(returns)
+    if n_trades == 0:
+        raise ValueError("没有可用于重抽样的交易")
+
+    rng = np.random.default_rng(seed)
+    # 每个分块同时存在 抽样下标、抽样收益/权益、累计最大值 以及求标准差时的临时矩阵
+    chunk_size = int(max(1, min(n_sims, max_memory // (n_trades * 8 * 4))))
+    annualize = np.sqrt(trades_per_year) if trades_per_year else 1.0
+
+    final_equity = np.empty(n_sims)
+    max_drawdown = np.empty(n_sims)
+    sharpe = np.empty(n_sims)
+
+    for start in range(0, n_sims, chunk_size):
+        size = min(chunk_size, n_sims - start)
+        if method == 'bootstrap':
+            sample = returns[rng.integers(0, n_trades, size=(size, n_trades))]
+        else:
+            sample = rng.permuted(np.broadcast_to(returns, (size, n_trades)), axis=1)
+
+        chunk = slice(start, start + size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe[chunk] = sample.mean(axis=1) / sample.std(axis=1, ddof=1) * annualize
+
+        # 原地计算权益路径（以1为起点）和回撤
+        equity = np.cumprod(np.add(sample, 1.0, out=sample), axis=1, out=sample)
+        peak = np.maximum.accumulate(equity, axis=1)
+        np.maximum(peak, 1.0, out=peak)
+        np.divide(equity, peak, out=peak)
+        max_drawdown[chunk] = (1 - peak.min(axis=1)) * 100
+        final_equity[chunk] = equity[:, -1] * cash
+
+    percentiles = list(percentiles)
+    table = pd.DataFrame(
+        {f'p{q:g}': [np.percentile(values, q) for values in (final_equity, max_drawdown, sharpe)]
+         for q in percentiles},
+        index=['Equity Final [$]', 'Max. Drawdown [%]', 'Sharpe Ratio']
+    )
+
+    return {
+        'final_equity': final_equity,
+        'max_drawdown': max_drawdown,
+        'sharpe': sharpe,
+        'percentiles': table,
+        'probability_of_loss': float((final_equity < cash).mean()),
+        'n_sims': n_sims,
+        'n_trades': n_trades,
+        'method': method
+    }
+
+
+def analyze_backtest(result: dict, cash: float, n_sims: int = 10000, method: str = 'bootstrap',
+                     **kwargs) -> dict:
+    """
+    对run_backtest或run_vectorized的结果做蒙特卡洛分析
+
+    夏普比率按回测期间的交易频率年化。
+
+    Args:
+        result: run_backtest（非headless）或run_vectorized的返回值
+        cash: 回测使用的初始资金
+        n_sims: 模拟次数
+        method: 'bootstrap'或'shuffle'
+        **kwargs: 传给monte_carlo的其他参数
+
+    Returns:
+        monte_carlo的结果字典
+    """
+    if result.get('raw_results') is not None:
+        trades = result['raw_results']['_trades']
+    elif result.get('trades') is not None:
+        trades = result['trades']
+    else:
+        raise ValueError("回测结果中没有交易列表（headless或缓存命中的结果不保留交易）")
+
+    duration = result['results']['Duration']
+    if 'trades_per_year' not in kwargs and isinstance(duration, pd.Timedelta) and duration.days > 0:
+        kwargs['trades_per_year'] = len(trades) / (duration.days / 365)
+
+    return monte_carlo(trade_returns(trades, cash), n_sims=n_sims, method=method, cash=cash, **kwargs)
+
+
+def robustness_table(data: pd.DataFrame,
+                     candidates,
+                     cash: float = 100000,
+                     commission: float = 0.002,
+                     n_sims: int = 10000,
+                     method: str = 'bootstrap',
+                     seed: Optional[int] = None,
+                     **kwargs) -> pd.DataFrame:
+    """
+    对一批候选参数逐一回测并做蒙特卡洛分析
+
+    Args:
+        data: OHLCV数据
+        candidates: 参数字典列表，或包含参数列的DataFrame（如优化结果的前几行）
+        cash: 初始资金
+        commission: 手续费率
+        n_sims: 每组参数的模拟次数
+        method: 'bootstrap'或'shuffle'
+        seed: 随机种子
+        **kwargs: 传给monte_carlo的其他参数
+
+    Returns:
+        每组参数一行的DataFrame，包含回测收益率以及各指标的分位数
+    """
+    if isinstance(candidates, pd.DataFrame):
+        candidates = candidates[list(PARAM_KEYS)].to_dict('records')
+
+    rows = []
+    for params in candidates:
+        params = {key: params[key] for key in PARAM_KEYS}
+        backtest = vectorized_backtest(data, cash=cash, commission=commission, **params)
+        row = {**params, 'Return [%]': backtest['results']['Return [%]'],
+               '# Trades': backtest['results']['# Trades']}
+
+        if backtest['results']['# Trades'] == 0:
+            rows.append(row)
+            continue
+
+        analysis = analyze_backtest(backtest, cash, n_sims=n_sims, method=method, seed=seed, **kwargs)
+        for metric, percentiles in analysis['percentiles'].iterrows():
+            for name, value in percentiles.items():
+                row[f'{metric} {name}'] = value
+        row['Probability of Loss'] = analysis['probability_of_loss']
+        rows.append(row)
+
+    return pd.DataFrame(rows)
@@ -3,12 +3,133 @@ MACD策略实现
 MACD Strategy Implementation
 """
 
+import math
 import pandas as pd
 import numpy as np
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 import talib
 
 
+def _fma(a: float, b: float, c: float) -> float:
+    """正确舍入的a*b+c（Python 3.13以下用整数分数精确计算）"""
+    if not (math.isfinite(a) and math.isfinite(b) and math.isfinite(c)):
+        return a * b + c
+    
+    n1, d1 = a.as_integer_ratio()
+    n2, d2 = b.as_integer_ratio()
+    n3, d3 = c.as_integer_ratio()
+    d12 = d1 * d2
+    return (n1 * n2 * d3 + n3 * d12) / (d12 * d3)
+
+
+if hasattr(math, 'fma'):
+    _fma = math.fma
+
+def _two_sum(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """a + b = s + e 精确成立的无误差加法（Knuth TwoSum）"""
+    s = a + b
+    bb = s - a
+    return s, (a - (s - bb)) + (b - bb)
+
+
+def _two_product(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """a * b = p + e 精确成立的无误差乘法（Dekker，Veltkamp拆分）"""
+    p = a * b
+    c = 134217729.0 * a  # 2**27 + 1
+    ah = c - (c - a)
+    al = a - ah
+    c = 134217729.0 * b
+    bh = c - (c - b)
+    bl = b - bh
+    return p, ((ah * bh - p) + ah * bl + al * bh) + al * bl
+
+
+def _fma_array(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """
+    数组化的正确舍入a*b+c
+    
+    NumPy没有FMA，这里按Boldo-Melquiond的奇数舍入算法模拟：精确乘积与c做TwoSum，
+    低位部分之和按奇数舍入，再与高位做一次普通舍入，结果与math.fma逐位一致（不溢出时）。
+    """
+    ph, pl = _two_product(a, b)
+    uh, ul = _two_sum(c, ph)
+    v, e = _two_sum(ul, pl)
+    
+    # 奇数舍入：不精确且尾数为偶数时，朝真实值方向移动一个ulp
+    inexact_even = (e != 0) & ((v.view(np.int64) & 1) == 0)
+    v = np.where(inexact_even, np.nextafter(v, np.where(e > 0, np.inf, -np.inf)), v)
+    return uh + v
+
+
+# TA-Lib编译时是否把EMA递推 (x - prev) * k + prev 合并为FMA指令，首次使用时检测
+_TALIB_FMA = None
+
+
+def _talib_uses_fma() -> bool:
+    """检测当前TA-Lib的EMA递推是否使用FMA，以便增量计算与其逐位一致"""
+    global _TALIB_FMA
+    if _TALIB_FMA is None:
+        probe = np.sin(np.arange(256) / 7.0)
+        expected = talib.EMA(probe, 9)
+        k = 2.0 / 10
+        prev = expected[8]
+        fused = True
+        for price, value in zip(probe[9:], expected[9:]):
+            if _fma(price - prev, k, prev) != value:
+                fused = False
+                break
+            prev = value
+        _TALIB_FMA = fused
+    return _TALIB_FMA
+
+
+def _crossover_signals(macd: np.ndarray,
+                       signal: np.ndarray,
+                       initial_position: int = 0) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    向量化计算MACD交叉信号和仓位
+    
+    与逐行循环的语义完全一致：第一根K线以及当前/前一根存在NaN的K线
+    信号和仓位均为0；其余K线的仓位沿用最近一次交叉信号，
+    尚未出现交叉时使用initial_position。
+    
+    Args:
+        macd: MACD线数组
+        signal: 信号线数组
+        initial_position: 上一次调用结束时的仓位
+        
+    Returns:
+        (signals, positions, last_position)
+    """
+    n = len(macd)
+    signals = np.zeros(n, dtype=np.int64)
+    positions = np.zeros(n, dtype=np.int64)
+    if n < 2:
+        return signals, positions, initial_position
+    
+    cur_macd, cur_signal = macd[1:], signal[1:]
+    prev_macd, prev_signal = macd[:-1], signal[:-1]
+    
+    # 跳过NaN值
+    valid = ~(np.isnan(cur_macd) | np.isnan(cur_signal) |
+              np.isnan(prev_macd) | np.isnan(prev_signal))
+    
+    # 买入信号：MACD线从下方穿越信号线；卖出信号：MACD线从上方穿越信号线
+    buy = valid & (prev_macd <= prev_signal) & (cur_macd > cur_signal)
+    sell = valid & ~buy & (prev_macd >= prev_signal) & (cur_macd < cur_signal)
+    signals[1:] = buy.astype(np.int64) - sell.astype(np.int64)
+    
+    # 仓位向前延续最近一次信号
+    has_signal = signals != 0
+    last_idx = np.where(has_signal, np.arange(n), -1)
+    np.maximum.accumulate(last_idx, out=last_idx)
+    carried = np.where(last_idx >= 0, signals[np.maximum(last_idx, 0)], initial_position)
+    positions[1:] = np.where(valid, carried[1:], 0)
+    
+    last_position = int(carried[-1])
+    return signals, positions, last_position
+
+
 class MACDStrategy:
     """MACD策略类"""
     
@@ -77,35 +198,340 @@ class MACDStrategy:
         result['MACD_Signal'] = signal_line
         result['MACD_Histogram'] = histogram
         
-        # 初始化信号列
-        result['Signal'] = 0
-        result['Position'] = 0
+        # 向量化生成交易信号和仓位
+        signals, positions, self.position = _crossover_signals(
+            macd_line.to_numpy(dtype=np.float64),
+            signal_line.to_numpy(dtype=np.float64),
+            initial_position=self.position
+        )
+        result['Signal'] = signals
+        result['Position'] = positions
         
-        # 生成交易信号
-        for i in range(1, len(result)):
-            current_macd = result['MACD'].iloc[i]
-            current_signal = result['MACD_Signal'].iloc[i]
-            prev_macd = result['MACD'].iloc[i-1]
-            prev_signal = result['MACD_Signal'].iloc[i-1]
+        return result
+    
+    def create_stream(self, history: Optional[pd.Series] = None) -> 'StreamingMACD':
+        """
+        创建使用相同参数的增量MACD计算器
+        
+        Args:
+            history: 用于预热的历史收盘价
             
-            # 跳过NaN值
-            if pd.isna(current_macd) or pd.isna(current_signal) or pd.isna(prev_macd) or pd.isna(prev_signal):
-                continue
+        Returns:
+            StreamingMACD实例
+        """
+        stream = StreamingMACD(self.fast_period, self.slow_period, self.signal_period)
+        if history is not None:
+            stream.seed(history)
+        return stream
+
+class StreamingMACD:
+    """
+    增量MACD计算器
+    
+    与TA-Lib的MACD逐位一致：慢线EMA以前slow_period根收盘价的均值为种子，
+    快线EMA以同一时刻之前fast_period根收盘价的均值为种子，信号线以前
+    signal_period个MACD值的均值为种子，预热期内不输出。预热完成后每根K线
+    只做常数次浮点运算。
+    """
+    
+    def __init__(self, fast_period: int = 12, slow_period: int = 26, signal_period: int = 9):
+        """
+        初始化增量MACD
+        
+        Args:
+            fast_period: 快速EMA周期
+            slow_period: 慢速EMA周期
+            signal_period: 信号线EMA周期
+        """
+        # 与TA-Lib一致：慢线周期小于快线周期时交换
+        if slow_period < fast_period:
+            fast_period, slow_period = slow_period, fast_period
+        
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self.signal_period = signal_period
+        
+        self._k_fast = 2.0 / (fast_period + 1)
+        self._k_slow = 2.0 / (slow_period + 1)
+        self._k_signal = 2.0 / (signal_period + 1)
+        self._fused = _talib_uses_fma()
+        
+        self.bars = 0
+        self._warmup_prices = []
+        self._warmup_macd = []
+        self._fast_ema = None
+        self._slow_ema = None
+        self._signal_ema = None
+        
+        # 最新一根K线的指标值，预热期内为None
+        self.macd = None
+        self.signal = None
+        self.histogram = None
+        
+        # 与MACDStrategy一致的仓位状态
+        self.position = 0
+    
+    @property
+    def ready(self) -> bool:
+        """指标是否已完成预热"""
+        return self.signal is not None
+    
+    def _ema_step(self, value: float, prev: float, k: float) -> float:
+        """EMA递推一步，与TA-Lib的浮点运算顺序一致"""
+        if self._fused:
+            return _fma(value - prev, k, prev)
+        return ((value - prev) * k) + prev
+    
+    def _advance(self, close: float) -> Tuple[Optional[float], Optional[float], Optional[float], Optional[float], Optional[float]]:
+        """计算加入一根收盘价后的(快线EMA, 慢线EMA, 信号线EMA, MACD, 信号线)，不修改状态"""
+        fast_ema, slow_ema, signal_ema = self._fast_ema, self._slow_ema, self._signal_ema
+        
+        if slow_ema is None:
+            if self.bars + 1 < self.slow_period:
+                return None, None, None, None, None
             
-            # 买入信号：MACD线从下方穿越信号线
-            if prev_macd <= prev_signal and current_macd > current_signal:
-                result.loc[result.index[i], 'Signal'] = 1  # 买入信号
-                self.position = 1
+            # 慢线与快线同时以简单均值为种子
+            prices = self._warmup_prices + [close]
+            slow_sum = 0.0
+            for price in prices:
+                slow_sum += price
+            fast_sum = 0.0
+            for price in prices[-self.fast_period:]:
+                fast_sum += price
+            slow_ema = slow_sum / self.slow_period
+            fast_ema = fast_sum / self.fast_period
+        else:
+            fast_ema = self._ema_step(close, fast_ema, self._k_fast)
+            slow_ema = self._ema_step(close, slow_ema, self._k_slow)
+        
+        macd = fast_ema - slow_ema
+        
+        if signal_ema is None:
+            if len(self._warmup_macd) + 1 < self.signal_period:
+                return fast_ema, slow_ema, None, macd, None
             
-            # 卖出信号：MACD线从上方穿越信号线
-            elif prev_macd >= prev_signal and current_macd < current_signal:
-                result.loc[result.index[i], 'Signal'] = -1  # 卖出信号
-                self.position = -1
+            macd_sum = 0.0
+            for value in self._warmup_macd + [macd]:
+                macd_sum += value
+            signal_ema = macd_sum / self.signal_period
+        else:
+            signal_ema = self._ema_step(macd, signal_ema, self._k_signal)
+        
+        return fast_ema, slow_ema, signal_ema, macd, signal_ema
+    
+    def _crossover(self, macd: Optional[float], signal: Optional[float]) -> int:
+        """与最新已确认的K线比较，判断交叉信号"""
+        if macd is None or signal is None or self.macd is None or self.signal is None:
+            return 0
+        
+        # 买入信号：MACD线从下方穿越信号线
+        if self.macd <= self.signal and macd > signal:
+            return 1
+        # 卖出信号：MACD线从上方穿越信号线
+        if self.macd >= self.signal and macd < signal:
+            return -1
+        return 0
+    
+    def update(self, close: float) -> int:
+        """
+        加入一根已收盘的K线
+        
+        Args:
+            close: 收盘价
             
-            # 记录当前仓位
-            result.loc[result.index[i], 'Position'] = self.position
+        Returns:
+            交叉信号：1=买入, -1=卖出, 0=无信号
+        """
+        close = float(close)
+        fast_ema, slow_ema, signal_ema, macd, signal = self._advance(close)
+        crossover = self._crossover(macd, signal)
         
-        return result
+        # 提交状态
+        self.bars += 1
+        if slow_ema is None:
+            self._warmup_prices.append(close)
+        else:
+            self._warmup_prices = []
+        if signal_ema is None and macd is not None:
+            self._warmup_macd.append(macd)
+        elif signal_ema is not None:
+            self._warmup_macd = []
+        
+        self._fast_ema, self._slow_ema, self._signal_ema = fast_ema, slow_ema, signal_ema
+        
+        # 预热期内与TA-Lib一致不输出指标
+        if signal is None:
+            self.macd = self.signal = self.histogram = None
+        else:
+            self.macd, self.signal, self.histogram = macd, signal, macd - signal
+        
+        if crossover != 0:
+            self.position = crossover
+        
+        return crossover
+    
+    def peek(self, price: float) -> int:
+        """
+        假设当前K线以price收盘时的交叉信号，不修改状态（用于逐笔成交预判）
+        
+        Args:
+            price: 最新成交价
+            
+        Returns:
+            交叉信号：1=买入, -1=卖出, 0=无信号
+        """
+        _, _, _, macd, signal = self._advance(float(price))
+        return self._crossover(macd, signal)
+    
+    def seed(self, prices) -> int:
+        """
+        用历史收盘价预热
+        
+        Args:
+            prices: 按时间排序的历史收盘价
+            
+        Returns:
+            历史中最后一个交叉信号后的仓位
+        """
+        self.replay(prices)
+        return self.position
+    
+    def replay(self, prices) -> np.ndarray:
+        """
+        依次加入一批已收盘的K线，返回每根K线的交叉信号
+        
+        结果和结束后的状态与逐根调用update完全一致。从零开始且历史足够长时
+        直接用TA-Lib批量计算信号和末端状态，否则逐根更新。
+        
+        Args:
+            prices: 按时间排序的收盘价
+            
+        Returns:
+            每根K线的交叉信号数组：1=买入, -1=卖出, 0=无信号
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        warmup = self.slow_period + self.signal_period - 1
+        
+        if self.bars or len(prices) <= warmup:
+            return np.array([self.update(price) for price in prices], dtype=np.int64)
+        
+        macd, signal, histogram = talib.MACD(
+            prices,
+            fastperiod=self.fast_period,
+            slowperiod=self.slow_period,
+            signalperiod=self.signal_period
+        )
+        signals, _, self.position = _crossover_signals(macd, signal, self.position)
+        
+        # MACD内部的快线EMA以慢线种子时刻之前fast_period根价格的均值为种子
+        self._slow_ema = float(talib.EMA(prices, self.slow_period)[-1])
+        self._fast_ema = float(talib.EMA(prices[self.slow_period - self.fast_period:], self.fast_period)[-1])
+        self._signal_ema = float(signal[-1])
+        self._warmup_prices = []
+        self._warmup_macd = []
+        
+        self.bars = len(prices)
+        self.macd, self.signal, self.histogram = float(macd[-1]), float(signal[-1]), float(histogram[-1])
+        return signals
+
+
+class BatchStreamingMACD:
+    """
+    多标的增量MACD
+    
+    把N个已完成预热的StreamingMACD的状态放进数组，每根K线用一次向量化运算更新全部标的，
+    结果与逐个调用StreamingMACD.update逐位一致（EMA递推的FMA用_fma_array精确模拟）。
+    各标的可以使用不同的周期参数。
+    """
+    
+    def __init__(self, streams: List[StreamingMACD]):
+        """
+        初始化批量增量MACD
+        
+        Args:
+            streams: 已预热的StreamingMACD列表，顺序即标的顺序
+        """
+        if not all(stream.ready for stream in streams):
+            raise ValueError("所有StreamingMACD都必须已完成预热")
+        
+        def column(name, dtype=np.float64):
+            return np.array([getattr(stream, name) for stream in streams], dtype=dtype)
+        
+        self._k_fast = column('_k_fast')
+        self._k_slow = column('_k_slow')
+        self._k_signal = column('_k_signal')
+        self._fast_ema = column('_fast_ema')
+        self._slow_ema = column('_slow_ema')
+        self._signal_ema = column('_signal_ema')
+        self._fused = _talib_uses_fma()
+        
+        self.macd = column('macd')
+        self.signal = column('signal')
+        self.position = column('position', np.int64)
+        self.bars = column('bars', np.int64)
+    
+    def __len__(self) -> int:
+        return len(self.macd)
+    
+    def _ema_step(self, value: np.ndarray, prev: np.ndarray, k: np.ndarray) -> np.ndarray:
+        """EMA递推一步，与StreamingMACD._ema_step逐位一致"""
+        if self._fused:
+            return _fma_array(value - prev, k, prev)
+        return ((value - prev) * k) + prev
+    
+    def update(self, closes) -> np.ndarray:
+        """
+        加入一根已收盘的K线
+        
+        Args:
+            closes: 每个标的的收盘价，NaN表示该标的本次没有新K线
+            
+        Returns:
+            每个标的的交叉信号数组：1=买入, -1=卖出, 0=无信号
+        """
+        closes = np.asarray(closes, dtype=np.float64)
+        active = np.flatnonzero(~np.isnan(closes))
+        close = closes[active]
+        
+        fast_ema = self._ema_step(close, self._fast_ema[active], self._k_fast[active])
+        slow_ema = self._ema_step(close, self._slow_ema[active], self._k_slow[active])
+        macd = fast_ema - slow_ema
+        signal = self._ema_step(macd, self._signal_ema[active], self._k_signal[active])
+        
+        # 交叉规则与StreamingMACD._crossover一致
+        prev_macd, prev_signal = self.macd[active], self.signal[active]
+        crossover = np.where((prev_macd <= prev_signal) & (macd > signal), 1,
+                             np.where((prev_macd >= prev_signal) & (macd < signal), -1, 0))
+        
+        self._fast_ema[active] = fast_ema
+        self._slow_ema[active] = slow_ema
+        self._signal_ema[active] = signal
+        self.macd[active] = macd
+        self.signal[active] = signal
+        self.bars[active] += 1
+        self.position[active] = np.where(crossover != 0, crossover, self.position[active])
+        
+        signals = np.zeros(len(closes), dtype=np.int64)
+        signals[active] = crossover
+        return signals
+    
+    def write_back(self, streams: List[StreamingMACD]):
+        """
+        把当前状态写回StreamingMACD对象（例如切换回逐标的运行时）
+        
+        Args:
+            streams: 与初始化时顺序相同的StreamingMACD列表
+        """
+        for i, stream in enumerate(streams):
+            stream._fast_ema = float(self._fast_ema[i])
+            stream._slow_ema = float(self._slow_ema[i])
+            stream._signal_ema = float(self._signal_ema[i])
+            stream.macd = float(self.macd[i])
+            stream.signal = float(self.signal[i])
+            stream.histogram = stream.macd - stream.signal
+            stream.position = int(self.position[i])
+            stream.bars = int(self.bars[i])
+
 
 class BacktestingStrategy:
     """
@@ -129,6 +555,9 @@ class BacktestingStrategy:
             signalperiod=self.signal_period
         )
         
+        # 交叉规则与MACDStrategy共用
+        self.signals = pd.Series(_crossover_signals(self.macd, self.signal)[0], index=close.index)
+        
         # 转换为pandas Series
         self.macd = pd.Series(self.macd, index=close.index)
         self.signal = pd.Series(self.signal, index=close.index)
@@ -136,26 +565,12 @@ class BacktestingStrategy:
     
     def next(self):
         """每个时间步的策略逻辑（backtesting.py要求的方法）"""
-        # 获取当前和前一个MACD值
-        if len(self.data) < 2:
-            return
-        
-        current_macd = self.macd[-1]
-        current_signal = self.signal[-1]
-        prev_macd = self.macd[-2]
-        prev_signal = self.signal[-2]
+        current_signal = self.signals.iloc[-1]
         
-        # 跳过NaN值
-        if pd.isna(current_macd) or pd.isna(current_signal) or pd.isna(prev_macd) or pd.isna(prev_signal):
-            return
-        
-        # 买入信号：MACD线从下方穿越信号线
-        if prev_macd <= prev_signal and current_macd > current_signal:
+        if current_signal == 1:
             if not self.position:
                 self.buy()
-        
-        # 卖出信号：MACD线从上方穿越信号线
-        elif prev_macd >= prev_signal and current_macd < current_signal:
+        elif current_signal == -1:
             if self.position:
                 self.sell()
 
@@ -174,11 +589,14 @@ def create_backtesting_strategy(fast_period=12, slow_period=26, signal_period=9)
     """
     from backtesting import Strategy
     
+    # 类体中不能直接引用同名的外层变量
+    params = {'fast_period': fast_period, 'slow_period': slow_period, 'signal_period': signal_period}
+    
     class MACDBacktestStrategy(Strategy):
         # 策略参数
-        fast_period = fast_period
-        slow_period = slow_period
-        signal_period = signal_period
+        fast_period = params['fast_period']
+        slow_period = params['slow_period']
+        signal_period = params['signal_period']
         
         def init(self):
             """初始化策略"""
@@ -186,7 +604,7 @@ def create_backtesting_strategy(fast_period=12, slow_period=26, signal_period=9)
             
             # 计算MACD指标
             macd, signal, histogram = talib.MACD(
-                close.values,
+                np.asarray(close, dtype=np.float64),
                 fastperiod=self.fast_period,
                 slowperiod=self.slow_period,
                 signalperiod=self.signal_period
@@ -196,29 +614,19 @@ def create_backtesting_strategy(fast_period=12, slow_period=26, signal_period=9)
             self.macd = self.I(lambda: macd)
             self.signal = self.I(lambda: signal)
             self.histogram = self.I(lambda: histogram)
+            
+            # 交叉规则与MACDStrategy共用
+            signals = _crossover_signals(macd, signal)[0]
+            self.signals = self.I(lambda: signals, plot=False)
         
         def next(self):
             """策略逻辑"""
-            # 获取当前和前一个MACD值
-            if len(self.data) < 2:
-                return
-            
-            current_macd = self.macd[-1]
-            current_signal = self.signal[-1]
-            prev_macd = self.macd[-2]
-            prev_signal = self.signal[-2]
+            current_signal = self.signals.iloc[-1]
             
-            # 跳过NaN值
-            if np.isnan(current_macd) or np.isnan(current_signal) or np.isnan(prev_macd) or np.isnan(prev_signal):
-                return
-            
-            # 买入信号：MACD线从下方穿越信号线
-            if prev_macd <= prev_signal and current_macd > current_signal:
+            if current_signal == 1:
                 if not self.position:
                     self.buy()
-            
-            # 卖出信号：MACD线从上方穿越信号线
-            elif prev_macd >= prev_signal and current_macd < current_signal:
+            elif current_signal == -1:
                 if self.position:
                     self.sell()
     
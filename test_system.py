@@ -10,16 +10,32 @@ from datetime import datetime, timedelta
 import tempfile
 import os
 import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from pathlib import Path
 
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from simple_trading_system.data_provider import BinanceDataProvider, DataStorage, get_bitcoin_data
-from simple_trading_system.strategy import MACDStrategy
-from simple_trading_system.backtest import BacktestRunner, run_simple_backtest
+from simple_trading_system.data_provider import BinanceDataProvider, DataStorage, get_bitcoin_data, sync_data
+from simple_trading_system.strategy import MACDStrategy, StreamingMACD, BatchStreamingMACD
+from simple_trading_system.backtest import BacktestRunner, run_simple_backtest, compare_strategies, compare_strategies_batch
 from simple_trading_system.config import config
+from simple_trading_system.benchmark import legacy_generate_signals
+from simple_trading_system import parquet_cache
+from simple_trading_system.indicators import parameter_grid, batch_macd, batch_crossover
+from simple_trading_system.optimizer import ParallelOptimizer, SharedBars, AdaptiveSearch, _window_bounds
+from simple_trading_system.vector_backtest import vectorized_backtest, simulate_long_only, compute_stats, first_decision_bar
+from simple_trading_system.walk_forward import walk_forward_folds
+from simple_trading_system.robustness import monte_carlo, trade_returns, analyze_backtest, robustness_table
+from simple_trading_system.result_cache import ResultCache, data_fingerprint, ENGINE_BACKTESTING, ENGINE_VECTORIZED
+from simple_trading_system.engine import EventEngine, SimulatedBroker
+from simple_trading_system.alpaca_trader import AlpacaTrader, AsyncAlpacaTrader, AsyncTradingBot, SnapshotCache, BarRingBuffer, closed_bars
+from simple_trading_system.live_runner import LiveRunner, next_bar_close
+from simple_trading_system.portfolio_bot import PortfolioBot
 
 
 class TestDataProvider(unittest.TestCase):
@@ -36,15 +52,8 @@ class TestDataProvider(unittest.TestCase):
         """清理测试环境"""
         try:
             if hasattr(self, 'temp_db'):
-                # 关闭数据库连接
-                if hasattr(self.storage, 'db_path'):
-                    import sqlite3
-                    # 强制关闭所有连接
-                    try:
-                        conn = sqlite3.connect(self.temp_db.name)
-                        conn.close()
-                    except:
-                        pass
+                # 关闭连接池中的数据库连接
+                self.storage.close()
                 
                 # 删除临时文件
                 import time
@@ -123,6 +132,440 @@ class TestDataProvider(unittest.TestCase):
         except Exception as e:
             print(f"✗ 数据存储测试失败: {e}")
             self.fail(f"数据存储失败: {e}")
+    
+    def test_bulk_insert_matches_row_loop(self):
+        """测试批量写入与原始逐行写入得到完全相同的数据库内容（含重复和重写的K线）"""
+        import sqlite3
+        from simple_trading_system.benchmark import legacy_save_data
+        
+        dates = pd.date_range(start='2023-01-01', periods=50, freq='h')
+        first = pd.DataFrame({col: np.random.uniform(100, 200, 50) for col in
+                              ['Open', 'High', 'Low', 'Close', 'Volume']}, index=dates)
+        # 第二批：与第一批重叠且数值不同的K线（应被忽略）、5根新K线，
+        # 以及批内重复时间戳的新K线（保留先出现的一行）
+        new = first.iloc[:5].copy()
+        new.index = pd.date_range(start=dates[-1] + pd.Timedelta(hours=1), periods=5, freq='h')
+        second = pd.concat([first.iloc[30:] + 1.0, new, new + 2.0])
+        
+        # 分块生成的元组与逐行构造的元组一致，且为原生Python类型
+        rows = list(DataStorage._iter_rows(second, 1, '1h', chunk_size=7))
+        expected = [(1, '1h', ts.value // 1_000_000, *row) for ts, row in
+                    zip(second.index, second[['Open', 'High', 'Low', 'Close', 'Volume']].itertuples(index=False))]
+        self.assertEqual(rows, expected)
+        self.assertTrue(all(type(value) in (int, float, str) for row in rows for value in row))
+        
+        legacy_db = self.temp_db.name + '.legacy'
+        self.addCleanup(lambda: os.path.exists(legacy_db) and os.unlink(legacy_db))
+        legacy = DataStorage(legacy_db)
+        self.addCleanup(legacy.close)
+        
+        for batch in (first, second):
+            self.storage.save_data(batch, 'BULK')
+            legacy_save_data(legacy_db, batch, 'BULK')
+        
+        query = ("SELECT s.symbol, p.interval, p.ts_ms, p.open, p.high, p.low, p.close, p.volume "
+                 "FROM price_data p JOIN symbols s ON s.id = p.symbol_id ORDER BY p.ts_ms")
+        with sqlite3.connect(self.storage.db_path) as bulk_conn, sqlite3.connect(legacy_db) as legacy_conn:
+            bulk_rows = bulk_conn.execute(query).fetchall()
+            self.assertEqual(bulk_rows, legacy_conn.execute(query).fetchall())
+        
+        self.assertEqual(len(bulk_rows), 55)
+        self.assertEqual([row[6] for row in bulk_rows], first['Close'].tolist() + new['Close'].tolist())
+    
+    def test_connection_pool_lifecycle(self):
+        """测试连接池按线程复用连接并可关闭后重新打开"""
+        import threading
+        
+        dates = pd.date_range(start='2023-01-01', periods=10, freq='h')
+        bars = pd.DataFrame({col: np.arange(10.0) for col in ['Open', 'High', 'Low', 'Close', 'Volume']},
+                            index=dates)
+        
+        # 同一线程多次写入复用同一个连接
+        for i in range(20):
+            self.storage.save_data(bars.iloc[i % 10:i % 10 + 1], 'POOL')
+        self.assertEqual(len(self.storage._connections), 1)
+        
+        # 其他线程获得各自的连接
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(len(self.storage.load_data('POOL'))))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [10, 10, 10])
+        self.assertEqual(len(self.storage._connections), 4)
+        
+        # 关闭后再次使用会重新建立连接
+        self.storage.close()
+        self.assertEqual(len(self.storage._connections), 0)
+        self.assertEqual(len(self.storage.load_data('POOL')), 10)
+        
+        with DataStorage(self.temp_db.name) as storage:
+            self.assertEqual(storage.get_latest_timestamp('POOL'), DataStorage._to_ms(dates[-1]))
+        self.assertEqual(storage._connections, [])
+    
+    @unittest.skipIf(parquet_cache.pq is None, "需要安装pyarrow")
+    def test_parquet_cache_tier(self):
+        """测试Parquet缓存与数据库内容一致并随save_data同步"""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        
+        # 跨越两个月的1h数据
+        dates = pd.date_range(start='2023-01-30', periods=100, freq='h')
+        bars = pd.DataFrame({col: np.arange(100.0) + i for i, col in
+                             enumerate(['Open', 'High', 'Low', 'Close', 'Volume'])}, index=dates)
+        
+        cached = DataStorage(self.temp_db.name, cache_dir=os.path.join(temp_dir.name, 'cache'))
+        self.addCleanup(cached.close)
+        cached.save_data(bars.iloc[:60], 'CACHE')
+        
+        # 重复数据保留原值，与INSERT OR IGNORE一致
+        changed = bars.copy()
+        changed['Close'] += 1000
+        cached.save_data(changed.iloc[50:], 'CACHE')
+        self.assertEqual(cached.cache.months('CACHE', '1h'), ['2023-01', '2023-02'])
+        
+        from_cache = cached.load_data('CACHE')
+        from_db = self.storage.load_data('CACHE')
+        pd.testing.assert_frame_equal(from_cache, from_db, check_freq=False)
+        
+        ranged = cached.load_data('CACHE', start_date='2023-01-31 12:00', end_date='2023-02-01 05:00')
+        pd.testing.assert_frame_equal(
+            ranged, from_db.loc['2023-01-31 12:00':'2023-02-01 05:00'], check_freq=False
+        )
+        
+        # 缓存缺失时从数据库重建
+        cached.cache.clear('CACHE', '1h')
+        pd.testing.assert_frame_equal(cached.load_data('CACHE'), from_db, check_freq=False)
+    
+    @unittest.skipIf(parquet_cache.pq is None, "需要安装pyarrow")
+    def test_parquet_cache_cold_write_keeps_db_history(self):
+        """测试缓存为空时写入新数据不会让只存在于数据库中的历史数据从读取结果中消失"""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        
+        dates = pd.date_range(start='2023-01-01', periods=105, freq='h')
+        bars = pd.DataFrame({col: np.arange(105.0) + i for i, col in
+                             enumerate(['Open', 'High', 'Low', 'Close', 'Volume'])}, index=dates)
+        
+        # 先不启用缓存写入100根，再由启用缓存的实例写入5根新K线
+        self.storage.save_data(bars.iloc[:100], 'COLD')
+        cached = DataStorage(self.temp_db.name, cache_dir=os.path.join(temp_dir.name, 'cache'))
+        self.addCleanup(cached.close)
+        cached.save_data(bars.iloc[100:], 'COLD')
+        
+        self.assertEqual(len(self.storage.load_data('COLD')), 105)
+        pd.testing.assert_frame_equal(cached.load_data('COLD'), self.storage.load_data('COLD'), check_freq=False)
+    
+    def test_mmap_backend(self):
+        """测试内存映射存储后端的追加、合并和零拷贝读取"""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        storage = DataStorage(backend='mmap', store_dir=temp_dir.name)
+        
+        dates = pd.date_range(start='2023-01-01', periods=3000, freq='h')
+        bars = pd.DataFrame({col: np.arange(3000.0) + i for i, col in
+                             enumerate(['Open', 'High', 'Low', 'Close', 'Volume'])}, index=dates)
+        
+        # 首次写入、原地追加、超过容量后扩容、与已有数据重叠合并
+        storage.save_data(bars.iloc[:500], 'MMAP')
+        storage.save_data(bars.iloc[500:800], 'MMAP')
+        self.assertEqual(storage.bar_store.read_header('MMAP', '1h')['capacity'], 1024)
+        storage.save_data(bars.iloc[800:2000], 'MMAP')
+        changed = bars.copy()
+        changed['Close'] += 1000
+        storage.save_data(changed.iloc[1500:2500].drop(changed.index[1600:1610]), 'MMAP')
+        
+        # 已有的K线保留原值，新增的K线来自changed
+        expected = pd.concat([bars.iloc[:2000], changed.iloc[2000:2500]])
+        loaded = storage.load_data('MMAP')
+        pd.testing.assert_frame_equal(loaded, expected, check_freq=False, check_names=False)
+        
+        arrays = storage.load_arrays('MMAP', start_date='2023-01-02', end_date='2023-01-03')
+        self.assertIsInstance(arrays['close'].base, np.memmap)
+        self.assertFalse(arrays['close'].flags.writeable)
+        self.assertEqual(len(arrays['ts']), 25)
+        self.assertEqual(arrays['open'][0], 24.0)
+        
+        self.assertEqual(storage.get_latest_timestamp('MMAP'), DataStorage._to_ms(dates[2499]))
+        self.assertEqual(storage.find_gaps('MMAP'), [])
+        
+        storage.save_data(bars.iloc[2600:], 'MMAP')
+        self.assertEqual(storage.find_gaps('MMAP'),
+                         [(DataStorage._to_ms(dates[2500]), DataStorage._to_ms(dates[2599]))])
+        
+        # 已确认没有数据的区间与K线分开保存
+        storage.mark_empty('MMAP', '1h', storage.find_gaps('MMAP'))
+        self.assertEqual(storage.empty_ranges('MMAP'), storage.find_gaps('MMAP'))
+    
+    def test_migrate_v1_schema(self):
+        """测试v1文本时间戳表迁移到v2结构"""
+        import sqlite3
+        
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        db_path = os.path.join(temp_dir.name, 'v1.db')
+        
+        # 构造v1结构的数据库
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('''
+                CREATE TABLE price_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT NOT NULL,
+                    timestamp DATETIME NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    volume REAL NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(symbol, timestamp)
+                )
+            ''')
+            dates = pd.date_range(start='2023-01-01', periods=250, freq='h')
+            conn.executemany(
+                'INSERT INTO price_data (symbol, timestamp, open, high, low, close, volume) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(symbol, ts.strftime('%Y-%m-%d %H:%M:%S'), i, i + 1, i - 1, i + 0.5, 10.0)
+                 for symbol in ('AAA', 'BBB') for i, ts in enumerate(dates)]
+            )
+        
+        # 打开数据库时只改名v1表，不执行迁移
+        storage = DataStorage(db_path)
+        self.addCleanup(storage.close)
+        self.assertTrue(storage.needs_migration())
+        self.assertTrue(storage.load_data('AAA').empty)
+        
+        # 迁移中断后再次运行从剩余的行继续
+        from unittest import mock
+        transaction = storage._transaction
+        calls = []
+        
+        def interrupted():
+            calls.append(1)
+            if len(calls) > 3:
+                raise KeyboardInterrupt
+            return transaction()
+        
+        with mock.patch.object(storage, '_transaction', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                storage.migrate_to_v2(batch_size=100)
+        self.assertEqual(len(storage.load_data('AAA')), 200)
+        
+        # 通过命令行完成剩余的迁移
+        from simple_trading_system import main as main_module
+        with mock.patch.multiple(config, DATABASE_PATH=db_path, PARQUET_CACHE_DIR=None, STORAGE_BACKEND='sqlite'):
+            with mock.patch.object(sys, 'argv', ['main.py', '--mode', 'migrate']):
+                main_module.cli_main()
+        self.assertFalse(storage.needs_migration())
+        self.assertEqual(storage.migrate_to_v2(), 0)
+        
+        loaded = storage.load_data('BBB', start_date='2023-01-02', end_date='2023-01-03')
+        self.assertEqual(len(loaded), 25)
+        self.assertEqual(loaded.index[0], pd.Timestamp('2023-01-02'))
+        self.assertEqual(loaded['Open'].iloc[0], 24.0)
+        self.assertEqual(len(storage.load_data('AAA')), 250)
+        self.assertEqual(storage.get_latest_timestamp('AAA'), DataStorage._to_ms(dates[-1]))
+        
+        with sqlite3.connect(db_path) as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+        self.assertNotIn('price_data_v1', tables)
+        self.assertEqual(version, DataStorage.SCHEMA_VERSION)
+
+
+class FakeBinanceHandler(BaseHTTPRequestHandler):
+    """本地模拟的币安K线接口，按请求的时间范围生成确定性的1h K线"""
+    
+    interval_ms = 3_600_000
+    listing_time = 1_672_531_200_000  # 2023-01-01 00:00:00 UTC
+    
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        start = int(query.get('startTime', [self.listing_time])[0])
+        end = int(query['endTime'][0])
+        limit = int(query.get('limit', [500])[0])
+        
+        requests = getattr(self.server, 'requests', None)
+        if requests is not None:
+            requests.append((query['symbol'][0], start, end))
+        
+        if query['symbol'][0] not in getattr(self.server, 'symbols', {'BTCUSDT'}):
+            body = json.dumps({'code': -1121, 'msg': 'Invalid symbol.'}).encode()
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        
+        # 对齐到K线开盘时间，且不早于上市时间
+        first = max(start, self.listing_time)
+        first += (-(first - self.listing_time)) % self.interval_ms
+        
+        # 交易所停机期间没有K线
+        missing_start, missing_end = getattr(self.server, 'missing', (0, -1))
+        
+        klines = []
+        for open_time in range(first, end + 1, self.interval_ms):
+            if len(klines) >= limit:
+                break
+            if missing_start <= open_time <= missing_end:
+                continue
+            price = 20000 + (open_time - self.listing_time) // self.interval_ms
+            klines.append([open_time, str(price), str(price + 5), str(price - 5), str(price + 1),
+                           "1.5", open_time + self.interval_ms - 1, "0", 10, "0", "0", "0"])
+        
+        body = json.dumps(klines).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class TestBinanceRangeFetch(unittest.TestCase):
+    """分页并发K线下载测试（本地模拟服务器）"""
+    
+    def setUp(self):
+        """启动本地模拟服务器"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBinanceHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.provider = BinanceDataProvider(
+            base_url=f"http://127.0.0.1:{self.server.server_address[1]}",
+            max_workers=4
+        )
+    
+    def tearDown(self):
+        """关闭本地模拟服务器"""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def test_range_fetch_stitches_windows(self):
+        """测试超过1000根K线的范围被完整拼接"""
+        start = FakeBinanceHandler.listing_time
+        end = start + 2500 * FakeBinanceHandler.interval_ms - 1
+        
+        df = self.provider.get_historical_range('BTCUSDT', '1h', start, end)
+        
+        self.assertEqual(len(df), 2500)
+        self.assertTrue(df.index.is_monotonic_increasing)
+        self.assertTrue(df.index.is_unique)
+        self.assertEqual(df['Open'].iloc[0], 20000.0)
+        self.assertEqual(df['Open'].iloc[-1], 22499.0)
+        self.assertEqual(self.provider.last_fetch_stats['requests'], 3)
+        self.assertGreater(self.provider.last_fetch_stats['bars_per_second'], 0)
+        
+        print(f"✓ 分页下载测试通过，共 {len(df)} 条数据")
+    
+    def test_range_fetch_before_listing(self):
+        """测试范围起点早于上市时间时只返回已有数据"""
+        start = FakeBinanceHandler.listing_time - 1500 * FakeBinanceHandler.interval_ms
+        end = FakeBinanceHandler.listing_time + 10 * FakeBinanceHandler.interval_ms - 1
+        
+        df = self.provider.get_historical_range('BTCUSDT', '1h', start, end)
+        
+        self.assertEqual(len(df), 10)
+    
+    def test_incremental_sync_fills_gaps(self):
+        """测试增量同步只下载缺失的尾部并回补内部缺口"""
+        import sqlite3
+        
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        storage = DataStorage(os.path.join(temp_dir.name, 'sync.db'))
+        self.addCleanup(storage.close)
+        
+        first = sync_data('BTCUSDT', '1h', days=3, provider=self.provider, storage=storage)
+        self.assertGreaterEqual(first, 71)
+        
+        # 删除中间的10根K线制造缺口
+        with sqlite3.connect(storage.db_path) as conn:
+            conn.execute('''
+                DELETE FROM price_data WHERE ts_ms IN (
+                    SELECT ts_ms FROM price_data ORDER BY ts_ms LIMIT 10 OFFSET 20
+                )
+            ''')
+        self.assertEqual(len(storage.find_gaps('BTCUSDT', '1h')), 1)
+        
+        second = sync_data('BTCUSDT', '1h', days=3, provider=self.provider, storage=storage)
+        self.assertLessEqual(second, 11)
+        self.assertGreaterEqual(second, 10)
+        self.assertEqual(storage.find_gaps('BTCUSDT', '1h'), [])
+        
+        df = storage.load_data('BTCUSDT')
+        self.assertEqual(len(df), first + second - 10)
+        self.assertEqual(df['Open'].diff().dropna().unique().tolist(), [1.0])
+    
+    def test_sync_skips_verified_empty_gaps(self):
+        """测试交易所永久缺失的区间回补一次后被记录，之后的同步不再请求"""
+        import time
+        hour = FakeBinanceHandler.interval_ms
+        base = int(time.time() * 1000) // hour * hour
+        self.server.missing = (base - 40 * hour, base - 31 * hour)
+        self.server.requests = []
+        
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        storage = DataStorage(os.path.join(temp_dir.name, 'sync.db'))
+        self.addCleanup(storage.close)
+        
+        sync_data('BTCUSDT', '1h', days=3, provider=self.provider, storage=storage)
+        self.assertEqual(storage.find_gaps('BTCUSDT', '1h'), [self.server.missing])
+        
+        # 第一次回补确认交易所没有数据并记录
+        self.assertEqual(sync_data('BTCUSDT', '1h', days=3, provider=self.provider, storage=storage), 0)
+        self.assertEqual(storage.empty_ranges('BTCUSDT', '1h'), [self.server.missing])
+        self.assertIn(self.server.missing[0], [start for _, start, _ in self.server.requests])
+        
+        # 之后不再请求该缺口
+        self.server.requests.clear()
+        sync_data('BTCUSDT', '1h', days=3, provider=self.provider, storage=storage)
+        self.assertNotIn(self.server.missing[0], [start for _, start, _ in self.server.requests])
+    
+    def test_sync_cli(self):
+        """测试命令行增量同步：正常同步写入数据库，无效交易对以非零状态退出"""
+        from unittest import mock
+        from simple_trading_system import main as main_module
+        
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        db_path = os.path.join(temp_dir.name, 'cli.db')
+        
+        with mock.patch.multiple(config, BINANCE_BASE_URL=self.provider.base_url, DATABASE_PATH=db_path,
+                                 PARQUET_CACHE_DIR=None, STORAGE_BACKEND='sqlite'):
+            with mock.patch.object(sys, 'argv', ['main.py', '--mode', 'sync', '--symbols', 'BTCUSDT',
+                                                 '--interval', '1h', '--days', '2']):
+                main_module.cli_main()
+            
+            with DataStorage(db_path) as storage:
+                self.assertGreaterEqual(len(storage.load_data('BTCUSDT')), 47)
+                # 1M的K线长度不固定，不能按固定间隔检查缺口
+                with self.assertRaises(ValueError):
+                    storage.find_gaps('BTCUSDT', '1M')
+            
+            
+            # 无效交易对不影响之后的交易对，全部同步后以非零状态退出
+            other_db = os.path.join(temp_dir.name, 'cli_other.db')
+            with mock.patch.object(config, 'DATABASE_PATH', other_db):
+                with mock.patch.object(sys, 'argv', ['main.py', '--mode', 'sync', '--symbols', 'NOPE,BTCUSDT',
+                                                     '--interval', '1h', '--days', '2']):
+                    with self.assertRaises(SystemExit) as raised:
+                        main_module.cli_main()
+            self.assertIn('NOPE', str(raised.exception.code))
+            self.assertNotIn('BTCUSDT', str(raised.exception.code))
+            with DataStorage(other_db) as storage:
+                self.assertGreaterEqual(len(storage.load_data('BTCUSDT')), 47)
+            
+            for interval in ('7h', '1M'):
+                with mock.patch.object(sys, 'argv', ['main.py', '--mode', 'sync', '--interval', interval]):
+                    with self.assertRaises(SystemExit):
+                        main_module.cli_main()
 
 
 class TestMACDStrategy(unittest.TestCase):
@@ -190,6 +633,93 @@ class TestMACDStrategy(unittest.TestCase):
         except Exception as e:
             print(f"✗ 信号生成测试失败: {e}")
             self.fail(f"信号生成失败: {e}")
+    
+    def test_vectorized_signals_match_loop(self):
+        """测试向量化信号与逐行循环结果完全一致"""
+        data = self.test_data.copy()
+        data.iloc[60, data.columns.get_loc('Close')] = np.nan
+        
+        vectorized = MACDStrategy()
+        legacy = MACDStrategy()
+        
+        # 连续两次调用，验证仓位状态跨调用延续
+        for frame in (self.test_data, data):
+            result = vectorized.generate_signals(frame)
+            expected = legacy_generate_signals(legacy, frame)
+            pd.testing.assert_frame_equal(result, expected)
+            self.assertEqual(vectorized.position, legacy.position)
+        
+        print(f"✓ 向量化信号一致性测试通过")
+    
+    def test_streaming_macd_matches_batch(self):
+        """测试增量MACD与TA-Lib批量计算逐位一致且交叉信号相同"""
+        import talib
+        
+        np.random.seed(7)
+        closes = np.cumsum(np.random.normal(0, 1, 600)) + 100
+        
+        for fast, slow, signal in [(12, 26, 9), (8, 21, 5), (26, 12, 9)]:
+            macd, signal_line, _ = talib.MACD(closes, fastperiod=fast, slowperiod=slow, signalperiod=signal)
+            batch = MACDStrategy(fast, slow, signal)
+            expected = batch.generate_signals(pd.DataFrame({'Close': closes}))['Signal'].values
+            
+            stream = StreamingMACD(fast, slow, signal)
+            events, macd_values, signal_values = [], [], []
+            for close in closes:
+                # 逐笔预判不改变状态
+                stream.peek(close * 1.01)
+                events.append(stream.update(close))
+                macd_values.append(np.nan if stream.macd is None else stream.macd)
+                signal_values.append(np.nan if stream.signal is None else stream.signal)
+            
+            np.testing.assert_array_equal(np.array(macd_values), macd)
+            np.testing.assert_array_equal(np.array(signal_values), signal_line)
+            np.testing.assert_array_equal(np.array(events), expected)
+            self.assertEqual(stream.position, batch.position)
+            
+            # 用历史批量预热后继续增量更新，结果不变
+            seeded = batch.create_stream(pd.Series(closes[:400]))
+            continued = [seeded.update(close) for close in closes[400:]]
+            np.testing.assert_array_equal(np.array(continued), expected[400:])
+            self.assertEqual(seeded.macd, stream.macd)
+            self.assertEqual(seeded.signal, stream.signal)
+        
+        print(f"✓ 增量MACD一致性测试通过")
+
+
+class TestBatchIndicators(unittest.TestCase):
+    """批量指标测试"""
+    
+    def test_batch_macd_matches_per_combination(self):
+        """测试批量MACD与逐组计算逐位一致"""
+        import talib
+        
+        np.random.seed(11)
+        df = pd.DataFrame({'Close': np.cumsum(np.random.normal(0, 1, 500)) + 100})
+        params = parameter_grid(range(5, 14, 4), range(12, 40, 9), [1, 5, 9])
+        self.assertTrue(np.all(params[:, 0] < params[:, 1]))
+        
+        macd, signal, histogram = batch_macd(df['Close'].values, params)
+        signals, positions = batch_crossover(macd, signal)
+        self.assertEqual(macd.shape, (len(params), len(df)))
+        
+        for row, (fast, slow, signal_period) in enumerate(params):
+            strategy = MACDStrategy(int(fast), int(slow), int(signal_period))
+            expected_macd, expected_signal, expected_hist = talib.MACD(
+                df['Close'].values, fastperiod=int(fast), slowperiod=int(slow), signalperiod=int(signal_period))
+            np.testing.assert_array_equal(macd[row], expected_macd)
+            np.testing.assert_array_equal(signal[row], expected_signal)
+            np.testing.assert_array_equal(histogram[row], expected_hist)
+            
+            expected = strategy.generate_signals(df)
+            np.testing.assert_array_equal(signals[row], expected['Signal'].values)
+            np.testing.assert_array_equal(positions[row], expected['Position'].values)
+        
+        # 数据不足lookback时全部为NaN
+        short_macd, short_signal, _ = batch_macd(df['Close'].values[:20], [[12, 26, 9]])
+        self.assertTrue(np.isnan(short_macd).all() and np.isnan(short_signal).all())
+        
+        print(f"✓ 批量MACD一致性测试通过")
 
 
 class TestBacktesting(unittest.TestCase):
@@ -241,6 +771,1514 @@ class TestBacktesting(unittest.TestCase):
         except Exception as e:
             print(f"✗ 回测运行器测试失败: {e}")
             self.fail(f"回测运行器失败: {e}")
+    
+    def test_vectorized_matches_backtesting(self):
+        """测试向量化回测与FractionalBacktest的统计结果一致"""
+        np.random.seed(3)
+        n = 1500
+        prices = 45000 + np.cumsum(np.random.normal(0, 150, n))
+        data = pd.DataFrame({
+            'Open': prices * (1 + np.random.normal(0, 0.001, n)),
+            'High': prices * 1.003,
+            'Low': prices * 0.997,
+            'Close': prices,
+            'Volume': np.random.uniform(1000, 10000, n)
+        }, index=pd.date_range(start='2023-01-01', periods=n, freq='h'))
+        
+        for params in [None, {'fast_period': 8, 'slow_period': 21, 'signal_period': 5, 'position_size': 0.6}]:
+            runner = BacktestRunner(data, params)
+            expected = runner.run_backtest(cash=10000, commission=0.002)
+            result = runner.run_vectorized(cash=10000, commission=0.002)
+            
+            self.assertGreater(result['results']['# Trades'], 10)
+            self.assertEqual(set(result['results']), set(expected['results']))
+            for key, value in expected['results'].items():
+                if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+                    self.assertEqual(result['results'][key], value, key)
+                else:
+                    np.testing.assert_allclose(result['results'][key], value, rtol=1e-9, err_msg=key)
+            
+            raw = expected['raw_results']
+            np.testing.assert_allclose(result['equity_curve'].values, raw['_equity_curve']['Equity'].values, rtol=1e-12)
+            np.testing.assert_array_equal(result['trades']['EntryBar'].values, raw['_trades']['EntryBar'].values)
+            np.testing.assert_allclose(result['trades']['PnL'].values, raw['_trades']['PnL'].values, rtol=1e-9)
+        
+        print(f"✓ 向量化回测一致性测试通过")
+    
+    def test_headless_backtest(self):
+        """测试headless回测不生成图表且只保留统计指标"""
+        runner = BacktestRunner(self.test_data)
+        expected = runner.run_vectorized(cash=10000, commission=0.002)
+        
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.chdir(temp_dir)
+            try:
+                result = runner.run_backtest(cash=10000, commission=0.002, headless=True, equity_points=20)
+                self.assertEqual(os.listdir(temp_dir), [])
+            finally:
+                os.chdir(cwd)
+        
+        self.assertIsNone(result['backtest_instance'])
+        self.assertIsNone(result['raw_results'])
+        np.testing.assert_allclose(result['results']['Return [%]'], expected['results']['Return [%]'], rtol=1e-9)
+        
+        # 压缩后的权益曲线保留首尾和极值
+        curve = result['equity_curve']
+        full = expected['equity_curve']
+        self.assertLessEqual(len(curve), 20)
+        self.assertEqual(curve.index[0], full.index[0])
+        self.assertEqual(curve.index[-1], full.index[-1])
+        self.assertAlmostEqual(curve.max(), full.max(), places=6)
+        self.assertAlmostEqual(curve.min(), full.min(), places=6)
+        self.assertTrue(curve.index.is_monotonic_increasing)
+        
+        print(f"✓ headless回测测试通过")
+
+
+class TestParallelOptimizer(unittest.TestCase):
+    """并行参数优化测试"""
+    
+    def setUp(self):
+        """测试设置"""
+        np.random.seed(5)
+        n = 800
+        prices = 45000 + np.cumsum(np.random.normal(0, 150, n))
+        self.test_data = pd.DataFrame({
+            'Open': prices * (1 + np.random.normal(0, 0.001, n)),
+            'High': prices * 1.003,
+            'Low': prices * 0.997,
+            'Close': prices,
+            'Volume': np.random.uniform(1000, 10000, n)
+        }, index=pd.date_range(start='2023-01-01', periods=n, freq='h'))
+    
+    def test_grid_matches_serial_backtest(self):
+        """测试并行优化结果与逐个向量化回测一致"""
+        progress = []
+        optimizer = ParallelOptimizer(self.test_data, cash=10000, max_workers=2, chunk_size=3)
+        result = optimizer.run(range(8, 14, 2), range(10, 22, 4), [5, 9], [0.5, 0.8],
+                               progress_callback=lambda done, total: progress.append((done, total)))
+        
+        results = result['results']
+        expected_total = len(parameter_grid(range(8, 14, 2), range(10, 22, 4), [5, 9])) * 2
+        self.assertEqual(len(results), expected_total)
+        self.assertTrue((results['fast_period'] < results['slow_period']).all())
+        self.assertEqual(progress[-1], (expected_total, expected_total))
+        self.assertEqual([done for done, _ in progress], sorted(done for done, _ in progress))
+        self.assertFalse(result['cancelled'])
+        
+        for _, row in results.sample(4, random_state=0).iterrows():
+            serial = vectorized_backtest(self.test_data, int(row['fast_period']), int(row['slow_period']),
+                                         int(row['signal_period']), row['position_size'], cash=10000)
+            self.assertAlmostEqual(row['Return [%]'], serial['results']['Return [%]'], places=9)
+            self.assertEqual(row['# Trades'], serial['results']['# Trades'])
+        
+        self.assertEqual(result['best_result']['Return [%]'], results['Return [%]'].max())
+        
+        print(f"✓ 并行参数优化测试通过")
+    
+    def test_cancel_and_shared_memory_cleanup(self):
+        """测试取消优化以及共享内存回收"""
+        optimizer = ParallelOptimizer(self.test_data, max_workers=2, chunk_size=1)
+        
+        def cancel_early(done, total):
+            optimizer.cancel()
+        
+        result = optimizer.run(range(8, 16), range(20, 30), [9], progress_callback=cancel_early)
+        self.assertTrue(result['cancelled'])
+        self.assertLess(len(result['results']), len(parameter_grid(range(8, 16), range(20, 30), [9])))
+        
+        # 迭代开始之前的取消不会丢失
+        optimizer = ParallelOptimizer(self.test_data, max_workers=2, chunk_size=1)
+        results = optimizer.iter_results(range(8, 16), range(20, 30), [9])
+        optimizer.cancel()
+        self.assertEqual(list(results), [])
+        self.assertTrue(optimizer.cancelled)
+        
+        bars = SharedBars(self.test_data)
+        arrays, blocks = SharedBars.attach(bars.spec)
+        np.testing.assert_array_equal(arrays['close'], self.test_data['Close'].values)
+        for block in blocks:
+            block.close()
+        bars.close()
+        with self.assertRaises(FileNotFoundError):
+            SharedBars.attach(bars.spec)
+        
+        print(f"✓ 优化取消和共享内存回收测试通过")
+    
+    def test_adaptive_search_near_grid_best(self):
+        """测试自适应搜索在10%预算内接近网格最优"""
+        space_args = (range(5, 15), range(15, 35, 2), range(5, 12), [0.5, 0.8])
+        grid = ParallelOptimizer(self.test_data, cash=10000, max_workers=1).run(*space_args)
+        returns = grid['results']['Return [%]'].fillna(-np.inf).values
+        budget = len(returns) // 10
+        
+        for method in ('successive_halving', 'tpe'):
+            search = AdaptiveSearch(self.test_data, cash=10000, seed=0)
+            result = getattr(search, method)(search.build_space(*space_args), budget)
+            self.assertLessEqual(result['evaluations'], budget)
+            self.assertEqual(set(result['best_params']), set(grid['best_params']))
+            best = result['best_result']['Return [%]']
+            # 最优结果应位于网格前5%
+            self.assertLessEqual((returns > best).mean(), 0.05, method)
+            # 全量数据上的评估结果与网格一致
+            match = grid['results']
+            for key, value in result['best_params'].items():
+                match = match[np.isclose(match[key], value)]
+            self.assertAlmostEqual(match['Return [%]'].iloc[0], best, places=9)
+        
+        runner = BacktestRunner(self.test_data)
+        result = runner.optimize_strategy((5, 15), (15, 35), (5, 12), (0.5, 1.0), cash=10000,
+                                          method='tpe', max_evals=60, seed=1)
+        self.assertEqual(result['evaluations'], 60)
+        self.assertEqual(runner.strategy_params['fast_period'], result['best_params']['fast_period'])
+        with self.assertRaises(ValueError):
+            runner.optimize_strategy(method='random')
+        
+        print(f"✓ 自适应参数搜索测试通过")
+    
+    def test_compare_strategies_batch(self):
+        """测试多交易对、多窗口的批量策略比较"""
+        other = self.test_data.copy()
+        other[['Open', 'High', 'Low', 'Close']] *= np.linspace(1.0, 1.2, len(other))[:, None]
+        data = {'BTCUSDT': self.test_data, 'ETHUSDT': other}
+        windows = [(None, '2023-01-20'), ('2023-01-10', None)]
+        configs = [
+            {'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'position_size': 0.8},
+            {'fast_period': 8, 'slow_period': 21, 'signal_period': 5, 'position_size': 0.6},
+        ]
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = os.path.join(temp_dir, 'results.db')
+            df = compare_strategies_batch(symbols=list(data), windows=windows, strategy_configs=configs,
+                                          data=data, max_workers=2, cache_path=cache_path)
+            
+            self.assertEqual(len(df), 2 * 2 * 2)
+            self.assertFalse(df['cached'].any())
+            self.assertTrue((df['seconds'] > 0).all())
+            self.assertEqual(set(df['symbol']), set(data))
+            
+            for _, row in df.iterrows():
+                window = data[row['symbol']].loc[row['window_start']:row['window_end']]
+                self.assertEqual(len(window), row['bars'])
+                expected = vectorized_backtest(window, row['fast_period'], row['slow_period'],
+                                               row['signal_period'], row['position_size'], cash=10000)
+                self.assertAlmostEqual(row['Return [%]'], expected['results']['Return [%]'], places=9)
+            
+            # 第二次运行全部命中缓存
+            cached = compare_strategies_batch(symbols=list(data), windows=windows, strategy_configs=configs,
+                                              data=data, max_workers=2, cache_path=cache_path)
+            self.assertTrue(cached['cached'].all())
+            np.testing.assert_allclose(cached['Return [%]'], df['Return [%]'], rtol=1e-12)
+        
+            
+            # 带时区的窗口端点按UTC与无时区索引对齐
+            index = self.test_data.index
+            self.assertEqual(_window_bounds(index, (pd.Timestamp('2023-01-10', tz='UTC'), None)),
+                             _window_bounds(index, ('2023-01-10', None)))
+            self.assertEqual(_window_bounds(index, (None, pd.Timestamp('2023-01-20 08:00', tz='Asia/Shanghai'))),
+                             _window_bounds(index, (None, '2023-01-20')))
+        
+        print(f"✓ 批量策略比较测试通过")
+    
+    def test_compare_strategies_batch_mixed_windows(self):
+        """测试显式结束时间、带时区时间和开放结束的窗口混用时只下载一次"""
+        from unittest import mock
+        test_data = self.test_data
+        requests = []
+        
+        class FakeProvider:
+            def get_historical_range(self, symbol, interval, start_time=None, end_time=None):
+                requests.append((symbol, start_time, end_time))
+                return test_data
+        
+        windows = [('2023-01-05', '2023-01-20'),
+                   (pd.Timestamp('2023-01-10 08:00', tz='Asia/Shanghai'), None)]
+        configs = [{'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'position_size': 0.8}]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with mock.patch('simple_trading_system.backtest.BinanceDataProvider', FakeProvider):
+                df = compare_strategies_batch(symbols=['BTCUSDT'], windows=windows, strategy_configs=configs,
+                                              max_workers=1, cache_path=os.path.join(temp_dir, 'results.db'))
+        
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0][1], int(pd.Timestamp('2023-01-05', tz='UTC').timestamp() * 1000))
+        self.assertGreater(requests[0][2], int(pd.Timestamp('2023-01-20', tz='UTC').timestamp() * 1000))
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df['window_start'].iloc[1], pd.Timestamp('2023-01-10'))
+        
+        print(f"✓ 混合窗口批量比较测试通过")
+    
+    def test_compare_strategies(self):
+        """测试compare_strategies保持FractionalBacktest和字典返回值"""
+        from unittest import mock
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with mock.patch('simple_trading_system.backtest.get_bitcoin_data', return_value=self.test_data):
+                results = compare_strategies(days=30, cache_path=os.path.join(temp_dir, 'results.db'))
+        
+        self.assertEqual(list(results), ['Strategy_1', 'Strategy_2', 'Strategy_3'])
+        runner = BacktestRunner(self.test_data, results['Strategy_1']['params'])
+        expected = runner.run_backtest(cash=10000, headless=True)['results']
+        self.assertAlmostEqual(results['Strategy_1']['results']['Return [%]'], expected['Return [%]'], places=9)
+        
+        print(f"✓ 策略比较测试通过")
+    
+    def test_walk_forward(self):
+        """测试滚动窗口优化的参数选择和样本外权益拼接"""
+        self.assertEqual(walk_forward_folds(10, 4, 2), [(0, 4, 4, 6), (2, 6, 6, 8), (4, 8, 8, 10)])
+        self.assertEqual(walk_forward_folds(10, 4, 3, anchored=True), [(0, 4, 4, 7), (0, 7, 7, 10)])
+        
+        runner = BacktestRunner(self.test_data)
+        result = runner.walk_forward(300, 100, (6, 12, 2), (14, 26, 4), (5, 10, 4), (0.5, 0.9),
+                                     cash=10000, max_workers=2)
+        folds = result['folds']
+        self.assertEqual(len(folds), 5)
+        
+        close = self.test_data['Close'].values
+        params = parameter_grid(range(6, 12, 2), range(14, 26, 4), range(5, 10, 4))
+        macd, signal, _ = batch_macd(close, params)
+        signals, _ = batch_crossover(macd, signal)
+        
+        # 每折选出的参数是训练窗口上的最优组合
+        fold = folds.iloc[1]
+        start, end = 100, 400
+        train = self.test_data.iloc[start:end]
+        train_returns = []
+        for row, (fast, slow, signal_period) in enumerate(params):
+            # 与网格优化相同的预热K线数
+            first_bar = first_decision_bar(end - start, fast, slow, signal_period)
+            for size in (0.5, 0.6, 0.7, 0.8):
+                simulation = simulate_long_only(train['Open'].values, close[start:end], signals[row, start:end],
+                                                position_size=size, cash=10000, first_bar=first_bar)
+                stats = compute_stats(train.index, close[start:end], simulation['equity'], simulation['trades'])
+                train_returns.append(stats['Return [%]'])
+        best = np.nanmax(train_returns)
+        self.assertAlmostEqual(fold['Train Return [%]'], best, places=9)
+        
+        # 样本外权益由各折首尾相接、连续复利
+        equity = result['equity_curve']
+        self.assertEqual(equity.index[0], folds['test_start'].iloc[0])
+        self.assertEqual(equity.index[-1], folds['test_end'].iloc[-1])
+        self.assertEqual(len(equity), 500)
+        compounded = np.prod(1 + folds['Return [%]'].values / 100)
+        self.assertAlmostEqual(equity.iloc[-1] / 10000, compounded, places=9)
+        self.assertAlmostEqual(result['results']['Equity Final [$]'], equity.iloc[-1], places=6)
+        self.assertEqual(result['results']['# Trades'], folds['# Trades'].sum())
+        
+        # step大于test_bars时，样本外权益只包含各折的测试窗口
+        result = runner.walk_forward(300, 100, (6, 12, 2), (14, 26, 4), (5, 10, 4), (0.5, 0.9),
+                                     step=150, cash=10000, max_workers=2)
+        folds = result['folds']
+        equity = result['equity_curve']
+        self.assertEqual(len(folds), 3)
+        self.assertEqual(len(equity), 3 * 100)
+        self.assertTrue(equity.index.is_monotonic_increasing)
+        expected_index = np.concatenate([self.test_data.index[300 + 150 * k:400 + 150 * k] for k in range(3)])
+        self.assertTrue((equity.index == expected_index).all())
+        self.assertTrue(np.isfinite(equity.values).all())
+        self.assertTrue((equity.values > 0).all())
+        compounded = np.prod(1 + folds['Return [%]'].values / 100)
+        self.assertAlmostEqual(equity.iloc[-1] / 10000, compounded, places=9)
+        self.assertLessEqual(result['results']['Max. Drawdown [%]'], 0)
+        self.assertGreater(result['results']['Max. Drawdown [%]'], -100)
+        
+        print(f"✓ 滚动窗口优化测试通过")
+
+
+class TestResultCache(unittest.TestCase):
+    """回测结果缓存测试"""
+    
+    def setUp(self):
+        """测试设置"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.temp_dir, 'results.db'))
+        
+        np.random.seed(9)
+        n = 600
+        prices = 45000 + np.cumsum(np.random.normal(0, 150, n))
+        self.test_data = pd.DataFrame({
+            'Open': prices * (1 + np.random.normal(0, 0.001, n)),
+            'High': prices * 1.003,
+            'Low': prices * 0.997,
+            'Close': prices,
+            'Volume': np.random.uniform(1000, 10000, n)
+        }, index=pd.date_range(start='2023-01-01', periods=n, freq='h'))
+    
+    def tearDown(self):
+        """测试清理"""
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_fingerprint_and_roundtrip(self):
+        """测试数据指纹和统计值序列化"""
+        fingerprint = data_fingerprint(self.test_data)
+        self.assertEqual(fingerprint, data_fingerprint(self.test_data.copy()))
+        self.assertNotEqual(fingerprint, data_fingerprint(self.test_data.iloc[:-1]))
+        changed = self.test_data.copy()
+        changed.iloc[100, 3] += 0.01
+        self.assertNotEqual(fingerprint, data_fingerprint(changed))
+        self.assertNotEqual(fingerprint, data_fingerprint(self.test_data, symbol='ETHUSDT'))
+        
+        params = {'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'position_size': 0.8}
+        metrics = {
+            'Start': pd.Timestamp('2023-01-01'),
+            'Max. Drawdown Duration': pd.Timedelta(hours=5),
+            'Return [%]': np.float64(1.5),
+            '# Trades': np.int64(3),
+            'SQN': np.nan
+        }
+        self.cache.put(fingerprint, params, 10000, 0.002, metrics, engine=ENGINE_VECTORIZED)
+        
+        self.assertIsNone(self.cache.get(fingerprint, params, 10000, 0.001, engine=ENGINE_VECTORIZED))
+        self.assertIsNone(self.cache.get(fingerprint, dict(params, position_size=0.6), 10000, 0.002,
+                                         engine=ENGINE_VECTORIZED))
+        # 不同回测引擎的结果互不命中
+        self.assertIsNone(self.cache.get(fingerprint, params, 10000, 0.002, engine=ENGINE_BACKTESTING))
+        loaded = self.cache.get(fingerprint, dict(params, position_size=0.8000000000001), 10000, 0.002,
+                                engine=ENGINE_VECTORIZED)
+        self.assertEqual(loaded['Start'], metrics['Start'])
+        self.assertEqual(loaded['Max. Drawdown Duration'], metrics['Max. Drawdown Duration'])
+        self.assertEqual(loaded['Return [%]'], 1.5)
+        self.assertEqual(loaded['# Trades'], 3)
+        self.assertTrue(np.isnan(loaded['SQN']))
+        
+        self.assertEqual(self.cache.clear(fingerprint), 1)
+        self.assertIsNone(self.cache.get(fingerprint, params, 10000, 0.002, engine=ENGINE_VECTORIZED))
+        
+        print(f"✓ 数据指纹和结果序列化测试通过")
+    
+    def test_runner_reuses_cached_results(self):
+        """测试回测和优化复用缓存结果，只评估新的参数组合"""
+        runner = BacktestRunner(self.test_data, cache=self.cache)
+        
+        first = runner.run_vectorized(cash=10000, headless=True)
+        second = runner.run_vectorized(cash=10000, headless=True)
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['results']['Return [%]'], first['results']['Return [%]'])
+        self.assertEqual(second['results']['Max. Drawdown Duration'], first['results']['Max. Drawdown Duration'])
+        
+        # 需要交易列表和权益曲线时不读取缓存
+        full = runner.run_vectorized(cash=10000)
+        self.assertFalse(full['cached'])
+        self.assertIsNotNone(full['trades'])
+        self.assertIsNotNone(full['equity_curve'])
+        
+        # FractionalBacktest的结果单独缓存，不使用向量化引擎的结果
+        backtest = runner.run_backtest(cash=10000, headless=True)
+        self.assertFalse(backtest['cached'])
+        self.assertTrue(runner.run_backtest(cash=10000, headless=True)['cached'])
+        self.assertFalse(runner.run_backtest(cash=10000, headless=True, equity_points=10)['cached'])
+        
+        result = runner.optimize_strategy(fast_range=(8, 10), slow_range=(20, 22), signal_range=(6, 8),
+                                          position_size_range=(0.5, 0.7), cash=10000, max_workers=1)
+        self.assertEqual(len(result['results']), 16)
+        
+        # 扩大网格后只评估新增的组合
+        from simple_trading_system.optimizer import ParallelOptimizer
+        optimizer = ParallelOptimizer(self.test_data, cash=10000, max_workers=1, cache=self.cache)
+        progress = []
+        extended = optimizer.run(range(8, 11), range(20, 22), range(6, 8), [0.5, 0.6],
+                                 progress_callback=lambda done, total: progress.append(done))
+        self.assertEqual(len(extended['results']), 24)
+        self.assertEqual(progress[0], 16)
+        merged = extended['results'].set_index(['fast_period', 'slow_period', 'signal_period', 'position_size'])
+        for _, row in result['results'].iterrows():
+            key = (row['fast_period'], row['slow_period'], row['signal_period'], row['position_size'])
+            self.assertEqual(merged.loc[key, 'Return [%]'], row['Return [%]'])
+        
+        print(f"✓ 结果缓存复用测试通过")
+
+
+class TestRobustness(unittest.TestCase):
+    """蒙特卡洛稳健性分析测试"""
+    
+    def setUp(self):
+        """测试设置"""
+        np.random.seed(11)
+        n = 3000
+        prices = 45000 + np.cumsum(np.random.normal(5, 150, n))
+        self.test_data = pd.DataFrame({
+            'Open': prices * (1 + np.random.normal(0, 0.001, n)),
+            'High': prices * 1.003,
+            'Low': prices * 0.997,
+            'Close': prices,
+            'Volume': np.random.uniform(1000, 10000, n)
+        }, index=pd.date_range(start='2023-01-01', periods=n, freq='h'))
+    
+    def test_bootstrap_matches_loop(self):
+        """测试矩阵化重抽样与逐条模拟一致，且与分块大小无关"""
+        returns = np.random.default_rng(0).normal(0.004, 0.03, 120)
+        result = monte_carlo(returns, n_sims=500, cash=10000, seed=3)
+        chunked = monte_carlo(returns, n_sims=500, cash=10000, seed=3, max_memory=120 * 8 * 4 * 7)
+        np.testing.assert_array_equal(result['max_drawdown'], chunked['max_drawdown'])
+        np.testing.assert_array_equal(result['final_equity'], chunked['final_equity'])
+        
+        draws = np.random.default_rng(3).integers(0, len(returns), size=(500, len(returns)))
+        for i in (0, 250, 499):
+            sample = returns[draws[i]]
+            equity = np.cumprod(1 + sample)
+            peak = np.maximum(np.maximum.accumulate(equity), 1)
+            self.assertAlmostEqual(result['final_equity'][i], 10000 * equity[-1], places=6)
+            self.assertAlmostEqual(result['max_drawdown'][i], (1 - (equity / peak).min()) * 100, places=9)
+            self.assertAlmostEqual(result['sharpe'][i], sample.mean() / sample.std(ddof=1), places=9)
+        
+        self.assertEqual(list(result['percentiles'].columns), ['p5', 'p25', 'p50', 'p75', 'p95'])
+        self.assertAlmostEqual(result['probability_of_loss'], (result['final_equity'] < 10000).mean())
+        
+        # 打乱顺序不改变最终权益，只改变回撤
+        shuffled = monte_carlo(returns, n_sims=200, method='shuffle', cash=10000, seed=1)
+        np.testing.assert_allclose(shuffled['final_equity'], 10000 * np.prod(1 + returns), rtol=1e-12)
+        self.assertGreater(shuffled['max_drawdown'].std(), 0)
+        
+        print(f"✓ 蒙特卡洛重抽样测试通过")
+    
+    def test_analyze_backtest_trades(self):
+        """测试从回测交易列表换算权益收益率并分析候选参数"""
+        runner = BacktestRunner(self.test_data)
+        result = runner.run_vectorized(cash=10000)
+        trades = result['trades']
+        self.assertGreater(len(trades), 10)
+        
+        returns = trade_returns(trades, 10000)
+        self.assertAlmostEqual(10000 * np.prod(1 + returns), 10000 + trades['PnL'].sum(), places=6)
+        
+        analysis = analyze_backtest(result, 10000, n_sims=2000, seed=0)
+        self.assertEqual(analysis['n_trades'], len(trades))
+        self.assertEqual(len(analysis['max_drawdown']), 2000)
+        
+        headless = runner.run_backtest(cash=10000, headless=True)
+        with self.assertRaises(ValueError):
+            analyze_backtest(headless, 10000)
+        
+        candidates = pd.DataFrame([
+            {'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'position_size': 0.8},
+            {'fast_period': 8, 'slow_period': 21, 'signal_period': 5, 'position_size': 0.6},
+        ])
+        table = robustness_table(self.test_data, candidates, cash=10000, n_sims=1000, seed=0)
+        self.assertEqual(len(table), 2)
+        self.assertIn('Max. Drawdown [%] p95', table.columns)
+        self.assertTrue((table['Equity Final [$] p5'] <= table['Equity Final [$] p95']).all())
+        
+        print(f"✓ 回测交易稳健性分析测试通过")
+
+
+class TestEventEngine(unittest.TestCase):
+    """事件驱动引擎测试"""
+    
+    def setUp(self):
+        """测试设置"""
+        np.random.seed(19)
+        n = 2000
+        prices = 45000 + np.cumsum(np.random.normal(0, 150, n))
+        self.test_data = pd.DataFrame({
+            'Open': prices * (1 + np.random.normal(0, 0.001, n)),
+            'High': prices * 1.003,
+            'Low': prices * 0.997,
+            'Close': prices,
+            'Volume': np.random.uniform(1000, 10000, n)
+        }, index=pd.date_range(start='2023-01-01', periods=n, freq='h'))
+    
+    def _replay(self, data):
+        engine = EventEngine(StreamingMACD(12, 26, 9), SimulatedBroker(cash=10000), position_size=0.8)
+        return engine, engine.replay(data.index, data['Open'].values, data['Close'].values)
+    
+    def test_replay_matches_vectorized(self):
+        """测试批量回放与向量化回测、逐根on_bar结果一致"""
+        engine, replayed = self._replay(self.test_data)
+        expected = vectorized_backtest(self.test_data, cash=10000, position_size=0.8)
+        
+        self.assertGreater(replayed['results']['# Trades'], 10)
+        for key in ('Return [%]', '# Trades', 'Max. Drawdown [%]', 'Win Rate [%]'):
+            self.assertAlmostEqual(replayed['results'][key], expected['results'][key], places=9)
+        np.testing.assert_allclose(replayed['equity_curve'].values, expected['equity_curve'].values, rtol=1e-12)
+        np.testing.assert_array_equal(replayed['trades']['EntryBar'].values, expected['trades']['EntryBar'].values)
+        
+        stepped = EventEngine(StreamingMACD(12, 26, 9), SimulatedBroker(cash=10000), position_size=0.8)
+        for timestamp, row in self.test_data.iterrows():
+            stepped.on_bar(timestamp, row['Open'], row['Close'])
+        np.testing.assert_array_equal(stepped.results()['equity_curve'].values, replayed['equity_curve'].values)
+        self.assertEqual(len(stepped.orders), len(engine.orders))
+        
+        with self.assertRaises(RuntimeError):
+            engine.replay(self.test_data.index, self.test_data['Open'].values, self.test_data['Close'].values)
+        
+        print(f"✓ 事件回放一致性测试通过")
+    
+    def test_replay_matches_vectorized_fixed_units(self):
+        """测试position_size >= 1（固定单位数量）时批量回放与向量化回测一致"""
+        engine = EventEngine(StreamingMACD(12, 26, 9), SimulatedBroker(cash=10000), position_size=1.0)
+        replayed = engine.replay(self.test_data.index, self.test_data['Open'].values, self.test_data['Close'].values)
+        expected = vectorized_backtest(self.test_data, cash=10000, position_size=1.0)
+        
+        self.assertGreater(replayed['results']['# Trades'], 10)
+        for key in ('Return [%]', '# Trades', 'Max. Drawdown [%]', 'Win Rate [%]'):
+            self.assertAlmostEqual(replayed['results'][key], expected['results'][key], places=9)
+        np.testing.assert_allclose(replayed['equity_curve'].values, expected['equity_curve'].values, rtol=1e-12)
+        self.assertTrue(all(fill['units'] == 1 for fill in engine.broker.fills))
+        
+        print(f"✓ 固定单位数量回放一致性测试通过")
+    
+    def test_replay_storage_and_live_broker(self):
+        """测试从数据库回放，以及实盘经纪商接口走同一条下单路径"""
+        temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        temp_db.close()
+        storage = DataStorage(temp_db.name)
+        try:
+            storage.save_data(self.test_data, 'BTCUSDT')
+            engine = EventEngine(StreamingMACD(12, 26, 9), SimulatedBroker(cash=10000), position_size=0.8)
+            result = engine.replay_storage(storage)
+            _, expected = self._replay(self.test_data)
+            self.assertAlmostEqual(result['results']['Return [%]'], expected['results']['Return [%]'], places=9)
+        finally:
+            storage.close()
+            os.unlink(temp_db.name)
+        
+        class RecordingBroker:
+            """只记录订单、立即按数量成交的经纪商"""
+            def __init__(self):
+                self.qty = 0.0
+                self.calls = []
+            def get_account_info(self):
+                return {'cash': 10000.0}
+            def get_positions(self):
+                return [{'symbol': 'BTCUSDT', 'qty': self.qty}] if self.qty else []
+            def buy_notional(self, symbol, notional):
+                self.calls.append(('buy', notional))
+                self.qty = 0.1
+                return {'order_id': len(self.calls)}
+            def sell_market(self, symbol, qty):
+                self.calls.append(('sell', qty))
+                self.qty = 0.0
+                return {'order_id': len(self.calls)}
+        
+        broker = RecordingBroker()
+        live = EventEngine(StreamingMACD(12, 26, 9), broker, position_size=0.8)
+        for timestamp, row in self.test_data.iloc[:500].iterrows():
+            live.on_bar(timestamp, row['Open'], row['Close'])
+        self.assertGreater(len(broker.calls), 2)
+        self.assertEqual(broker.calls[0], ('buy', 8000.0))
+        self.assertTrue(all(a[0] != b[0] for a, b in zip(broker.calls, broker.calls[1:])))
+        with self.assertRaises(TypeError):
+            live.results()
+        
+        print(f"✓ 数据库回放与实盘下单路径测试通过")
+
+
+class FakeAlpacaHandler(BaseHTTPRequestHandler):
+    """本地模拟的Alpaca交易接口，每个请求固定延迟，记录连接和订单"""
+    
+    protocol_version = 'HTTP/1.1'
+    delay = 0.1
+    
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _handle(self, method):
+        import time
+        state = self.server.state
+        state['connections'].add(self.client_address)
+        state['requests'].append((method, urlparse(self.path).path))
+        time.sleep(getattr(self.server, 'delay', self.delay))
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length)) if length else None
+        path = urlparse(self.path).path
+        
+        if self.headers.get('APCA-API-KEY-ID') != 'key':
+            self._send(401, {'code': 40110000, 'message': 'access key verification failed'})
+        elif method == 'GET' and path == '/v2/account':
+            self._send(200, {'id': 'acct', 'status': 'ACTIVE', 'equity': '10000', 'buying_power': '10000',
+                             'cash': '10000', 'portfolio_value': '10000', 'daytrade_count': 0,
+                             'pattern_day_trader': False})
+        elif method == 'GET' and path == '/v2/positions':
+            self._send(200, [{'symbol': symbol, 'qty': str(qty), 'market_value': '0', 'cost_basis': '0',
+                              'unrealized_pl': '0', 'unrealized_plpc': '0', 'current_price': '100',
+                              'avg_entry_price': '100'} for symbol, qty in state['positions'].items()])
+        elif method == 'POST' and path == '/v2/orders':
+            state['orders'].append(payload)
+            order = {'id': f"order-{len(state['orders'])}", 'symbol': payload['symbol'],
+                     'qty': payload.get('qty'), 'side': payload['side'], 'order_type': payload['type'],
+                     'status': 'accepted', 'submitted_at': '2024-01-01T00:00:00Z',
+                     'filled_qty': '0', 'filled_avg_price': None}
+            state.setdefault('open_orders', []).append(order)
+            self._send(200, order)
+        elif method == 'GET' and path == '/v2/orders':
+            query = parse_qs(urlparse(self.path).query)
+            status = query.get('status', ['open'])[0]
+            orders = state.get('closed_orders' if status == 'closed' else 'open_orders', [])
+            # 与Alpaca一致：after按提交时间过滤
+            if 'after' in query:
+                orders = [order for order in orders if order.get('submitted_at', '') > query['after'][0]]
+            self._send(200, orders)
+        elif method == 'GET' and path.startswith('/v2/orders/'):
+            order_id = path.rsplit('/', 1)[1]
+            orders = state.get('open_orders', []) + state.get('closed_orders', [])
+            matches = [order for order in orders if order['id'] == order_id]
+            if matches:
+                self._send(200, matches[0])
+            else:
+                self._send(404, {'code': 40410000, 'message': 'order not found'})
+        elif method == 'DELETE' and path.startswith('/v2/orders'):
+            self._send(207, [])
+        else:
+            self._send(404, {'code': 40410000, 'message': 'not found'})
+    
+    def do_GET(self):
+        self._handle('GET')
+    
+    def do_POST(self):
+        self._handle('POST')
+    
+    def do_DELETE(self):
+        self._handle('DELETE')
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAsyncAlpacaTrader(unittest.TestCase):
+    """异步Alpaca客户端测试（本地模拟服务器）"""
+    
+    def setUp(self):
+        """启动本地模拟服务器"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAlpacaHandler)
+        self.server.state = {'connections': set(), 'requests': [], 'orders': [], 'positions': {}}
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v2"
+    
+    def tearDown(self):
+        """关闭本地模拟服务器"""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _run(self, coroutine_function):
+        import asyncio
+        
+        async def main():
+            async with AsyncAlpacaTrader('key', 'secret', self.base_url) as trader:
+                return await coroutine_function(trader)
+        
+        return asyncio.run(main())
+    
+    def test_snapshot_concurrent_keepalive(self):
+        """测试账户和持仓并发查询，且请求复用长连接"""
+        import time
+        self.server.state['positions'] = {'AAPL': 5}
+        
+        async def snapshots(trader):
+            started = time.perf_counter()
+            account, positions = await trader.get_snapshot()
+            elapsed = time.perf_counter() - started
+            for _ in range(6):
+                await trader.get_positions()
+            return account, positions, elapsed
+        
+        account, positions, elapsed = self._run(snapshots)
+        
+        self.assertEqual(account['buying_power'], 10000.0)
+        self.assertEqual(positions[0]['symbol'], 'AAPL')
+        self.assertEqual(positions[0]['qty'], 5.0)
+        self.assertLess(elapsed, 1.8 * FakeAlpacaHandler.delay)
+        # connect验证 + 并发快照 + 6次顺序请求 共9个请求，最多使用2个连接
+        self.assertEqual(len(self.server.state['requests']), 9)
+        self.assertLessEqual(len(self.server.state['connections']), 2)
+        
+        print(f"✓ 并发快照耗时 {elapsed:.3f}秒（单次请求 {FakeAlpacaHandler.delay}秒）")
+    
+    def test_async_bot_orders(self):
+        """测试异步机器人的下单规则与同步机器人一致，错误响应抛出APIError"""
+        from alpaca_trade_api.rest import APIError
+        
+        async def trade(trader):
+            bot = AsyncTradingBot(trader, 'AAPL')
+            await bot.execute_signal(1, 100.0)
+            self.server.state['positions'] = {'AAPL': 90}
+            await bot.execute_signal(1, 100.0)
+            await bot.execute_signal(-1, 101.0)
+            order = await trader.buy_notional('AAPL', 1234.567)
+            cancelled = await trader.cancel_all_orders()
+            return bot.get_trade_summary(), order, cancelled
+        
+        summary, order, cancelled = self._run(trade)
+        orders = self.server.state['orders']
+        
+        self.assertEqual(summary['buy_trades'], 1)
+        self.assertEqual(summary['sell_trades'], 1)
+        self.assertEqual(orders[0], {'symbol': 'AAPL', 'side': 'buy', 'type': 'market',
+                                     'time_in_force': 'gtc', 'qty': 90})
+        self.assertEqual(orders[1]['side'], 'sell')
+        self.assertEqual(orders[1]['qty'], 90.0)
+        self.assertEqual(orders[2]['notional'], 1234.57)
+        self.assertEqual(order['qty'], 0.0)
+        self.assertTrue(cancelled)
+        
+        import asyncio
+        
+        async def unauthorized():
+            async with AsyncAlpacaTrader('wrong', 'secret', self.base_url):
+                pass
+        
+        with self.assertRaises(APIError):
+            asyncio.run(unauthorized())
+        
+        print(f"✓ 异步下单测试通过")
+
+
+class TestAlpacaSnapshotCache(unittest.TestCase):
+    """Alpaca账户/持仓快照缓存测试（本地模拟服务器）"""
+    
+    def setUp(self):
+        """启动本地模拟服务器"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAlpacaHandler)
+        self.server.state = {'connections': set(), 'requests': [], 'orders': [], 'positions': {}}
+        self.server.delay = 0.02
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v2"
+    
+    def tearDown(self):
+        """关闭本地模拟服务器"""
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _count(self, path):
+        return sum(1 for _, requested in self.server.state['requests'] if requested == path)
+    
+    def test_single_flight(self):
+        """测试TTL内命中缓存，并发读取者复用同一次请求，失效期间的请求结果不写入缓存"""
+        clock = [0.0]
+        cache = SnapshotCache({'account': 5.0}, clock=lambda: clock[0])
+        calls = []
+        release = threading.Event()
+        
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {'cash': len(calls)}
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('account', fetch)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while cache.stats['fetches'] + cache.stats['shared'] < 8:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'cash': 1}] * 8)
+        self.assertEqual(cache.get('account', fetch), {'cash': 1})
+        clock[0] = 5.0
+        self.assertEqual(cache.get('account', fetch), {'cash': 2})
+        
+        # 请求进行中失效：结果返回给发起者，但不写入缓存
+        release.clear()
+        clock[0] = 10.0
+        leader = threading.Thread(target=lambda: results.append(cache.get('account', fetch)))
+        leader.start()
+        while len(calls) < 3:
+            pass
+        cache.invalidate('account')
+        release.set()
+        leader.join()
+        self.assertEqual(results[-1], {'cash': 3})
+        self.assertEqual(cache.get('account', fetch), {'cash': 4})
+        
+        print(f"✓ 快照缓存单次请求测试通过")
+    
+    def test_trader_snapshots_invalidate_on_order_and_fill(self):
+        """测试AlpacaTrader读取命中缓存，下单后失效，订单离开挂单列表后重新获取持仓"""
+        self.server.state['positions'] = {'AAPL': 5}
+        trader = AlpacaTrader('key', 'secret', self.base_url,
+                              account_ttl=60, positions_ttl=60, orders_ttl=0.05)
+        
+        # 初始化时的账户验证写入快照
+        trader.get_account_info()
+        for _ in range(5):
+            self.assertEqual(trader.get_positions()[0]['qty'], 5.0)
+        self.assertEqual(self._count('/v2/account'), 1)
+        self.assertEqual(self._count('/v2/positions'), 1)
+        
+        # 并发读取只发起一次请求
+        trader.snapshots.invalidate('positions')
+        threads = [threading.Thread(target=trader.get_positions) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self._count('/v2/positions'), 2)
+        
+        # 下单后快照失效；订单仍在挂单列表中时持仓快照照常缓存
+        trader.buy_market('AAPL', 10)
+        self.assertEqual(trader.get_positions()[0]['qty'], 5.0)
+        self.assertEqual(self._count('/v2/positions'), 3)
+        
+        # 模拟成交：订单离开挂单列表，挂单快照过期后读取持仓会发现成交
+        import time
+        self.server.state['open_orders'] = []
+        self.server.state['positions'] = {'AAPL': 15}
+        time.sleep(0.06)
+        self.assertEqual(trader.get_positions()[0]['qty'], 15.0)
+        self.assertEqual(self._count('/v2/positions'), 4)
+        self.assertEqual(trader.get_positions()[0]['qty'], 15.0)
+        self.assertEqual(self._count('/v2/positions'), 4)
+        
+        print(f"✓ 交易客户端快照缓存测试通过，命中 {trader.snapshots.stats['hits']} 次")
+    
+    class FakeBarsAPI:
+        """按整点生成1h K线的行情接口，最后一根为当前整点（尚未收盘，收盘价加partial）"""
+        
+        def __init__(self, count):
+            self.latest = pd.Timestamp.now(tz='UTC').floor('h')
+            self.count = count
+            self.partial = 0.0
+            self.requests = []
+        
+        def get_bars(self, symbol, timeframe, start, end=None, limit=None):
+            from types import SimpleNamespace
+            self.requests.append((start, end, limit))
+            index = pd.date_range(end=self.latest, periods=self.count, freq='h')
+            index = index[index >= pd.Timestamp(start)][:limit]
+            price = 100 + (index.asi8 // 3_600_000_000_000 % 1000)
+            close = np.where(index == self.latest, price + self.partial, price)
+            df = pd.DataFrame({'open': price, 'high': price + 1, 'low': price - 1, 'close': close,
+                               'volume': 1.0, 'trade_count': 1, 'vwap': price}, index=index)
+            if isinstance(symbol, list):
+                # 多标的请求：每个标的一份K线，带symbol列
+                df = pd.concat([df.assign(symbol=s, close=price + i) for i, s in enumerate(symbol)])
+            return SimpleNamespace(df=df)
+    
+    def test_market_data_ring_buffer(self):
+        """测试get_market_data首次下载完整窗口，之后只请求新K线并返回缓冲区视图"""
+        trader = AlpacaTrader('key', 'secret', self.base_url, bar_buffer_size=300)
+        trader.api = api = self.FakeBarsAPI(150)
+        
+        first = trader.get_market_data('AAPL', '1Hour', limit=100)
+        self.assertEqual(len(first), 100)
+        self.assertEqual(first.index[-1], api.latest)
+        buffer = trader.bar_buffers[('AAPL', '1Hour')]
+        self.assertEqual(buffer.stats['full_fetches'], 1)
+        
+        # 没有新K线：只发起一次增量请求，返回相同数据
+        again = trader.get_market_data('AAPL', '1Hour', limit=100)
+        self.assertEqual(buffer.stats['last_fetch_bars'], 0)
+        pd.testing.assert_frame_equal(again, first)
+        
+        # 新收盘一根K线：增量请求只返回这一根
+        api.latest += pd.Timedelta(hours=1)
+        api.count += 1
+        latest = trader.get_market_data('AAPL', '1Hour', limit=50)
+        self.assertEqual(buffer.stats['last_fetch_bars'], 1)
+        self.assertEqual(len(latest), 50)
+        self.assertEqual(latest.index[-1], api.latest)
+        self.assertTrue(latest.index.is_monotonic_increasing)
+        self.assertTrue(np.shares_memory(latest.values, buffer.values))
+        # 增量请求从缓存中最后一根K线开始，以便刷新其最终值
+        self.assertEqual(pd.Timestamp(api.requests[-1][0]), api.latest - pd.Timedelta(hours=1))
+        
+        # 超过缓冲区容量的新K线：环形写入后结果与直接下载一致
+        api.latest += pd.Timedelta(hours=700)
+        api.count += 700
+        wrapped = trader.get_market_data('AAPL', '1Hour', limit=100)
+        self.assertEqual(buffer.stats['full_fetches'], 1)
+        expected = pd.date_range(end=api.latest, periods=100, freq='h')
+        self.assertTrue((wrapped.index == expected).all())
+        np.testing.assert_array_equal(wrapped['Close'].values, 100 + (expected.asi8 // 3_600_000_000_000 % 1000))
+        
+        # limit超过上次完整下载的数量时重新下载完整窗口
+        self.assertEqual(len(trader.get_market_data('AAPL', '1Hour', limit=200)), 200)
+        self.assertEqual(trader.bar_buffers[('AAPL', '1Hour')].stats['full_fetches'], 2)
+        
+        print(f"✓ K线环形缓冲区测试通过")
+    
+    def test_market_data_refreshes_forming_bar(self):
+        """测试缓存中尚未收盘的最后一根K线在之后的请求中被更新为最新值"""
+        trader = AlpacaTrader('key', 'secret', self.base_url, bar_buffer_size=300)
+        trader.api = api = self.FakeBarsAPI(150)
+        
+        first = trader.get_market_data('AAPL', '1Hour', limit=100).copy()
+        forming = first['Close'].iloc[-1]
+        
+        # 同一根K线的收盘价在两次请求之间变化
+        api.partial = 2.5
+        updated = trader.get_market_data('AAPL', '1Hour', limit=100)
+        buffer = trader.bar_buffers[('AAPL', '1Hour')]
+        self.assertEqual(buffer.stats['last_fetch_bars'], 0)
+        self.assertEqual(len(updated), 100)
+        self.assertEqual(updated.index[-1], api.latest)
+        self.assertEqual(updated['Close'].iloc[-1], forming + 2.5)
+        pd.testing.assert_frame_equal(updated.iloc[:-1], first.iloc[:-1])
+        
+        # 收盘后新K线出现：上一根取最终值，新K线追加在后
+        api.partial = 0.0
+        api.latest += pd.Timedelta(hours=1)
+        api.count += 1
+        closed = trader.get_market_data('AAPL', '1Hour', limit=100)
+        self.assertEqual(buffer.stats['last_fetch_bars'], 1)
+        self.assertEqual(closed['Close'].iloc[-2], forming)
+        self.assertEqual(closed.index[-1], api.latest)
+        expected = pd.date_range(end=api.latest, periods=100, freq='h')
+        np.testing.assert_array_equal(closed['Close'].values, 100 + (expected.asi8 // 3_600_000_000_000 % 1000))
+        
+        print(f"✓ 形成中K线刷新测试通过")
+    
+    def test_bars_after_multi(self):
+        """测试多标的一次请求、按标的拆分并按各自的after过滤"""
+        trader = AlpacaTrader('key', 'secret', self.base_url)
+        trader.api = api = self.FakeBarsAPI(10)
+        afters = {'AAPL': api.latest - pd.Timedelta(hours=3), 'MSFT': api.latest - pd.Timedelta(hours=1),
+                  'TSLA': api.latest}
+        
+        bars = trader.get_bars_after_multi(afters, '1Hour')
+        
+        self.assertEqual(len(api.requests), 1)
+        self.assertEqual(pd.Timestamp(api.requests[0][0]), afters['AAPL'] + pd.Timedelta(seconds=1))
+        self.assertEqual([len(bars[s]) for s in ('AAPL', 'MSFT', 'TSLA')], [3, 1, 0])
+        self.assertEqual(list(bars['MSFT'].columns), BarRingBuffer.COLUMNS)
+        self.assertEqual(bars['MSFT']['Close'].iloc[-1] - bars['AAPL']['Close'].iloc[-1], 1)
+        print(f"✓ 多标的K线请求测试通过")
+
+
+class FakeTradeStream:
+    """本地模拟的Alpaca trade_updates WebSocket服务，运行在独立线程的事件循环中"""
+    
+    def __init__(self):
+        import asyncio
+        import websockets
+        
+        self.connections = []
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        
+        async def handler(ws, path=None):
+            auth = json.loads(await ws.recv())
+            authorized = auth['data']['key_id'] == 'key'
+            await ws.send(json.dumps({'stream': 'authorization', 'data': {
+                'action': 'authenticate', 'status': 'authorized' if authorized else 'unauthorized'}}))
+            if not authorized:
+                return
+            await ws.recv()
+            await ws.send(json.dumps({'stream': 'listening', 'data': {'streams': ['trade_updates']}}))
+            self.connections.append(ws)
+            await ws.wait_closed()
+        
+        async def serve():
+            self.server = await websockets.serve(handler, '127.0.0.1', 0)
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+        
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        import asyncio as _asyncio
+        _asyncio.run_coroutine_threadsafe(serve(), self.loop)
+        started.wait(5)
+        self.url = f"ws://127.0.0.1:{self.port}/stream"
+    
+    def _call(self, coroutine):
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+    
+    def send(self, update):
+        """向最新的连接推送一个交易更新"""
+        self._call(self.connections[-1].send(json.dumps({'stream': 'trade_updates', 'data': update})))
+    
+    def drop(self):
+        """断开当前连接"""
+        self._call(self.connections[-1].close())
+    
+    def close(self):
+        async def shutdown():
+            self.server.close()
+            await self.server.wait_closed()
+        self._call(shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+def _fill_event(order_id, execution_id, qty, position_qty, timestamp):
+    """构造一个成交事件"""
+    return {'event': 'fill', 'execution_id': execution_id, 'timestamp': timestamp,
+            'qty': str(qty), 'price': '100', 'position_qty': str(position_qty),
+            'order': {'id': order_id, 'symbol': 'AAPL', 'qty': str(qty), 'side': 'buy',
+                      'order_type': 'market', 'status': 'filled', 'filled_qty': str(qty),
+                      'filled_avg_price': '100'}}
+
+
+class TestTradeUpdateStream(unittest.TestCase):
+    """交易推送测试（本地模拟REST和WebSocket服务）"""
+    
+    def setUp(self):
+        """启动本地模拟服务"""
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAlpacaHandler)
+        self.server.state = {'connections': set(), 'requests': [], 'orders': [], 'positions': {'AAPL': 5}}
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.stream_server = FakeTradeStream()
+        self.trader = AlpacaTrader('key', 'secret', f"http://127.0.0.1:{self.server.server_address[1]}")
+    
+    def tearDown(self):
+        """关闭本地模拟服务"""
+        self.trader.stop_trade_stream()
+        self.stream_server.close()
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _wait(self, condition, timeout=5.0):
+        import time
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            self.assertLess(time.perf_counter(), deadline, "等待推送超时")
+            time.sleep(0.001)
+    
+    def test_push_updates_ledger_and_resumes(self):
+        """测试成交推送更新账本、去重，断线重连后通过REST对账补齐断线期间的成交"""
+        import time
+        stream = self.trader.start_trade_stream(self.stream_server.url)
+        self.assertTrue(stream.synced)
+        self.assertEqual(self.trader.get_position_qty('AAPL'), 5.0)
+        
+        rest_calls = len(self.server.state['requests'])
+        started = time.perf_counter()
+        self.stream_server.send(_fill_event('order-1', 'exec-1', 10, 15, '2024-01-01T00:00:01Z'))
+        self._wait(lambda: self.trader.get_position_qty('AAPL') == 15.0)
+        latency = time.perf_counter() - started
+        self.assertEqual(stream.orders['order-1']['status'], 'filled')
+        
+        # 重复的execution_id被忽略
+        self.stream_server.send(_fill_event('order-1', 'exec-1', 10, 99, '2024-01-01T00:00:01Z'))
+        self._wait(lambda: stream.stats['duplicates'] == 1)
+        self.assertEqual(self.trader.get_position_qty('AAPL'), 15.0)
+        self.assertEqual(self.trader.get_open_orders(), [])
+        
+        # 持仓和挂单查询不再访问持仓/挂单接口（成交后只在后台刷新账户）
+        paths = [path for _, path in self.server.state['requests'][rest_calls:]]
+        self.assertNotIn('/v2/positions', paths)
+        self.assertNotIn('/v2/orders', paths)
+        
+        # 断线期间发生的成交由重连后的对账补齐
+        stream.reconnect_delay = 0.05
+        self.server.state['positions'] = {'AAPL': 25}
+        self.server.state['closed_orders'] = [{
+            'id': 'order-2', 'symbol': 'AAPL', 'qty': '10', 'side': 'buy', 'order_type': 'market',
+            'status': 'filled', 'submitted_at': '2024-01-01T00:00:02Z', 'filled_qty': '10',
+            'filled_avg_price': '101'}]
+        self.stream_server.drop()
+        self._wait(lambda: stream.stats['reconciles'] == 2 and stream.synced)
+        self.assertEqual(self.trader.get_position_qty('AAPL'), 25.0)
+        self.assertEqual(stream.orders['order-2']['status'], 'filled')
+        self.assertEqual(stream.stats['connections'], 2)
+        
+        self.stream_server.send(_fill_event('order-3', 'exec-3', 5, 30, '2024-01-01T00:00:03Z'))
+        self._wait(lambda: self.trader.get_position_qty('AAPL') == 30.0)
+        
+        print(f"✓ 交易推送测试通过，成交到账本延迟 {latency * 1000:.1f}毫秒")
+    
+    def test_reconcile_resolves_resting_orders(self):
+        """测试断线前提交、断线期间成交的挂单在重连对账后不再视为未完成"""
+        stream = self.trader.start_trade_stream(self.stream_server.url)
+        self.assertTrue(stream.synced)
+        stream.reconnect_delay = 0.05
+        
+        order = self.trader.buy_limit('AAPL', 10, 95.0)
+        resting = dict(self.server.state['open_orders'][0], status='new')
+        self.stream_server.send({'event': 'new', 'timestamp': '2024-01-01T00:00:01Z', 'order': resting})
+        self._wait(lambda: order['order_id'] in stream.orders)
+        # 之后的事件把last_event_time推到挂单提交时间之后
+        self.stream_server.send(_fill_event('order-9', 'exec-9', 1, 6, '2024-01-01T00:00:05Z'))
+        self._wait(lambda: stream.last_event_time == '2024-01-01T00:00:05Z')
+        self.assertEqual([o['order_id'] for o in self.trader.get_open_orders()], [order['order_id']])
+        
+        # 挂单在断线期间成交：不在挂单列表中，也不在按提交时间过滤的已完成列表中
+        self.server.state['open_orders'] = []
+        self.server.state['closed_orders'] = [dict(resting, status='filled', filled_qty='10',
+                                                   filled_avg_price='95')]
+        self.server.state['positions'] = {'AAPL': 16}
+        self.stream_server.drop()
+        self._wait(lambda: stream.stats['reconciles'] == 2 and stream.synced)
+        
+        self.assertEqual(stream.orders[order['order_id']]['status'], 'filled')
+        self.assertEqual(stream.orders[order['order_id']]['filled_qty'], 10.0)
+        self.assertEqual(self.trader.get_open_orders(), [])
+        self.assertEqual(self.trader.get_position_qty('AAPL'), 16.0)
+        self.assertIn(('GET', f"/v2/orders/{order['order_id']}"), self.server.state['requests'])
+        
+        print(f"✓ 挂单对账测试通过")
+
+
+class TestLiveRunner(unittest.TestCase):
+    """按K线收盘调度的实盘运行器测试"""
+    
+    period = 0.2
+    
+    class FakeBarTrader:
+        """按真实时间生成已收盘K线的行情源，LAG标的每根K线第一次请求时还没有数据"""
+        
+        def __init__(self, period):
+            self.period = period
+            self.calls = []
+            self.returned = {}
+            self.lagged = set()
+        
+        def get_bars_after(self, symbol, timeframe, after):
+            import time
+            self.calls.append((symbol, after))
+            period_ns = int(self.period * 1e9)
+            first = (after.value // period_ns + 1) * period_ns
+            starts = np.arange(first, time.time_ns() - period_ns + 1, period_ns, dtype=np.int64)
+            if symbol == 'LAG' and len(starts) and starts[-1] not in self.lagged:
+                self.lagged.add(starts[-1])
+                starts = starts[:-1]
+            self.returned.setdefault(symbol, []).extend(starts)
+            return pd.DataFrame({'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': starts % 10**12 / 1e9,
+                                 'Volume': 1.0}, index=pd.to_datetime(starts, utc=True))
+    
+    class RecordingBot:
+        def __init__(self):
+            self.closes = []
+        
+        def on_bar(self, close):
+            self.closes.append(close)
+            return 0
+    
+    class AsyncRecordingBot(RecordingBot):
+        async def on_bar(self, close):
+            self.closes.append(close)
+            return 1
+    
+    def test_next_bar_close(self):
+        """测试收盘时间按周期对齐"""
+        self.assertEqual(next_bar_close(7200.0, 3600), 10800.0)
+        self.assertEqual(next_bar_close(7199.5, 3600), 7200.0)
+        self.assertEqual(next_bar_close(1_700_000_123.0, 60), 1_700_000_160.0)
+    
+    def test_closed_bars(self):
+        """测试预热数据去掉尚未收盘的K线"""
+        index = pd.date_range('2024-01-01 00:00', periods=4, freq='h', tz='UTC')
+        bars = pd.DataFrame({'Close': [1.0, 2.0, 3.0, 4.0]}, index=index)
+        
+        # 03:00开盘的K线在04:00收盘，03:30时仍在形成中
+        closed = closed_bars(bars, '1Hour', now=pd.Timestamp('2024-01-01 03:30', tz='UTC'))
+        self.assertEqual(list(closed['Close']), [1.0, 2.0, 3.0])
+        closed = closed_bars(bars, '1Hour', now=pd.Timestamp('2024-01-01 04:00', tz='UTC'))
+        self.assertEqual(len(closed), 4)
+        # 无时区的索引按UTC处理
+        closed = closed_bars(bars.tz_localize(None), '1Hour', now=pd.Timestamp('2024-01-01 11:30', tz='Asia/Shanghai'))
+        self.assertEqual(len(closed), 3)
+    
+    def test_live_menu_warms_up_without_closed_bars(self):
+        """测试没有已收盘K线的标的从下一根收盘K线开始，不中断实盘模式"""
+        from unittest import mock
+        from simple_trading_system import main as main_module
+        index = pd.date_range('2024-01-01', periods=30, freq='h', tz='UTC')
+        history = pd.DataFrame({'Open': 1.0, 'High': 1.0, 'Low': 1.0, 'Close': np.linspace(1, 2, 30),
+                                'Volume': 1.0}, index=index)
+        
+        class FakeTrader:
+            def start_trade_stream(self):
+                pass
+            
+            def stop_trade_stream(self):
+                pass
+            
+            def get_market_data(self, symbol, timeframe='1Day', limit=100):
+                return history if symbol == 'AAPL' else history.iloc[:0]
+        
+        class FakeRunner:
+            def __init__(self, trader, timeframe):
+                self.added = {}
+            
+            def add_symbol(self, symbol, bot, last_bar_time=None):
+                self.added[symbol] = last_bar_time
+            
+            async def run(self):
+                pass
+            
+            def stats(self):
+                return pd.DataFrame({'symbol': list(self.added)})
+        
+        runners = []
+        def make_runner(*args, **kwargs):
+            runners.append(FakeRunner(*args, **kwargs))
+            return runners[-1]
+        
+        bot = mock.MagicMock(position=0)
+        bot.get_trade_summary.return_value = {'total_trades': 0}
+        with mock.patch.multiple(main_module, AlpacaTrader=FakeTrader, LiveRunner=make_runner,
+                                 TradingBot=mock.MagicMock(return_value=bot)):
+            with mock.patch('builtins.input', side_effect=['yes', 'AAPL,NEWCO']):
+                main_module.live_trading_menu()
+        
+        self.assertEqual(runners[0].added, {'AAPL': index[-1], 'NEWCO': None})
+        self.assertEqual(bot.attach_stream.call_count, 2)
+        
+        print(f"✓ 无预热K线启动测试通过")
+    
+    def test_runner_wakes_at_close_and_fetches_new_bars(self):
+        """测试多个标的在一个事件循环中于收盘时唤醒，只请求新收盘的K线"""
+        import asyncio
+        trader = self.FakeBarTrader(self.period)
+        runner = LiveRunner(trader, period=self.period, settle=0.01, retry_delay=0.02, max_retries=3)
+        bots = {'AAPL': self.RecordingBot(), 'MSFT': self.AsyncRecordingBot(), 'LAG': self.RecordingBot()}
+        for symbol, bot in bots.items():
+            runner.add_symbol(symbol, bot)
+        
+        asyncio.run(runner.run(max_closes=3))
+        stats = runner.stats().set_index('symbol')
+        
+        for symbol, bot in bots.items():
+            self.assertEqual(len(bot.closes), 3)
+            # 连续的K线，没有遗漏或重复
+            np.testing.assert_allclose(np.diff(bot.closes), self.period, atol=1e-6)
+            # 收盘后立即处理
+            self.assertLess(stats.loc[symbol, 'latency_max'], 0.15)
+        
+        # 每次请求都从上一根已处理的K线之后开始，每次只返回新收盘的一根
+        for symbol in ('AAPL', 'MSFT'):
+            afters = [after.value for requested, after in trader.calls if requested == symbol]
+            returned = trader.returned[symbol]
+            self.assertEqual(len(returned), 3)
+            self.assertEqual(afters[1:], returned[:-1])
+            self.assertEqual(returned[0] - afters[0], int(self.period * 1e9))
+        
+        self.assertEqual(stats.loc['LAG', 'fetches'], 6)
+        self.assertEqual(stats.loc['MSFT', 'signals'], 3)
+        
+        print(f"✓ 实盘调度测试通过，平均延迟 {stats['latency_mean'].mean() * 1000:.1f}毫秒")
+
+
+class TestPortfolioBot(unittest.TestCase):
+    """多标的组合交易机器人测试"""
+    
+    period = 0.5
+    
+    class FakePortfolioTrader:
+        """按真实时间生成K线的共享交易客户端，价格为各标的频率不同的正弦波"""
+        
+        def __init__(self, symbols, period):
+            import time
+            self.period_ns = int(period * 1e9)
+            self.symbols = {symbol: i for i, symbol in enumerate(symbols)}
+            # 历史数据统一截止到创建时最后一根已收盘的K线
+            self.history_end = time.time_ns() // self.period_ns * self.period_ns - self.period_ns
+            # 奇数序号的标的初始持有100股
+            self.positions = {symbol: 100.0 for symbol, i in self.symbols.items() if i % 2}
+            self.requests = []
+            self.snapshot_reads = 0
+            self.orders = []
+            self.lock = threading.Lock()
+        
+        def closes(self, symbol, starts):
+            i = self.symbols[symbol]
+            return 100 + 10 * np.sin(starts // self.period_ns * (0.05 + i % 17 * 0.01) + i)
+        
+        def _frame(self, symbol, starts):
+            close = self.closes(symbol, starts)
+            return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1.0},
+                                index=pd.to_datetime(starts, utc=True))
+        
+        def get_market_data(self, symbol, timeframe, limit):
+            last = self.history_end
+            return self._frame(symbol, np.arange(last - (limit - 1) * self.period_ns, last + 1, self.period_ns))
+        
+        def get_bars_after_multi(self, afters, timeframe):
+            import time
+            with self.lock:
+                self.requests.append(list(afters))
+            now = time.time_ns()
+            return {symbol: self._frame(symbol, np.arange((after.value // self.period_ns + 1) * self.period_ns,
+                                                          now - self.period_ns + 1, self.period_ns))
+                    for symbol, after in afters.items()}
+        
+        def get_positions(self):
+            self.snapshot_reads += 1
+            return [{'symbol': symbol, 'qty': qty} for symbol, qty in self.positions.items()]
+        
+        def get_account_info(self):
+            return {'equity': 1_000_000.0, 'buying_power': 1_000_000.0}
+        
+        def _order(self, symbol, qty, side):
+            with self.lock:
+                self.orders.append((symbol, qty, side))
+                return {'order_id': str(len(self.orders))}
+        
+        def buy_market(self, symbol, qty):
+            return self._order(symbol, qty, 'buy')
+        
+        def sell_market(self, symbol, qty):
+            return self._order(symbol, qty, 'sell')
+    
+    class LaggingPortfolioTrader(FakePortfolioTrader):
+        """HALT一直没有新K线，LATE每根K线第一次请求时还没有数据，预热数据包含形成中的K线"""
+        
+        def __init__(self, symbols, period):
+            super().__init__(symbols, period)
+            self.afters = []
+            self.lagged = set()
+        
+        def get_market_data(self, symbol, timeframe, limit):
+            import time
+            self.forming = time.time_ns() // self.period_ns * self.period_ns
+            return self._frame(symbol, np.arange(self.forming - (limit - 1) * self.period_ns,
+                                                 self.forming + 1, self.period_ns))
+        
+        def get_bars_after_multi(self, afters, timeframe):
+            bars = super().get_bars_after_multi(afters, timeframe)
+            with self.lock:
+                self.afters.append(dict(afters))
+                if 'HALT' in bars:
+                    bars['HALT'] = bars['HALT'].iloc[:0]
+                late = bars.get('LATE')
+                if late is not None and len(late) and late.index[-1] not in self.lagged:
+                    self.lagged.add(late.index[-1])
+                    bars['LATE'] = late.iloc[:0]
+            return bars
+    
+    def test_batch_streaming_macd_matches_streams(self):
+        """测试批量增量MACD与逐个StreamingMACD逐位一致（含缺失K线和不同参数）"""
+        rng = np.random.default_rng(7)
+        prices = 100 + np.cumsum(rng.normal(0, 1, (60, 300)), axis=1)
+        params = [(12, 26, 9), (5, 35, 5), (8, 17, 9)]
+        
+        streams, reference = [], []
+        for i, series in enumerate(prices):
+            for target in (streams, reference):
+                stream = StreamingMACD(*params[i % len(params)])
+                stream.seed(series[:100])
+                target.append(stream)
+        batch = BatchStreamingMACD(streams)
+        
+        for t in range(100, prices.shape[1]):
+            closes = prices[:, t].copy()
+            closes[rng.random(len(closes)) < 0.1] = np.nan
+            expected = [0 if np.isnan(close) else stream.update(close) for stream, close in zip(reference, closes)]
+            np.testing.assert_array_equal(batch.update(closes), expected)
+        
+        np.testing.assert_array_equal(batch.macd, [stream.macd for stream in reference])
+        np.testing.assert_array_equal(batch.signal, [stream.signal for stream in reference])
+        np.testing.assert_array_equal(batch.position, [stream.position for stream in reference])
+        
+        batch.write_back(streams)
+        for stream, expected in zip(streams, reference):
+            self.assertEqual((stream._fast_ema, stream.histogram, stream.bars),
+                             (expected._fast_ema, expected.histogram, expected.bars))
+        
+        with self.assertRaises(ValueError):
+            BatchStreamingMACD([StreamingMACD()])
+        print("✓ 批量增量MACD一致性测试通过")
+    
+    def test_portfolio_bot_runs_500_symbols(self):
+        """测试500个标的共用一个客户端：分片请求、批量信号、一次快照读取、逐标的延迟"""
+        import asyncio
+        symbols = [f"S{i:03d}" for i in range(500)]
+        trader = self.FakePortfolioTrader(symbols, self.period)
+        bot = PortfolioBot(symbols, trader, shard_size=100, max_workers=4,
+                           period=self.period, settle=0.02, retry_delay=0.02, max_retries=2)
+        self.assertEqual(bot.warm_up(limit=100), [])
+        self.assertEqual(len(bot.shards), 5)
+        warm = {symbol: trader.get_market_data(symbol, None, 100)['Close'].to_numpy() for symbol in symbols[:20]}
+        
+        try:
+            asyncio.run(bot.run(max_closes=3))
+        finally:
+            bot.close()
+        
+        stats = bot.stats().set_index('symbol')
+        cycles = bot.cycle_stats()
+        
+        # 每次收盘每个分片一次请求，每次请求不超过shard_size个标的
+        self.assertEqual(len(trader.requests), 5 * len(cycles))
+        self.assertTrue(all(len(request) <= 100 for request in trader.requests))
+        self.assertTrue((stats['fetches'] == len(cycles)).all())
+        self.assertEqual(stats['bars'].min(), stats['bars'].max())
+        self.assertGreaterEqual(stats['bars'].min(), 3)
+        self.assertFalse(stats['latency_max'].isna().any())
+        
+        # 批量计算结果与逐标的增量MACD一致
+        for i, symbol in enumerate(symbols[:20]):
+            last = stats.loc[symbol, 'last_bar_time'].value
+            live = trader.closes(symbol, np.arange(last - (stats.loc[symbol, 'bars'] - 1) * trader.period_ns,
+                                                   last + 1, trader.period_ns))
+            stream = StreamingMACD()
+            stream.seed(warm[symbol])
+            for close in live:
+                stream.update(close)
+            self.assertEqual(bot.batch.macd[i], stream.macd)
+        
+        # 有信号的收盘只读取一次持仓快照；卖出只针对持仓标的，买入只针对空仓标的
+        self.assertGreater(stats['signals'].sum(), 0)
+        self.assertEqual(trader.snapshot_reads, (cycles['signals'] > 0).sum())
+        for symbol, qty, side in trader.orders:
+            self.assertEqual(side == 'sell', symbol in trader.positions)
+        # 买入资金按权益的1/500分配
+        for trade in bot.trade_history:
+            expected = 100.0 if trade['action'] == 'SELL' else int(2000 / trade['signal_price'])
+            self.assertEqual(trade['qty'], expected)
+        self.assertEqual(len(trader.orders), stats['orders'].sum())
+        self.assertEqual(bot.get_trade_summary().get('total_trades', 0), len(trader.orders))
+        
+        print(f"✓ 组合交易测试通过，500个标的平均延迟 {stats['latency_mean'].mean() * 1000:.1f}毫秒，"
+              f"每次收盘 {cycles['latency'].mean() * 1000:.1f}毫秒")
+    
+    def test_portfolio_bot_isolates_lagging_symbols(self):
+        """测试迟到的标的不拖延其他标的，停牌标的单独请求且不重试，预热不使用形成中的K线"""
+        import asyncio
+        symbols = [f"S{i:03d}" for i in range(8)] + ['LATE', 'HALT']
+        trader = self.LaggingPortfolioTrader(symbols, self.period)
+        bot = PortfolioBot(symbols, trader, shard_size=5, max_workers=4, period=self.period,
+                           settle=0.02, retry_delay=0.05, max_retries=10, max_wait=0.2)
+        self.assertEqual(bot.warm_up(limit=100), [])
+        for symbol in symbols:
+            self.assertEqual(bot.state[symbol]['last_bar_time'].value, trader.forming - trader.period_ns)
+        
+        try:
+            asyncio.run(bot.run(max_closes=3))
+            stats = bot.stats().set_index('symbol')
+            cycles = bot.cycle_stats()
+            requests = list(trader.afters)
+            
+            # 同一分片中落后程度不同的标的各自从自己的after请求
+            floor = bot.state['S000']['last_bar_time']
+            afters = {symbol: bot.state[symbol]['last_bar_time'] for symbol in symbols[:5]}
+            afters['S001'] = floor - pd.Timedelta(seconds=3 * self.period)
+            afters['S002'] = floor - pd.Timedelta(seconds=10 * self.period)
+            trader.afters.clear()
+            asyncio.run(bot._fetch(afters, floor, bot.clock()))
+        finally:
+            bot.close()
+        
+        self.assertCountEqual(trader.afters, [
+            {symbol: afters[symbol] for symbol in ('S000', 'S003', 'S004')},
+            {'S001': afters['S001']},
+            {'S002': afters['S002']}
+        ])
+        
+        self.assertTrue((cycles['symbols'] == 9).all())
+        self.assertEqual(stats.loc['HALT', 'bars'], 0)
+        self.assertTrue((stats.drop('HALT')['bars'] == stats.loc['S000', 'bars']).all())
+        
+        # 第一轮取到的标的立即处理，不等待迟到的LATE
+        on_time = stats.drop(['LATE', 'HALT'])['latency_max'].max()
+        self.assertLess(on_time, min(bot.state['LATE']['latency']))
+        
+        # 重试受max_wait限制；HALT落后后单独请求，不再重试
+        self.assertLessEqual(cycles['rounds'].max(), 0.2 / 0.05 + 1)
+        self.assertTrue((cycles['rounds'].iloc[1:] == 2).all())
+        for group in requests:
+            if len(group) > 1:
+                self.assertEqual(len(set(group.values())), 1)
+        self.assertEqual(requests[-1], {'LATE': bot.state['LATE']['last_bar_time'] - pd.Timedelta(seconds=self.period)})
+        
+        print(f"✓ 迟到标的隔离测试通过")
 
 
 class TestIntegration(unittest.TestCase):
@@ -324,8 +2362,19 @@ def run_all_tests():
     
     # 添加测试用例
     test_suite.addTest(unittest.makeSuite(TestDataProvider))
+    test_suite.addTest(unittest.makeSuite(TestBinanceRangeFetch))
     test_suite.addTest(unittest.makeSuite(TestMACDStrategy))
+    test_suite.addTest(unittest.makeSuite(TestBatchIndicators))
     test_suite.addTest(unittest.makeSuite(TestBacktesting))
+    test_suite.addTest(unittest.makeSuite(TestParallelOptimizer))
+    test_suite.addTest(unittest.makeSuite(TestResultCache))
+    test_suite.addTest(unittest.makeSuite(TestRobustness))
+    test_suite.addTest(unittest.makeSuite(TestEventEngine))
+    test_suite.addTest(unittest.makeSuite(TestAsyncAlpacaTrader))
+    test_suite.addTest(unittest.makeSuite(TestAlpacaSnapshotCache))
+    test_suite.addTest(unittest.makeSuite(TestTradeUpdateStream))
+    test_suite.addTest(unittest.makeSuite(TestLiveRunner))
+    test_suite.addTest(unittest.makeSuite(TestPortfolioBot))
     test_suite.addTest(unittest.makeSuite(TestIntegration))
     
     # 运行测试
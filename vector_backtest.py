@@ -0,0 +1,406 @@
+"""
+向量化回测引擎
+Vectorized Backtest Engine
+"""
+
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .strategy import MACDStrategy
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.strategy import MACDStrategy
+
+
+# FractionalBacktest默认的最小交易单位（1聪）
+FRACTIONAL_UNIT = 1 / 100e6
+
+
+def macd_warmup(n_bars: int, fast_period: int, slow_period: int, signal_period: int) -> int:
+    """
+    MACD指标第一个非NaN值的位置，与backtesting.py的指标预热K线数一致
+
+    Args:
+        n_bars: K线数量
+        fast_period: 快速EMA周期
+        slow_period: 慢速EMA周期
+        signal_period: 信号线EMA周期
+
+    Returns:
+        预热K线数，数据不足时为0
+    """
+    lookback = max(fast_period, slow_period) + signal_period - 2
+    return lookback if lookback < n_bars else 0
+
+
+def first_decision_bar(n_bars: int, fast_period: int, slow_period: int, signal_period: int) -> int:
+    """
+    第一根会调用策略next()并允许下单的K线
+
+    backtesting.py从预热结束后的下一根K线开始调用next()，而MACD回测策略
+    在 len(data) < max(周期) + 10 时直接返回。
+    """
+    start = 1 + macd_warmup(n_bars, fast_period, slow_period, signal_period)
+    return max(start, max(fast_period, slow_period, signal_period) + 9)
+
+
+def simulate_long_only(open_prices: np.ndarray,
+                       close_prices: np.ndarray,
+                       signals: np.ndarray,
+                       position_size: float = 0.8,
+                       cash: float = 100000,
+                       commission: float = 0.002,
+                       first_bar: int = 1,
+                       fractional_unit: float = FRACTIONAL_UNIT) -> dict:
+    """
+    将信号数组模拟为只做多的交易，与MACD回测策略 + FractionalBacktest的成交规则一致
+
+    第i根K线出现买入信号且空仓时，在第i+1根K线开盘价按当前资金的position_size
+    比例买入（按fractional_unit取整，position_size >= 1 时为固定单位数量）；
+    持仓时出现卖出信号则在下一根开盘价平仓。
+    开仓和平仓各收取一次commission比例的手续费，最后一根K线上的订单不会成交，
+    未平仓的交易计入权益但不计入交易列表。
+
+    Args:
+        open_prices: 开盘价数组
+        close_prices: 收盘价数组
+        signals: 信号数组（1买入，-1卖出，0无信号）
+        position_size: 每次开仓使用的资金比例（0-1之间）
+        cash: 初始资金
+        commission: 手续费率
+        first_bar: 第一根允许下单的K线
+        fractional_unit: 最小交易单位
+
+    Returns:
+        包含权益曲线和交易列表数组的字典
+    """
+    open_units = np.asarray(open_prices, dtype=np.float64) * fractional_unit
+    close_units = np.asarray(close_prices, dtype=np.float64) * fractional_unit
+    signals = np.asarray(signals)
+    n = len(close_units)
+
+    # 与策略next()一致：只在信号变化时下单
+    prev = np.empty_like(signals)
+    prev[:1] = 0
+    prev[1:] = signals[:-1]
+    events = np.zeros(n, dtype=np.int8)
+    tradable = slice(first_bar, n)
+    events[tradable] = np.where((signals[tradable] == 1) & (prev[tradable] != 1), 1,
+                                np.where((signals[tradable] == -1) & (prev[tradable] != -1), -1, 0))
+
+    # 持仓状态沿最近一次事件延续，状态翻转处即为开仓/平仓的决策K线
+    event_idx = np.flatnonzero(events)
+    event_dir = events[event_idx]
+    if len(event_dir):
+        changed = np.r_[event_dir[0] == 1, event_dir[1:] != event_dir[:-1]]
+        event_idx, event_dir = event_idx[changed], event_dir[changed]
+
+    entry_decisions = event_idx[event_dir == 1]
+    exit_decisions = event_idx[event_dir == -1]
+    # 订单在下一根K线开盘成交
+    entry_bars = entry_decisions[entry_decisions < n - 1] + 1
+    exit_bars = exit_decisions + 1
+
+    # 逐笔确定仓位大小（复利依赖上一笔交易结束后的资金，交易笔数远小于K线数）
+    ps = abs(position_size)
+    balance = cash
+    balance_bars, balances = [0], [cash]
+    held = np.zeros(n)
+    entry_price_by_bar = np.zeros(n)
+    trades = {name: [] for name in ('size', 'entry_bar', 'exit_bar', 'entry_price', 'exit_price',
+                                    'pnl', 'commission', 'return_pct')}
+
+    for k, entry_bar in enumerate(entry_bars):
+        entry_price = open_units[entry_bar]
+        price_plus_commission = entry_price + (ps * entry_price * commission) / ps
+        if ps < 1:
+            units = int((balance * ps) // price_plus_commission)
+        else:
+            # 与backtesting.py一致：size >= 1 表示固定的最小单位数量
+            units = int(ps)
+        if not units or units * price_plus_commission > balance:
+            continue
+
+        open_commission = units * entry_price * commission
+        balance -= open_commission
+        balance_bars.append(entry_bar)
+        balances.append(balance)
+
+        exit_bar = exit_bars[k] if k < len(exit_bars) else n
+        held[entry_bar:exit_bar] = units
+        entry_price_by_bar[entry_bar:exit_bar] = entry_price
+        if exit_bar >= n:
+            break
+
+        exit_price = open_units[exit_bar]
+        exit_commission = units * exit_price * commission
+        gross = units * (exit_price - entry_price)
+        balance += gross - exit_commission
+        balance_bars.append(exit_bar)
+        balances.append(balance)
+
+        commissions = exit_commission + open_commission
+        trades['size'].append(units)
+        trades['entry_bar'].append(entry_bar)
+        trades['exit_bar'].append(exit_bar)
+        trades['entry_price'].append(entry_price)
+        trades['exit_price'].append(exit_price)
+        trades['pnl'].append(gross - commissions)
+        trades['commission'].append(commissions)
+        trades['return_pct'].append((exit_price / entry_price - 1) - commissions / (units * entry_price))
+
+    # 每根K线的现金为该K线及之前最后一次成交后的余额
+    cash_by_bar = np.array(balances)[np.searchsorted(balance_bars, np.arange(n), side='right') - 1]
+    equity = cash_by_bar + held * (close_units - entry_price_by_bar)
+
+    trades = {name: np.array(values, dtype=np.int64 if name in ('size', 'entry_bar', 'exit_bar') else np.float64)
+              for name, values in trades.items()}
+    trades['size'] = trades['size'] * fractional_unit
+    trades['entry_price'] = trades['entry_price'] / fractional_unit
+    trades['exit_price'] = trades['exit_price'] / fractional_unit
+
+    return {'equity': equity, 'trades': trades}
+
+
+def _geometric_mean(returns: np.ndarray) -> float:
+    """几何平均收益率"""
+    returns = np.nan_to_num(returns) + 1
+    if np.any(returns <= 0):
+        return 0
+    return np.exp(np.log(returns).sum() / (len(returns) or np.nan)) - 1
+
+
+def _period_returns(index: pd.DatetimeIndex, equity: np.ndarray):
+    """按数据频率将权益重采样为日/周/月/年收益率，返回(收益率, 年化周期数)"""
+    period = pd.Series(index[-100:]).diff().dropna().median()
+    freq_days = period.days
+    weekend_share = np.isin(index.dayofweek, (5, 6)).mean()
+    annual_periods = (52 if freq_days == 7 else
+                      12 if freq_days == 31 else
+                      1 if freq_days == 365 else
+                      (365 if weekend_share > 2 / 7 * .6 else 252))
+
+    days = index.values.astype('datetime64[D]').astype(np.int64)
+    if freq_days == 7:
+        keys = (days + 3) // 7  # 周一到周日为一周
+    elif freq_days == 31:
+        keys = index.values.astype('datetime64[M]').astype(np.int64)
+    elif freq_days == 365:
+        keys = index.values.astype('datetime64[Y]').astype(np.int64)
+    else:
+        keys = days
+
+    # 每个周期取最后一根K线的权益
+    last = np.flatnonzero(np.r_[keys[1:] != keys[:-1], True])
+    period_equity = equity[last]
+    return period_equity[1:] / period_equity[:-1] - 1, annual_periods
+
+
+def _ceil_timedelta(value, period):
+    """按数据周期的精度向上取整时间间隔"""
+    if not isinstance(value, pd.Timedelta):
+        return value
+    resolution = getattr(period, 'resolution_string', None) or period.resolution
+    return value.ceil(resolution)
+
+
+def compute_stats(index: pd.Index,
+                  close_prices: np.ndarray,
+                  equity: np.ndarray,
+                  trades: dict,
+                  warmup: int = 0) -> dict:
+    """
+    计算与BacktestRunner.run_backtest结果字典同名的统计指标
+
+    Args:
+        index: K线时间索引
+        close_prices: 收盘价数组
+        equity: 权益曲线
+        trades: simulate_long_only返回的交易数组字典
+        warmup: 指标预热K线数（买入持有收益率从这里起算）
+
+    Returns:
+        统计结果字典
+    """
+    close_prices = np.asarray(close_prices, dtype=np.float64)
+    is_datetime = isinstance(index, pd.DatetimeIndex)
+    period = pd.Series(index[-100:]).diff().dropna().median()
+
+    # 回撤及其持续时间
+    dd = 1 - equity / np.maximum.accumulate(equity)
+    flat = np.unique(np.r_[np.flatnonzero(dd == 0), len(dd) - 1])
+    gaps = np.flatnonzero(flat[1:] > flat[:-1] + 1)
+    starts, ends = flat[gaps], flat[gaps + 1]
+    if len(starts):
+        bounds = np.column_stack([starts, ends]).ravel()
+        dd_peaks = np.maximum(np.maximum.reduceat(dd, bounds)[::2], dd[ends])
+        dd_durations = index[ends] - index[starts]
+        max_dd_duration = _ceil_timedelta(dd_durations.max(), period)
+        avg_dd_duration = _ceil_timedelta(dd_durations.mean(), period)
+        avg_dd = -dd_peaks.mean() * 100
+    else:
+        max_dd_duration = avg_dd_duration = avg_dd = np.nan
+
+    entry_bars, exit_bars = trades['entry_bar'], trades['exit_bar']
+    pnl, returns = trades['pnl'], trades['return_pct']
+    n_trades = len(pnl)
+
+    exposure = np.zeros(len(index) + 1, dtype=np.int64)
+    np.add.at(exposure, entry_bars, 1)
+    np.add.at(exposure, exit_bars + 1, -1)
+    have_position = np.cumsum(exposure[:-1]) > 0
+
+    if is_datetime and len(index) > 1:
+        period_returns, annual_periods = _period_returns(index, equity)
+    else:
+        period_returns, annual_periods = np.array([]), np.nan
+    gmean_return = _geometric_mean(period_returns) if is_datetime else 0
+    annualized_return = (1 + gmean_return) ** annual_periods - 1
+    ddof = 1
+    variance = period_returns.var(ddof=ddof) if len(period_returns) > ddof else np.nan
+    volatility = np.sqrt((variance + (1 + gmean_return) ** 2) ** annual_periods
+                         - (1 + gmean_return) ** (2 * annual_periods)) * 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        downside = np.sqrt(np.mean(np.clip(period_returns, -np.inf, 0) ** 2)) if len(period_returns) else np.nan
+        sortino = annualized_return / (downside * np.sqrt(annual_periods))
+    max_dd = -np.nan_to_num(dd.max())
+
+    if n_trades:
+        durations = index[exit_bars] - index[entry_bars]
+        max_trade_duration = _ceil_timedelta(durations.max(), period)
+        avg_trade_duration = _ceil_timedelta(durations.mean(), period)
+        pnl_std = pnl.std(ddof=1) if n_trades > 1 else np.nan
+        losses = abs(returns[returns < 0].sum())
+    else:
+        max_trade_duration = avg_trade_duration = pnl_std = losses = np.nan
+
+    return {
+        'Start': index[0],
+        'End': index[-1],
+        'Duration': index[-1] - index[0],
+        'Exposure Time [%]': have_position.mean() * 100,
+        'Equity Final [$]': equity[-1],
+        'Equity Peak [$]': equity.max(),
+        'Return [%]': (equity[-1] - equity[0]) / equity[0] * 100,
+        'Buy & Hold Return [%]': (close_prices[-1] - close_prices[warmup]) / close_prices[warmup] * 100,
+        'Return (Ann.) [%]': annualized_return * 100,
+        'Volatility (Ann.) [%]': volatility,
+        'Sharpe Ratio': annualized_return * 100 / (volatility or np.nan),
+        'Sortino Ratio': sortino,
+        'Calmar Ratio': annualized_return / (-max_dd or np.nan),
+        'Max. Drawdown [%]': max_dd * 100,
+        'Avg. Drawdown [%]': avg_dd,
+        'Max. Drawdown Duration': max_dd_duration,
+        'Avg. Drawdown Duration': avg_dd_duration,
+        '# Trades': n_trades,
+        'Win Rate [%]': (pnl > 0).mean() * 100 if n_trades else np.nan,
+        'Best Trade [%]': returns.max() * 100 if n_trades else np.nan,
+        'Worst Trade [%]': returns.min() * 100 if n_trades else np.nan,
+        'Avg. Trade [%]': _geometric_mean(returns) * 100 if n_trades else np.nan,
+        'Max. Trade Duration': max_trade_duration,
+        'Avg. Trade Duration': avg_trade_duration,
+        'Profit Factor': returns[returns > 0].sum() / (losses or np.nan) if n_trades else np.nan,
+        'Expectancy [%]': returns.mean() * 100 if n_trades else np.nan,
+        'SQN': np.sqrt(n_trades) * pnl.mean() / (pnl_std or np.nan) if n_trades else np.nan,
+    }
+
+
+def downsample_equity(equity: pd.Series, points: int) -> pd.Series:
+    """
+    把权益曲线压缩到约points个点
+
+    序列被均分为points//2段，每段保留最低点和最高点（按时间顺序），
+    首尾两点总是保留，因此压缩后的曲线仍保持原有的峰值、谷值和最大回撤形状。
+
+    Args:
+        equity: 以时间为索引的权益序列
+        points: 目标点数
+
+    Returns:
+        压缩后的权益序列，长度不超过max(points, 2)
+    """
+    n = len(equity)
+    if points is None or n <= points:
+        return equity.copy()
+
+    values = equity.to_numpy(dtype=np.float64)
+    buckets = max(1, (points - 2) // 2)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+
+    keep = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            segment = values[start:end]
+            keep.append(start + int(np.nanargmin(segment)) if not np.isnan(segment).all() else start)
+            keep.append(start + int(np.nanargmax(segment)) if not np.isnan(segment).all() else start)
+
+    return equity.iloc[np.unique(keep)]
+
+
+def vectorized_backtest(data: pd.DataFrame,
+                        fast_period: int = 12,
+                        slow_period: int = 26,
+                        signal_period: int = 9,
+                        position_size: float = 0.8,
+                        cash: float = 100000,
+                        commission: float = 0.002,
+                        signals: Optional[np.ndarray] = None) -> dict:
+    """
+    用纯NumPy运行MACD只做多回测
+
+    Args:
+        data: OHLCV数据
+        fast_period: 快速EMA周期
+        slow_period: 慢速EMA周期
+        signal_period: 信号线EMA周期
+        position_size: 仓位大小（0-1之间的分数）
+        cash: 初始资金
+        commission: 手续费率
+        signals: 预先计算好的信号数组，为None时由MACDStrategy生成
+
+    Returns:
+        包含统计结果、权益曲线和交易列表的字典
+    """
+    if signals is None:
+        strategy = MACDStrategy(fast_period, slow_period, signal_period)
+        signals = strategy.generate_signals(data[['Close']])['Signal'].values
+
+    n = len(data)
+    warmup = macd_warmup(n, fast_period, slow_period, signal_period)
+    simulation = simulate_long_only(
+        data['Open'].values, data['Close'].values, signals,
+        position_size=position_size, cash=cash, commission=commission,
+        first_bar=first_decision_bar(n, fast_period, slow_period, signal_period)
+    )
+
+    trades = simulation['trades']
+    results = compute_stats(data.index, data['Close'].values, simulation['equity'], trades, warmup)
+
+    trades_df = pd.DataFrame({
+        'Size': trades['size'],
+        'EntryBar': trades['entry_bar'],
+        'ExitBar': trades['exit_bar'],
+        'EntryPrice': trades['entry_price'],
+        'ExitPrice': trades['exit_price'],
+        'PnL': trades['pnl'],
+        'Commission': trades['commission'],
+        'ReturnPct': trades['return_pct'],
+        'EntryTime': data.index[trades['entry_bar']],
+        'ExitTime': data.index[trades['exit_bar']],
+    })
+
+    return {
+        'results': results,
+        'equity_curve': pd.Series(simulation['equity'], index=data.index, name='Equity'),
+        'trades': trades_df
+    }
@@ -0,0 +1,281 @@
+"""
+滚动窗口(Walk-Forward)优化模块
+Walk-Forward Optimization Module
+"""
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+try:
+    # 尝试相对导入（当作为包导入时）
+    from .indicators import parameter_grid, batch_macd, batch_crossover
+    from .vector_backtest import simulate_long_only, compute_stats, first_decision_bar
+    from .optimizer import SharedBars, _worker_state, _score
+except ImportError:
+    # 如果相对导入失败，使用绝对导入（当直接运行时）
+    from simple_trading_system.indicators import parameter_grid, batch_macd, batch_crossover
+    from simple_trading_system.vector_backtest import simulate_long_only, compute_stats, first_decision_bar
+    from simple_trading_system.optimizer import SharedBars, _worker_state, _score
+
+
+def walk_forward_folds(n_bars: int,
+                       train_bars: int,
+                       test_bars: int,
+                       step: Optional[int] = None,
+                       anchored: bool = False) -> List[tuple]:
+    """
+    生成滚动的训练/测试窗口
+
+    Args:
+        n_bars: K线数量
+        train_bars: 训练窗口K线数
+        test_bars: 测试窗口K线数
+        step: 相邻两折的间隔，默认为test_bars（测试窗口首尾相接）
+        anchored: 为True时训练窗口始终从第一根K线开始（扩张窗口）
+
+    Returns:
+        (train_start, train_end, test_start, test_end) 列表，区间左闭右开
+    """
+    if train_bars < 2 or test_bars < 2:
+        raise ValueError("训练窗口和测试窗口至少需要2根K线")
+    step = step or test_bars
+
+    folds = []
+    start = 0
+    while start + train_bars + test_bars <= n_bars:
+        train_start = 0 if anchored else start
+        test_start = start + train_bars
+        folds.append((train_start, test_start, test_start, test_start + test_bars))
+        start += step
+    return folds
+
+
+def _init_fold_worker(spec: dict, params: np.ndarray, position_sizes: tuple,
+                      cash: float, commission: float, maximize: str):
+    """工作进程初始化：映射共享内存中的K线和信号矩阵"""
+    arrays, blocks = SharedBars.attach(spec)
+    _worker_state.update(
+        blocks=blocks,
+        index=pd.DatetimeIndex(arrays['ts'].view('datetime64[ns]')),
+        open=arrays['open'],
+        close=arrays['close'],
+        signals=arrays['signals'],
+        params=params,
+        position_sizes=position_sizes,
+        cash=cash,
+        commission=commission,
+        maximize=maximize,
+    )
+
+
+def _optimize_fold(fold: int, start: int, end: int) -> dict:
+    """在工作进程中对一个训练窗口评估全部参数组合，返回最优组合"""
+    state = _worker_state
+    index = state['index'][start:end]
+    open_prices = state['open'][start:end]
+    close_prices = state['close'][start:end]
+    maximize = state['maximize']
+
+    best = None
+    best_score = -np.inf
+    for row, (fast, slow, signal_period) in enumerate(state['params']):
+        signals = state['signals'][row, start:end]
+        # 与网格优化相同的预热：窗口内前first_bar根K线不下单
+        first_bar = first_decision_bar(end - start, int(fast), int(slow), int(signal_period))
+        for position_size in state['position_sizes']:
+            simulation = simulate_long_only(open_prices, close_prices, signals,
+                                            position_size=position_size, cash=state['cash'],
+                                            commission=state['commission'], first_bar=first_bar)
+            stats = compute_stats(index, close_prices, simulation['equity'], simulation['trades'])
+            score = _score(stats, maximize)
+            if best is None or score > best_score:
+                best, best_score = (row, position_size, stats), score
+
+    row, position_size, stats = best
+    return {'fold': fold, 'row': row, 'position_size': position_size, 'train': stats}
+
+
+class WalkForwardOptimizer:
+    """
+    MACD参数的滚动窗口优化
+
+    在每个训练窗口上选出最优参数，再在紧随其后的测试窗口上使用这组参数，
+    把各测试窗口拼接成一条样本外权益曲线。
+
+    整个参数网格的MACD信号只在完整历史上计算一次，各窗口直接切片使用，
+    重叠窗口之间不重复计算指标；指标因此带有窗口之前的历史（与实盘一致），
+    与单独对窗口数据回测时重新计算的指标略有不同。训练和测试窗口都与网格优化
+    一样，在窗口内的预热K线之后才开始下单。训练窗口在进程池中并行优化。
+    """
+
+    def __init__(self,
+                 data: pd.DataFrame,
+                 cash: float = 100000,
+                 commission: float = 0.002,
+                 max_workers: Optional[int] = None,
+                 mp_context=None):
+        """
+        初始化优化器
+
+        Args:
+            data: OHLCV数据
+            cash: 初始资金
+            commission: 手续费率
+            max_workers: 工作进程数，None为CPU核数
+            mp_context: multiprocessing上下文
+        """
+        self.data = data
+        self.cash = cash
+        self.commission = commission
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+
+    def run(self,
+            train_bars: int,
+            test_bars: int,
+            fast_periods: Iterable[int],
+            slow_periods: Iterable[int],
+            signal_periods: Iterable[int],
+            position_sizes: Iterable[float] = (0.8,),
+            step: Optional[int] = None,
+            anchored: bool = False,
+            maximize: str = 'Return [%]',
+            progress_callback: Optional[Callable[[int, int], None]] = None) -> dict:
+        """
+        运行滚动窗口优化
+
+        每个测试窗口开始和结束时都空仓（倒数第二根K线强制发出平仓信号），
+        资金在各折之间连续复利。样本外权益曲线由各测试窗口的权益按各自的
+        时间索引拼接而成，step大于test_bars时不包含两折之间的K线。
+
+        Args:
+            train_bars: 训练窗口K线数
+            test_bars: 测试窗口K线数
+            fast_periods: 快速EMA周期集合
+            slow_periods: 慢速EMA周期集合
+            signal_periods: 信号线EMA周期集合
+            position_sizes: 仓位大小集合
+            step: 相邻两折的间隔，默认为test_bars
+            anchored: 训练窗口是否始终从第一根K线开始
+            maximize: 优化目标指标
+            progress_callback: 进度回调，参数为(已完成折数, 总折数)
+
+        Returns:
+            包含样本外统计(results)、样本外权益曲线(equity_curve)和每折结果(folds)的字典
+        """
+        started = time.perf_counter()
+        n = len(self.data)
+        position_sizes = tuple(float(size) for size in position_sizes)
+        if step is not None and step < test_bars:
+            raise ValueError("step不能小于test_bars，否则测试窗口会重叠")
+        folds = walk_forward_folds(n, train_bars, test_bars, step, anchored)
+        if not folds:
+            raise ValueError(f"数据不足: {n} 根K线无法切分出 {train_bars}+{test_bars} 的窗口")
+
+        params = parameter_grid(fast_periods, slow_periods, signal_periods)
+        if not len(params) or not position_sizes:
+            raise ValueError("没有可评估的参数组合")
+
+        # 整个网格的信号在完整历史上只计算一次
+        close_prices = self.data['Close'].to_numpy(dtype=np.float64)
+        macd, signal, _ = batch_macd(close_prices, params)
+        signals, _ = batch_crossover(macd, signal)
+        del macd, signal
+
+        print(f"滚动窗口优化: {len(folds)} 折 × {len(params) * len(position_sizes)} 组参数")
+
+        chosen = {}
+        with SharedBars(self.data, extra={'signals': signals}) as bars:
+            with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self.mp_context,
+                initializer=_init_fold_worker,
+                initargs=(bars.spec, params, position_sizes, self.cash, self.commission, maximize)
+            ) as executor:
+                pending = {
+                    executor.submit(_optimize_fold, k, train_start, train_end)
+                    for k, (train_start, train_end, _, _) in enumerate(folds)
+                }
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        result = future.result()
+                        chosen[result['fold']] = result
+                        if progress_callback:
+                            progress_callback(len(chosen), len(folds))
+
+        # 逐折模拟，上一折的期末资金作为下一折的初始资金
+        index = self.data.index
+        open_prices = self.data['Open'].to_numpy(dtype=np.float64)
+        equity = []
+        positions = []
+        trades = []
+        fold_rows = []
+        balance = self.cash
+        for k, (train_start, train_end, test_start, test_end) in enumerate(folds):
+            best_row = params[chosen[k]['row']]
+            fold_signals = signals[chosen[k]['row'], test_start:test_end].copy()
+            # 倒数第二根K线发出平仓信号，在最后一根K线开盘成交，每折结束时空仓
+            fold_signals[-2] = -1
+            first_bar = first_decision_bar(test_end - test_start, *(int(period) for period in best_row))
+            simulation = simulate_long_only(open_prices[test_start:test_end], close_prices[test_start:test_end],
+                                            fold_signals, position_size=chosen[k]['position_size'],
+                                            cash=balance, commission=self.commission, first_bar=first_bar)
+            fold_equity = simulation['equity']
+            balance = fold_equity[-1]
+
+            test_stats = compute_stats(index[test_start:test_end], close_prices[test_start:test_end],
+                                       fold_equity, simulation['trades'])
+            trades.append(_shift_trades(simulation['trades'], sum(len(segment) for segment in equity)))
+            equity.append(fold_equity)
+            positions.append(np.arange(test_start, test_end))
+
+            fold_rows.append({
+                'fold': k,
+                'train_start': index[train_start],
+                'train_end': index[train_end - 1],
+                'test_start': index[test_start],
+                'test_end': index[test_end - 1],
+                'fast_period': int(best_row[0]),
+                'slow_period': int(best_row[1]),
+                'signal_period': int(best_row[2]),
+                'position_size': chosen[k]['position_size'],
+                f'Train {maximize}': chosen[k]['train'][maximize],
+                **test_stats
+            })
+
+        trades = {name: np.concatenate([fold[name] for fold in trades]) for name in trades[0]}
+        # 各折的测试窗口按各自的K线位置拼接，折与折之间的K线不计入样本外
+        positions = np.concatenate(positions)
+        equity = np.concatenate(equity)
+        oos_index = index[positions]
+        results = compute_stats(oos_index, close_prices[positions], equity, trades)
+
+        elapsed = time.perf_counter() - started
+        print(f"滚动窗口优化完成: 样本外收益率 {results['Return [%]']:.2f}%, 耗时 {elapsed:.2f}秒")
+
+        return {
+            'results': results,
+            'equity_curve': pd.Series(equity, index=oos_index, name='Equity'),
+            'folds': pd.DataFrame(fold_rows),
+            'optimization_target': maximize,
+            'seconds': elapsed
+        }
+
+
+def _shift_trades(trades: dict, offset: int) -> dict:
+    """把交易的K线位置平移offset"""
+    shifted = dict(trades)
+    shifted['entry_bar'] = trades['entry_bar'] + offset
+    shifted['exit_bar'] = trades['exit_bar'] + offset
+    return shifted